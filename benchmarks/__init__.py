@@ -0,0 +1,11 @@
+# -*- coding: utf-8 -*-
+"""
+!    benchmarks  (tumblrpype)
+!  --------------------------------------------------------------------------
+!
+!    Performance benchmarks for tumblrpype, run against a local mock of
+!    www.tumblr.com (see mockserver.py).  Run them with:
+!
+!        python -m benchmarks.run
+!
+"""
@@ -0,0 +1,409 @@
+# -*- coding: utf-8 -*-
+"""
+!    mockserver.py  (tumblrpype benchmarks)
+!  --------------------------------------------------------------------------
+!
+!    A local stand-in for the parts of www.tumblr.com that tumblrpype talks
+!    to, serving the pages in fixtures/:
+!
+!        GET  /                          logged in / logged out home page
+!        GET  /login, POST /login        login form, and logging in
+!        GET  /dashboard                 (redirects to /login when logged out)
+!        GET  /customize/<blog>          customize page, with the theme JSON
+!        POST /customize_api/blog/<blog> saves the theme, echoes it as JSON
+!        GET  /edit/<id>, POST /edit/<id> photo post edit page, and saving it
+!        GET  /blog/<blog>[/<page>]      the blog's post listing, 10 per page
+!
+!    Every response can be delayed by a fixed `latency` (seconds), to model
+!    the round-trip time to the real site.  With `compress`, responses are
+!    gzipped (or, with compress='deflate', deflated) for clients that accept
+!    it, and gzipped request bodies are taken (otherwise they get a 415).  With `ratelimit`, requests beyond
+!    that many per second get a 429.  Pages carry an ETag, and a GET whose
+!    If-None-Match has it gets a 304 Not Modified.
+!
+!    Except where otherwise noted, the code in tumblrpype is
+!        Copyright (c) 2012  Felix Bonkoski <felix@post-theory.com>
+!        Licensed under the MIT license:
+!            <http://www.opensource.org/licenses/mit-license.php>
+!
+"""
+
+import BaseHTTPServer
+import Cookie
+import SocketServer
+import cgi
+import collections
+import hashlib
+import jsonlib
+import os
+import re
+import socket
+import threading
+import time
+import urllib
+import urlparse
+import zlib
+
+__all__ = ['MockTumblr']
+
+#-------------------------------------------------------------------------------
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+SESSION_COOKIE = 'pfe'
+
+_FILLER = ('<div class="post photo">\n'
+           '    <a href="/post/%d"><img src="http://media.tumblr.com/tumblr_%d_500.jpg" alt=""></a>\n'
+           '    <div class="caption"><p>Lorem ipsum dolor sit amet, consectetur adipiscing elit.</p></div>\n'
+           '</div>\n')
+
+
+def _padding(size):
+    parts = []
+    total = 0
+    i = 0
+    while total < size:
+        part = _FILLER % (i, i)
+        parts.append(part)
+        total += len(part)
+        i += 1
+    return ''.join(parts)
+
+
+def _default_theme(blogname):
+    return {'name' : blogname,
+            'title' : 'Benchmark blog %s' % blogname,
+            'description' : '',
+            'avatar_url' : 'http://assets.tumblr.com/images/default_avatar_128.png',
+            'custom_theme' : u'<html><head><title>{Title}</title></head>'
+                             u'<body>{block:Posts}<div class="post">{Body}</div>{/block:Posts}</body></html>',
+            'params' : {'color:Background' : '#ffffff', 'font:Body' : 'Helvetica',
+                        'if:Show avatar' : 1, 'text:Subtitle' : ''},
+            'private' : False}
+
+
+POSTS_PER_PAGE = 10
+
+# post[state] in the edit form -> the post's state, and its class in the listing
+_EDIT_STATE_RE = re.compile(r'name="post\[state\]"\r\n\r\n([^\r]*)\r\n')
+_EDIT_STATES = {'0' : 'published', '1' : 'draft', '2' : 'queued', 'private' : 'private'}
+_POST_CLASSES = {'private' : ' is_private', 'draft' : ' is_draft', 'queued' : ' is_queued'}
+_POST_TYPES = ('photo', 'text', 'photo', 'quote', 'link')
+
+_POST = ('        <li class="post_container">\n'
+         '            <div class="post %s is_mine%s" id="post_%d" data-post-id="%d">\n'
+         '                <div class="post_content"><p>Post %d</p></div>\n'
+         '            </div>\n'
+         '        </li>')
+
+
+def _gzip(data):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    return compressor.compress(data) + compressor.flush()
+
+
+class _Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+
+    # buffer each response, so that headers and body go out together
+    wbufsize = -1
+
+    def setup(self):
+        BaseHTTPServer.BaseHTTPRequestHandler.setup(self)
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def log_message(self, format, *args):
+        pass
+
+    #---------------------------------------------------------------------------
+
+    def _session(self):
+        cookies = Cookie.SimpleCookie(self.headers.get('Cookie', ''))
+        morsel = cookies.get(SESSION_COOKIE)
+        if morsel and morsel.value in self.server.mock.sessions:
+            return morsel.value
+        return None
+
+    def _read_body(self):
+        # None for a compressed body, unless the mock takes those
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else ''
+
+        if self.headers.get('Content-Encoding', '').lower() == 'gzip':
+            if not self.server.mock.compress:
+                return None
+            body = zlib.decompress(body, 16 + zlib.MAX_WBITS)
+        return body
+
+    def _send(self, code, body = '', contentType = 'text/html; charset=utf-8', headers = ()):
+        mock = self.server.mock
+
+        if isinstance(body, unicode):
+            body = body.encode('utf-8')
+
+        headers = list(headers)
+        if code == 200 and self.command == 'GET':
+            etag = '"%s"' % hashlib.sha1(body).hexdigest()[:16]
+            headers.append(('ETag', etag))
+            if self.headers.get('If-None-Match') == etag:
+                code, body = 304, ''
+
+        mock.count(self.command, self.path, code)
+
+        if mock.latency:
+            time.sleep(mock.latency)
+
+        encoding = 'deflate' if mock.compress == 'deflate' else 'gzip'
+        if mock.compress and body and encoding in self.headers.get('Accept-Encoding', ''):
+            body = zlib.compress(body) if encoding == 'deflate' else _gzip(body)
+            headers.append(('Content-Encoding', encoding))
+
+        self.send_response(code)
+        self.send_header('Content-Type', contentType)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+
+        if self.command != 'HEAD':
+            self.wfile.write(body)
+
+    def _redirect(self, location):
+        self._send(302, '', headers = [('Location', location)])
+
+    #---------------------------------------------------------------------------
+
+    def do_HEAD(self):
+        self.do_GET()
+
+    def do_GET(self):
+        mock = self.server.mock
+        if not mock.admit():
+            return self._send(429, 'Too Many Requests')
+
+        path = urlparse.urlparse(self.path).path
+        session = self._session()
+
+        if path == '/':
+            return self._send(200, mock.page('index_logged_in' if session else 'index_logged_out'))
+
+        if path == '/login':
+            return self._send(200, mock.page('login'))
+
+        if not session:
+            return self._redirect('/login?redirect_to=%s' % urllib.quote(path))
+
+        if path == '/dashboard':
+            return self._send(200, mock.page('dashboard'))
+
+        m = re.match(r'^/customize/([^/]+)$', path)
+        if m:
+            blogname = m.group(1)
+            theme = mock.theme(blogname)
+            return self._send(200, mock.page('customize', blogname = blogname,
+                                             form_key = mock.formKeys[session],
+                                             theme_json = jsonlib.dumps(theme)))
+
+        m = re.match(r'^/blog/([^/]+)(?:/(\d+))?$', path)
+        if m:
+            return self._send(200, mock.post_listing(m.group(1), int(m.group(2) or 1)))
+
+        m = re.match(r'^/edit/(\d+)$', path)
+        if m:
+            postID = m.group(1)
+            return self._send(200, mock.edit_page(postID, session))
+
+        self._send(404, 'Not Found')
+
+    def do_POST(self):
+        mock = self.server.mock
+        path = urlparse.urlparse(self.path).path
+        body = self._read_body()
+        if body is None:
+            return self._send(415, 'Unsupported Media Type')
+        if not mock.admit():
+            return self._send(429, 'Too Many Requests')
+        session = self._session()
+
+        if path == '/login':
+            form = urlparse.parse_qs(body)
+            email = form.get('user[email]', [''])[0]
+            password = form.get('user[password]', [''])[0]
+
+            if mock.accounts.get(email) != password:
+                return self._send(200, mock.page('login_failed'))
+
+            session = mock.new_session()
+            return self._send(200, mock.page('login_ok'),
+                              headers = [('Set-Cookie', '%s=%s; Path=/' % (SESSION_COOKIE, session))])
+
+        if not session:
+            return self._redirect('/login')
+
+        m = re.match(r'^/customize_api/blog/([^/]+)$', path)
+        if m:
+            blogname = m.group(1)
+            themeInfo = jsonlib.loads(body)
+            if themeInfo.get('user_form_key') != mock.formKeys[session]:
+                return self._send(403, '{"error":"Invalid form key"}', 'application/json')
+
+            theme = mock.theme(blogname)
+            for key in theme:
+                if key in themeInfo:
+                    theme[key] = themeInfo[key]
+
+            return self._send(200, jsonlib.dumps(theme), 'application/json')
+
+        m = re.match(r'^/edit/(\d+)$', path)
+        if m:
+            ctype, params = cgi.parse_header(self.headers.get('Content-Type', ''))
+            if ctype != 'multipart/form-data' or mock.formKeys[session] not in body:
+                return self._send(200, mock.edit_page(m.group(1), session))
+
+            state = _EDIT_STATE_RE.search(body)
+            with mock._lock:
+                mock.postStates[m.group(1)] = _EDIT_STATES.get(state.group(1) if state else '')
+            return self._send(200, mock.page('dashboard'))
+
+        self._send(404, 'Not Found')
+
+#//end class _Handler
+
+
+class _Server(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class MockTumblr(object):
+    """
+    Usage::
+
+        with MockTumblr(latency = 0.05) as mock:
+            login = TumblrLogin('bench@example.com', 'secret', 'bench',
+                                baseurl = mock.url)
+
+    :param accounts: dict of login email -> password that may log in.
+    :param latency: seconds every response is delayed by.
+    :param pagesize: approximate size (bytes) of the generated HTML pages.
+    :param compress: gzip responses - or deflate them, if 'deflate' - (and
+        take gzipped request bodies).
+    :param ratelimit: requests per second served before answering 429.
+    :param postcount: number of posts in every blog's post listing.
+    """
+
+    def __init__(self, accounts = None, latency = 0.0, pagesize = 64 * 1024, port = 0,
+                 compress = False, ratelimit = None, postcount = 100):
+        self.accounts = accounts or {'bench@example.com' : 'secret'}
+        self.latency = latency
+        self.compress = compress
+        self.ratelimit = ratelimit
+        self.postcount = postcount
+        self._tokens = 0.0
+        self._refilled = time.time()
+        self.padding = _padding(pagesize)
+
+        self.sessions = set()
+        self.formKeys = {}
+        self.themes = {}
+        self.postStates = {}
+        self.requests = collections.Counter()
+
+        self._fixtures = {}
+        self._lock = threading.Lock()
+
+        self.server = _Server(('127.0.0.1', port), _Handler)
+        self.server.mock = self
+        self.url = 'http://127.0.0.1:%d' % self.server.server_port
+        self._thread = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def start(self):
+        self._thread = threading.Thread(target = self.server.serve_forever, name = 'mock-tumblr')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    #---------------------------------------------------------------------------
+
+    def page(self, name, **values):
+        with self._lock:
+            template = self._fixtures.get(name)
+            if template is None:
+                with open(os.path.join(FIXTURES_DIR, '%s.html' % name), 'rb') as F:
+                    template = F.read()
+                self._fixtures[name] = template
+
+        values.setdefault('padding', self.padding)
+        return re.sub(r'\{\{(\w+)\}\}', lambda m: values.get(m.group(1), ''), template)
+
+    def edit_page(self, postID, session):
+        with self._lock:
+            state = self.postStates.get(postID) or 'published'
+        selected = dict(('selected_%s' % value, ' selected="selected"' if name == state else '')
+                        for value, name in _EDIT_STATES.iteritems())
+        return self.page('edit_photo', post_id = postID, form_key = self.formKeys[session],
+                         upload_id = 'u%s' % postID, **selected)
+
+    def theme(self, blogname):
+        with self._lock:
+            return self.themes.setdefault(blogname, _default_theme(blogname))
+
+    def post_ids(self):
+        """Every blog's post IDs, newest first."""
+        return [1000000 + i for i in xrange(self.postcount, 0, -1)]
+
+    def post_listing(self, blogname, page):
+        postIDs = self.post_ids()[(page - 1) * POSTS_PER_PAGE:page * POSTS_PER_PAGE]
+        posts = '\n'.join(_POST % (_POST_TYPES[postID % len(_POST_TYPES)],
+                                   _POST_CLASSES.get(self.postStates.get(str(postID)), ''),
+                                   postID, postID, postID)
+                          for postID in postIDs)
+        nextPage = ''
+        if page * POSTS_PER_PAGE < self.postcount:
+            nextPage = '<a id="next_page_link" href="/blog/%s/%d">Next page</a>' % (blogname, page + 1)
+        return self.page('blog_posts', blogname = blogname, posts = posts, next_page = nextPage)
+
+    def new_session(self):
+        with self._lock:
+            session = os.urandom(12).encode('hex')
+            self.sessions.add(session)
+            self.formKeys[session] = os.urandom(16).encode('hex')
+            return session
+
+    def admit(self):
+        """Whether the rate limit lets another request through."""
+        with self._lock:
+            if not self.ratelimit:
+                return True
+
+            now = time.time()
+            burst = max(1.0, self.ratelimit / 10.0)
+            self._tokens = min(burst, self._tokens + (now - self._refilled) * self.ratelimit)
+            self._refilled = now
+            if self._tokens < 1:
+                self.requests[('THROTTLED', '*')] += 1
+                return False
+            self._tokens -= 1
+            return True
+
+    def expire_sessions(self):
+        """Log every client out (to exercise re-login paths)."""
+        with self._lock:
+            self.sessions.clear()
+
+    def count(self, method, path, code):
+        with self._lock:
+            self.requests[(method, urlparse.urlparse(path).path.split('/')[1] or '/')] += 1
+
+#//end class MockTumblr
@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+"""
+!    run.py  (tumblrpype benchmarks)
+!  --------------------------------------------------------------------------
+!
+!    Runs the benchmark scenarios against a local MockTumblr server, and
+!    writes the results as JSON:
+!
+!        python -m benchmarks.run [-o results.json] [--latency 0.02]
+!        python -m benchmarks.run --compare old.json      # exit 1 on regressions
+!
+!    Except where otherwise noted, the code in tumblrpype is
+!        Copyright (c) 2012  Felix Bonkoski <felix@post-theory.com>
+!        Licensed under the MIT license:
+!            <http://www.opensource.org/licenses/mit-license.php>
+!
+"""
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+
+#-------------------------------------------------------------------------------
+
+class Bench(object):
+    """What a scenario gets to set itself up with."""
+
+    def __init__(self, mock, workdir, concurrency):
+        self.mock = mock
+        self.workdir = workdir
+        self.concurrency = concurrency
+        self._closers = []
+
+    def keep(self, session):
+        """Close ``session`` once the scenario is done."""
+        self._closers.append(session)
+        return session
+
+    def close(self):
+        for session in self._closers:
+            session.close()
+        self._closers = []
+
+#//end class Bench
+
+
+def _percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(fraction * (len(values) - 1))))]
+
+
+def run_scenario(name, setup, iterations, ops, mock, workdir, concurrency):
+    bench = Bench(mock, workdir, concurrency)
+    try:
+        run = setup(bench)
+        run()   # warm-up
+
+        mock.requests.clear()
+        timings = []
+        for i in xrange(iterations):
+            started = time.time()
+            run()
+            timings.append(time.time() - started)
+        requests = sum(mock.requests.values())
+
+    finally:
+        bench.close()
+
+    total = sum(timings)
+    return {'iterations' : iterations,
+            'ops_per_iteration' : ops,
+            'mean' : total / iterations,
+            'median' : _percentile(timings, 0.5),
+            'p95' : _percentile(timings, 0.95),
+            'min' : min(timings),
+            'ops_per_sec' : (iterations * ops) / total if total else None,
+            'requests_per_iteration' : float(requests) / iterations}
+
+
+def compare(results, baseline, tolerance):
+    """Return the scenarios whose median got slower than ``baseline`` by more than ``tolerance``."""
+    regressions = []
+    for name, result in results['scenarios'].iteritems():
+        old = baseline.get('scenarios', {}).get(name)
+        if not old or not old.get('median'):
+            continue
+        change = (result['median'] - old['median']) / old['median']
+        if change > tolerance:
+            regressions.append((name, old['median'], result['median'], change))
+    return regressions
+
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(prog = 'python -m benchmarks.run',
+                                     description = 'tumblrpype benchmarks (against a local mock server)')
+    parser.add_argument('scenarios', nargs = '*', help = 'scenarios to run (default: all)')
+    parser.add_argument('-o', '--output', help = 'write the JSON results here (default: stdout)')
+    parser.add_argument('--latency', type = float, default = 0.0,
+                        help = 'seconds of latency injected into every response')
+    parser.add_argument('--pagesize', type = int, default = 64 * 1024,
+                        help = 'approximate size of the served HTML pages, in bytes')
+    parser.add_argument('--compress', action = 'store_true',
+                        help = 'have the mock server gzip its responses')
+    parser.add_argument('--concurrency', type = int, default = 8,
+                        help = 'concurrency of the bulk scenarios')
+    parser.add_argument('--iterations', type = float, default = 1.0,
+                        help = 'scale the number of iterations of every scenario')
+    parser.add_argument('--instrument', action = 'store_true',
+                        help = 'include tumblrpype.instrument histograms / counters in the results')
+    parser.add_argument('--compare', metavar = 'BASELINE',
+                        help = 'compare with earlier results, and exit 1 on regressions')
+    parser.add_argument('--tolerance', type = float, default = 0.2,
+                        help = 'allowed slow-down (fraction of the median) before it is a regression')
+    args = parser.parse_args(argv)
+
+    # keep tumblrpype's cookies, caches etc. out of the real config directory
+    workdir = tempfile.mkdtemp(prefix = 'tumblrpype-bench-')
+    os.environ['TUMBLRPYPE_CONFIG_DIR'] = workdir
+
+    import tumblrpype
+    from tumblrpype import config, instrument
+    from benchmarks.mockserver import MockTumblr
+    from benchmarks.scenarios import SCENARIOS
+
+    config.DEBUG = False
+    if args.instrument:
+        instrument.enable()
+
+    results = {'tumblrpype' : tumblrpype.__version__,
+               'python' : platform.python_version(),
+               'platform' : platform.platform(),
+               'time' : time.strftime('%Y-%m-%dT%H:%M:%S'),
+               'latency' : args.latency,
+               'pagesize' : args.pagesize,
+               'compress' : args.compress,
+               'concurrency' : args.concurrency,
+               'scenarios' : {}}
+
+    try:
+        with MockTumblr(latency = args.latency, pagesize = args.pagesize,
+                        compress = args.compress) as mock:
+            for name, setup, iterations, ops in SCENARIOS:
+                if args.scenarios and name not in args.scenarios:
+                    continue
+
+                iterations = max(1, int(iterations * args.iterations))
+                sys.stderr.write('%-30s ' % name)
+                result = run_scenario(name, setup, iterations, ops, mock, workdir, args.concurrency)
+                sys.stderr.write('median %8.2f ms   %10.1f ops/s\n' % (result['median'] * 1000,
+                                                                       result['ops_per_sec'] or 0))
+                results['scenarios'][name] = result
+    finally:
+        shutil.rmtree(workdir, ignore_errors = True)
+
+    if args.instrument:
+        results['instrument'] = instrument.stats()
+
+    output = json.dumps(results, indent = 2, sort_keys = True)
+    if args.output:
+        with open(args.output, 'wb') as F:
+            F.write(output + '\n')
+    else:
+        print output
+
+    if args.compare:
+        with open(args.compare, 'rb') as F:
+            baseline = json.load(F)
+
+        regressions = compare(results, baseline, args.tolerance)
+        for name, old, new, change in regressions:
+            sys.stderr.write('REGRESSION  %-30s %8.2f ms -> %8.2f ms  (+%.0f%%)\n'
+                             % (name, old * 1000, new * 1000, change * 100))
+        if regressions:
+            return 1
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,388 @@
+# -*- coding: utf-8 -*-
+"""
+!    scenarios.py  (tumblrpype benchmarks)
+!  --------------------------------------------------------------------------
+!
+!    The benchmark scenarios.  Each one is a function taking a `Bench`
+!    context, that returns a callable doing one iteration of the work.
+!
+!    Except where otherwise noted, the code in tumblrpype is
+!        Copyright (c) 2012  Felix Bonkoski <felix@post-theory.com>
+!        Licensed under the MIT license:
+!            <http://www.opensource.org/licenses/mit-license.php>
+!
+"""
+
+import itertools
+import os
+import subprocess
+import sys
+
+from tumblrpype import TumblrLogin, AsyncTumblrLogin
+from tumblrpype.formdata import (MultipartTemplate, UrlencodedTemplate,
+                                 encode_multipart_formdata, encode_urlencoded_formdata)
+
+__all__ = ['SCENARIOS']
+
+#-------------------------------------------------------------------------------
+
+LOGIN = 'bench@example.com'
+PASSWORD = 'secret'
+BLOGNAME = 'bench'
+
+SCENARIOS = []
+
+def scenario(name, iterations = 50, ops = 1):
+    """Register a scenario; ``ops`` is the number of operations per iteration."""
+    def register(fn):
+        SCENARIOS.append((name, fn, iterations, ops))
+        return fn
+    return register
+
+
+def _login(bench, **kwargs):
+    return TumblrLogin(LOGIN, PASSWORD, BLOGNAME, baseurl = bench.mock.url,
+                       cookiesfile = os.path.join(bench.workdir, 'cookies-%s' % BLOGNAME),
+                       **kwargs)
+
+#-------------------------------------------------------------------------------
+
+@scenario('login', iterations = 20)
+def login_fresh(bench):
+    def run():
+        bench.mock.expire_sessions()
+        _login(bench).close()
+    return run
+
+@scenario('login_lazy_cached', iterations = 200)
+def login_lazy(bench):
+    _login(bench).close()
+    def run():
+        session = _login(bench, lazy = True)
+        session._ensure_login()
+        session.close()
+    return run
+
+@scenario('theme_get')
+def theme_get(bench):
+    session = bench.keep(_login(bench))
+    def run():
+        session.get_theme_html()
+    return run
+
+@scenario('theme_save')
+def theme_save(bench):
+    session = bench.keep(_login(bench))
+    counter = itertools.count()
+    def run():
+        html = '<html><body>benchmark %d %s</body></html>' % (next(counter), 'x' * 20000)
+        session.save_theme_html(html)
+    return run
+
+@scenario('theme_save_unchanged', iterations = 200)
+def theme_save_unchanged(bench):
+    session = bench.keep(_login(bench))
+    html = '<html><body>unchanged %s</body></html>' % ('x' * 20000)
+    session.save_theme_html(html)
+    def run():
+        session.save_theme_html(html)
+    return run
+
+LARGE_THEME_SIZE = 2 * 1024 * 1024
+
+def _large_theme(n):
+    line = u'<div class="post" style="background: url(\'data:image/png;base64,iVBORw0KGgo=\')">\u2014 %d</div>\n'
+    html = (line * (LARGE_THEME_SIZE // 100)).encode('utf-8')
+    return '<!-- %d -->\n%s' % (n, html)
+
+@scenario('theme_save_large', iterations = 10)
+def theme_save_large(bench):
+    """Save a ~2 MB theme (inlined assets): streamed out, the echoed theme left unparsed."""
+    session = bench.keep(_login(bench))
+    counter = itertools.count()
+    def run():
+        session.save_theme_html(_large_theme(next(counter)))
+    return run
+
+@scenario('theme_save_file', iterations = 10)
+def theme_save_file(bench):
+    """The same, from a file that is mapped rather than read."""
+    session = bench.keep(_login(bench))
+    counter = itertools.count()
+    path = os.path.join(bench.workdir, 'large-theme.html')
+    def run():
+        with open(path, 'wb') as F:
+            F.write(_large_theme(next(counter)))
+        session.save_theme_file(path)
+    return run
+
+VARIABLE_UPDATES = 20
+
+@scenario('theme_variables_coalesced', iterations = 10, ops = VARIABLE_UPDATES)
+def theme_variables_coalesced(bench):
+    """VARIABLE_UPDATES concurrent one-variable updates, merged into (about) one save."""
+    session = bench.keep(AsyncTumblrLogin(LOGIN, PASSWORD, BLOGNAME, baseurl = bench.mock.url,
+                                          cookiesfile = os.path.join(bench.workdir, 'cookies-vars'),
+                                          concurrency = VARIABLE_UPDATES))
+    counter = itertools.count()
+    def run():
+        changes = [({'text:Subtitle' : 'subtitle %d' % next(counter)},) for i in xrange(VARIABLE_UPDATES)]
+        for result in session.batch('set_theme_variables', changes):
+            if isinstance(result, Exception):
+                raise result
+    return run
+
+@scenario('mark_post_private')
+def mark_post_private(bench):
+    session = bench.keep(_login(bench))
+    counter = itertools.count(1000)
+    def run():
+        session.mark_post_private(next(counter))
+    return run
+
+BULK_POSTS = 100
+
+@scenario('mark_post_private_bulk', iterations = 3, ops = BULK_POSTS)
+def mark_post_private_bulk(bench):
+    session = bench.keep(AsyncTumblrLogin(LOGIN, PASSWORD, BLOGNAME, baseurl = bench.mock.url,
+                                          cookiesfile = os.path.join(bench.workdir, 'cookies-bulk'),
+                                          concurrency = bench.concurrency))
+    counter = itertools.count(100000)
+    def run():
+        postIDs = [next(counter) for i in xrange(BULK_POSTS)]
+        for result in session.batch('mark_post_private', postIDs):
+            if isinstance(result, Exception):
+                raise result
+    return run
+
+@scenario('mark_post_private_bulk_processes', iterations = 3, ops = BULK_POSTS)
+def mark_post_private_bulk_processes(bench):
+    """The bulk edit, sharded over 4 worker processes of 2 threads each."""
+    from tumblrpype.bulk import run_bulk
+    from tumblrpype.user import TumblrUser
+
+    user = TumblrUser()
+    user.create(LOGIN, PASSWORD, BLOGNAME)
+    counter = itertools.count(200000)
+    def run():
+        postIDs = [next(counter) for i in xrange(BULK_POSTS)]
+        result = run_bulk(user, postIDs, workers = 4, threads = 2, job = 'bench',
+                          restart = True, baseurl = bench.mock.url)
+        assert sum(worker.ok for worker in result.workers) == BULK_POSTS, result
+    return run
+
+@scenario('mark_post_private_resweep', iterations = 20, ops = BULK_POSTS)
+def mark_post_private_resweep(bench):
+    """The bulk edit again, on posts that are private already (and in the post index)."""
+    session = bench.keep(_login(bench, postmaxage = 3600))
+    postIDs = range(300000, 300000 + BULK_POSTS)
+    for postID in postIDs:
+        session.mark_post_private(postID)
+    def run():
+        for postID in postIDs:
+            session.mark_post_private(postID)
+    return run
+
+class _RateLimit(object):
+    """Rate limits the mock server while a scenario runs."""
+
+    def __init__(self, mock, ratelimit):
+        self.mock = mock
+        mock.ratelimit = ratelimit
+
+    def close(self):
+        self.mock.ratelimit = None
+
+THROTTLED_RATE = 50
+
+@scenario('mark_post_private_bulk_throttled', iterations = 3, ops = BULK_POSTS)
+def mark_post_private_bulk_throttled(bench):
+    """The bulk edit against a server allowing THROTTLED_RATE requests/s (2 per post)."""
+    run = mark_post_private_bulk(bench)
+    bench.keep(_RateLimit(bench.mock, THROTTLED_RATE))
+    return run
+
+LISTED_POSTS = 500
+
+@scenario('iter_posts', iterations = 5, ops = LISTED_POSTS)
+def iter_posts(bench):
+    """List LISTED_POSTS posts (50 pages), 4 pages ahead."""
+    session = bench.keep(_login(bench))
+    def run():
+        bench.mock.postcount = LISTED_POSTS
+        count = sum(1 for post in session.iter_posts(prefetch = 4))
+        assert count == LISTED_POSTS, count
+    return run
+
+@scenario('iter_posts_serial', iterations = 5, ops = LISTED_POSTS)
+def iter_posts_serial(bench):
+    """The same, one page at a time."""
+    session = bench.keep(_login(bench))
+    def run():
+        bench.mock.postcount = LISTED_POSTS
+        count = sum(1 for post in session.iter_posts(prefetch = 1))
+        assert count == LISTED_POSTS, count
+    return run
+
+@scenario('iter_posts_cached', iterations = 5, ops = LISTED_POSTS)
+def iter_posts_cached(bench):
+    """The listing again, through the response cache: every page comes back 304 Not Modified."""
+    from tumblrpype.httpcache import ResponseCache
+
+    cache = ResponseCache(os.path.join(bench.workdir, 'responses-revalidated.db'))
+    session = bench.keep(_login(bench, responsecache = cache))
+    bench.mock.postcount = LISTED_POSTS
+    sum(1 for post in session.iter_posts())
+    def run():
+        bench.mock.postcount = LISTED_POSTS
+        count = sum(1 for post in session.iter_posts())
+        assert count == LISTED_POSTS, count
+    return run
+
+@scenario('iter_posts_cached_ttl', iterations = 5, ops = LISTED_POSTS)
+def iter_posts_cached_ttl(bench):
+    """The same, with the listing served from the cache for 5 minutes."""
+    from tumblrpype.httpcache import ResponseCache
+
+    cache = ResponseCache(os.path.join(bench.workdir, 'responses-ttl.db'), ttls = [(r'blog/', 300)])
+    session = bench.keep(_login(bench, responsecache = cache))
+    bench.mock.postcount = LISTED_POSTS
+    sum(1 for post in session.iter_posts())
+    def run():
+        bench.mock.postcount = LISTED_POSTS
+        count = sum(1 for post in session.iter_posts())
+        assert count == LISTED_POSTS, count
+    return run
+
+EXPORT_BLOGS = 40
+
+def _export_users():
+    from tumblrpype.user import TumblrUser
+
+    users = []
+    for i in xrange(EXPORT_BLOGS):
+        user = TumblrUser()
+        user.create(LOGIN, PASSWORD, '%s-export-%02d' % (BLOGNAME, i))
+        users.append(user)
+    return users
+
+@scenario('export_themes', iterations = 5, ops = EXPORT_BLOGS)
+def export_themes(bench):
+    """Back up EXPORT_BLOGS blogs' themes, 8 at a time."""
+    from tumblrpype.export import export_themes
+
+    users = _export_users()
+    archive = os.path.join(bench.workdir, 'export.zip')
+    def run():
+        results = export_themes(users, archive, workers = 8, baseurl = bench.mock.url)
+        assert all(result.error is None for result in results)
+    return run
+
+@scenario('export_themes_incremental', iterations = 20, ops = EXPORT_BLOGS)
+def export_themes_incremental(bench):
+    """The same, again: nothing changed since the last export."""
+    from tumblrpype.export import export_themes
+
+    users = _export_users()
+    archive = os.path.join(bench.workdir, 'export-incremental.zip')
+    export_themes(users, archive, workers = 8, baseurl = bench.mock.url)
+    def run():
+        export_themes(users, archive, workers = 8, maxage = 3600, baseurl = bench.mock.url)
+    return run
+
+#-------------------------------------------------------------------------------
+
+def _photo_form():
+    return {'UPLOAD_IDENTIFIER' : 'u12345',
+            'post[state]' : 'private',
+            'post[publish_on]' : '',
+            'post[draft_status]' : '',
+            'post[date]' : 'Jan 1st, 2012 12:00pm',
+            'post[source_url]' : '',
+            'post[tags]' : 'photo,benchmark',
+            'post[slug]' : '',
+            'custom_tweet' : 'Photo: [URL]',
+            'custom_tweet_changed' : '0',
+            'is_rich_text[one]' : '0',
+            'is_rich_text[two]' : '1',
+            'is_rich_text[three]' : '0',
+            'form_key' : 'f' * 32,
+            'photo_raw' : '',
+            'images' : ('', ''),
+            'photo_src' : '',
+            'MAX_FILE_SIZE' : '10485760',
+            'post[two]' : u'<p>A caption — with some unicode</p>\r\n<p>and a second line</p>',
+            'post[three]' : '',
+            'post[type]' : 'photo',
+            'post[id]' : '12345',
+            'post[promotion_data][message]' : '(No message)',
+            'post[promotion_data][icon]' : '/images/highlighted_posts/icons/bolt_white.png',
+            'post[promotion_data][color]' : '#bb3434'}
+
+ENCODE_BATCH = 1000
+
+@scenario('encode_multipart_formdata', iterations = 20, ops = ENCODE_BATCH)
+def encode_multipart(bench):
+    form = _photo_form()
+    def run():
+        for i in xrange(ENCODE_BATCH):
+            encode_multipart_formdata(form)
+    return run
+
+@scenario('encode_urlencoded_formdata', iterations = 20, ops = ENCODE_BATCH)
+def encode_urlencoded(bench):
+    form = dict((k, v) for k, v in _photo_form().iteritems() if not isinstance(v, tuple))
+    def run():
+        for i in xrange(ENCODE_BATCH):
+            encode_urlencoded_formdata(form)
+    return run
+
+# the fields of the photo edit form that change from post to post
+_PER_POST_FIELDS = ('UPLOAD_IDENTIFIER', 'post[state]', 'post[date]', 'post[source_url]',
+                    'post[tags]', 'form_key', 'post[two]', 'post[three]', 'post[id]')
+
+@scenario('encode_multipart_template', iterations = 20, ops = ENCODE_BATCH)
+def encode_multipart_template(bench):
+    """The same form as encode_multipart_formdata, from a MultipartTemplate."""
+    form = _photo_form()
+    template = MultipartTemplate(form, variable = _PER_POST_FIELDS)
+    values = dict((name, form[name]) for name in _PER_POST_FIELDS)
+    def run():
+        for i in xrange(ENCODE_BATCH):
+            template.fill(values)
+    return run
+
+@scenario('encode_urlencoded_template', iterations = 20, ops = ENCODE_BATCH)
+def encode_urlencoded_template(bench):
+    form = dict((k, v) for k, v in _photo_form().iteritems() if not isinstance(v, tuple))
+    template = UrlencodedTemplate(form, variable = _PER_POST_FIELDS)
+    values = dict((name, form[name]) for name in _PER_POST_FIELDS)
+    def run():
+        for i in xrange(ENCODE_BATCH):
+            template.fill(values)
+    return run
+
+#-------------------------------------------------------------------------------
+#   Cold start: a fresh interpreter per iteration
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def _python(bench, *args):
+    env = dict(os.environ, PYTHONPATH = REPO_DIR, TUMBLRPYPE_CONFIG_DIR = bench.workdir)
+    def run():
+        subprocess.check_call((sys.executable,) + args, env = env,
+                              stdout = open(os.devnull, 'wb'))
+    return run
+
+@scenario('startup_python', iterations = 20)
+def startup_python(bench):
+    """The bare interpreter start-up, to subtract from the ones below."""
+    return _python(bench, '-c', 'pass')
+
+@scenario('startup_import', iterations = 20)
+def startup_import(bench):
+    return _python(bench, '-c', 'import tumblrpype')
+
+@scenario('startup_cli_help', iterations = 20)
+def startup_cli_help(bench):
+    return _python(bench, os.path.join(REPO_DIR, 'bin', 'tumblrpype.py'), '--help')
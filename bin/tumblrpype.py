@@ -15,6 +15,308 @@
 
 #-------------------------------------------------------------------------------
 
+import argparse
+import json
 import os
+import sys
+import time
 
-print "Hello, I am just a stub!"
+# This script is itself named tumblrpype.py - keep its directory off the path,
+# so that it doesn't shadow the tumblrpype package.
+_BIN_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path = [p for p in sys.path if os.path.abspath(p or os.curdir) != _BIN_DIR]
+
+from tumblrpype import config, instrument
+
+#-------------------------------------------------------------------------------
+
+def load_users(blognames):
+    from tumblrpype.registry import account_registry
+
+    registry = account_registry()
+    try:
+        return registry.get_many(blognames)
+    except KeyError:
+        # some of them may still be in the old one-directory-per-blog layout
+        registry.migrate(blognames)
+        return registry.get_many(blognames)
+
+
+def cmd_accounts(args):
+    from tumblrpype.registry import account_registry
+
+    registry = account_registry()
+
+    if args.migrate:
+        print "Imported %d blog(s)" % registry.migrate()
+
+    if args.group:
+        for login, users in registry.group_by_login(args.pattern).iteritems():
+            if args.login is not None and login != args.login:
+                continue
+            print login
+            for user in users:
+                print "    %s" % user.blogname
+    else:
+        for user in registry.find(args.login, args.pattern):
+            print "%-30s  %s" % (user.blogname, user.login)
+
+    return 0
+
+
+def cmd_deploy(args):
+    from tumblrpype.deploy import deploy_theme
+
+    with open(args.theme, 'rb') as F:
+        newHTML = F.read()
+
+    results = deploy_theme(newHTML, load_users(args.blogs),
+                           workers = args.workers, force = args.force)
+
+    failed = 0
+    for result in results:
+        if result.ok:
+            print "%-30s  ok      %6.2fs" % (result.blogname, result.seconds)
+        else:
+            failed += 1
+            print "%-30s  FAILED  %6.2fs  %s" % (result.blogname, result.seconds, result.error)
+
+    return 1 if failed else 0
+
+
+def cmd_bulk(args):
+    from tumblrpype import TumblrLogin
+    from tumblrpype.bulk import new_job_name, run_bulk
+
+    user = load_users([args.blog])[0]
+
+    if args.all:
+        # the listing already tells which posts are in that state (and puts
+        # them all in the post index)
+        session = TumblrLogin(user, lazy = True)
+        try:
+            postIDs = [post.id for post in session.iter_posts() if post.state != args.state]
+        finally:
+            session.close()
+    else:
+        F = sys.stdin if args.ids == '-' else open(args.ids, 'rb')
+        try:
+            postIDs = [int(line) for line in (line.strip() for line in F) if line]
+        finally:
+            if F is not sys.stdin:
+                F.close()
+
+    job = args.resume or args.job or new_job_name('set_post_state', (args.state,))
+    try:
+        result = run_bulk(user, postIDs, 'set_post_state', (args.state,), workers = args.workers,
+                          threads = args.threads, job = job, resume = bool(args.resume),
+                          restart = args.restart, maxage = args.max_age)
+    except ValueError as e:
+        print >> sys.stderr, "tumblrpype: %s" % e
+        return 1
+    except KeyboardInterrupt:
+        print "Interrupted - add '--resume %s' to the same command to carry on" % job
+        return 1
+
+    print ("job %s: %d post(s), %d done already, %d %s already (post index)"
+           % (result.job, result.total, result.skipped, result.indexed, args.state))
+    for worker in result.workers:
+        print ("worker %-2d  pid %-6d  %5d post(s)  %5d ok  %4d error(s)  %7.2fs  %6.1f posts/s  %5.1f%% errors%s"
+               % (worker.worker, worker.pid, worker.posts, worker.ok, worker.errors, worker.seconds,
+                  worker.throughput, 100 * worker.error_rate,
+                  '  (exit code %s)' % worker.exitcode if worker.exitcode else ''))
+
+    if result.complete:
+        print "Done (journal: %s)" % result.journal if result.journal else "Done"
+        return 0
+
+    print "Not done - add '--resume %s' to the same command to try the rest again" % result.job
+    return 1
+
+
+def cmd_export(args):
+    from tumblrpype.export import export_themes
+    from tumblrpype.registry import account_registry
+
+    if args.blogs:
+        users = load_users(args.blogs)
+    else:
+        users = account_registry().find(args.login, args.pattern)
+
+    results = export_themes(users, args.archive, workers = args.workers,
+                            previous = args.previous, maxage = args.maxage)
+
+    failed = 0
+    for result in results:
+        if result.error is None:
+            print "%-30s  %-9s  %6.2fs" % (result.blogname, result.status, result.seconds)
+        else:
+            failed += 1
+            print "%-30s  FAILED     %6.2fs  %s" % (result.blogname, result.seconds, result.error)
+
+    return 1 if failed else 0
+
+
+def cmd_vars(args):
+    from tumblrpype import TumblrLogin
+    from tumblrpype.themevars import parse_assignments
+
+    try:
+        changes = parse_assignments(args.assignments)
+    except ValueError as e:
+        sys.stderr.write('%s\n' % e)
+        return 2
+
+    session = TumblrLogin(load_users([args.blog])[0], lazy = True)
+    try:
+        if not changes:
+            variables = session.get_theme_variables()
+            if variables is None:
+                sys.stderr.write('Could not fetch the theme of %s\n' % args.blog)
+                return 1
+            for name in sorted(variables):
+                print (u'%s=%s' % (name, variables[name])).encode('utf-8')
+            return 0
+
+        try:
+            ok = session.set_theme_variables(changes, coalesce = 0)
+        except KeyError as e:
+            sys.stderr.write('%s\n' % e.args[0])
+            return 1
+    finally:
+        session.close()
+
+    if not ok:
+        sys.stderr.write('Saving the theme variables of %s failed\n' % args.blog)
+        return 1
+    return 0
+
+
+def cmd_watch(args):
+    from tumblrpype import TumblrLogin
+    from tumblrpype.watch import watch_theme
+
+    user = load_users([args.blog])[0]
+    session = TumblrLogin(user, lazy = True)
+
+    def report(result, seconds, error):
+        stamp = time.strftime('%H:%M:%S')
+        if error:
+            print "%s  %s  FAILED  %6.2fs  %s" % (stamp, args.blog, seconds, error)
+        else:
+            print "%s  %s  pushed  %6.2fs" % (stamp, args.blog, seconds)
+        sys.stdout.flush()
+
+    print "Watching %s -> %s (Ctrl-C to stop)" % (args.theme, args.blog)
+    sys.stdout.flush()
+    try:
+        watch_theme(session, args.theme, debounce = args.debounce, poll = args.poll, report = report)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        session.close()
+
+    return 0
+
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(prog = 'tumblrpype',
+                                     description = 'A Python Page Editor for Tumblr')
+    parser.add_argument('-v', '--verbose', action = 'store_true',
+                        help = 'print progress messages to stderr')
+    parser.add_argument('--stats', action = 'store_true',
+                        help = 'print request timing / byte statistics (JSON) to stderr when done')
+    commands = parser.add_subparsers(dest = 'command')
+
+    p = commands.add_parser('deploy', help = 'upload one theme to many blogs')
+    p.add_argument('theme', help = 'Theme HTML file')
+    p.add_argument('blogs', nargs = '+', metavar = 'blog', help = 'blog(s) to deploy to')
+    p.add_argument('-w', '--workers', type = int, default = 8,
+                   help = 'number of blogs to deploy to concurrently (default: 8)')
+    p.add_argument('-f', '--force', action = 'store_true',
+                   help = 'upload even if the theme is unchanged')
+    p.set_defaults(func = cmd_deploy)
+
+    p = commands.add_parser('accounts', help = 'list the blogs in the account registry')
+    p.add_argument('pattern', nargs = '?', help = "only blogs matching this pattern (e.g. 'shop-*')")
+    p.add_argument('-l', '--login', help = 'only the blogs of this login')
+    p.add_argument('-g', '--group', action = 'store_true', help = 'group the blogs by login')
+    p.add_argument('--migrate', action = 'store_true',
+                   help = 'first import the blogs kept in the old one-directory-per-blog layout')
+    p.set_defaults(func = cmd_accounts)
+
+    p = commands.add_parser('bulk', help = "change the state of many of a blog's posts")
+    p.add_argument('blog', help = 'blog whose posts to change')
+    p.add_argument('-s', '--state', default = 'private',
+                   choices = ('private', 'draft', 'queued', 'published'),
+                   help = 'the state to put the posts in (default: private)')
+    source = p.add_mutually_exclusive_group(required = True)
+    source.add_argument('--ids', metavar = 'FILE', help = "file of post IDs, one per line ('-': stdin)")
+    source.add_argument('--all', action = 'store_true',
+                        help = "every post of the blog that isn't in that state yet")
+    p.add_argument('-w', '--workers', type = int, default = 4,
+                   help = 'number of worker processes (default: 4)')
+    p.add_argument('-t', '--threads', type = int, default = 2,
+                   help = 'requests in flight per worker (default: 2)')
+    job = p.add_mutually_exclusive_group()
+    job.add_argument('--job', help = 'name of the job (and its journal) - default: after the state and time')
+    job.add_argument('--resume', metavar = 'JOB',
+                     help = 'carry on with an unfinished job: skip the posts its journal has as done')
+    p.add_argument('--restart', action = 'store_true',
+                   help = "throw away the journal of the --job, if it has one, and start over")
+    p.add_argument('--max-age', type = int, default = config.POST_STATE_TTL, metavar = 'SECONDS',
+                   help = 'skip the posts seen in that state less than SECONDS ago, without '
+                          'looking at them again - even if they were changed on the web since '
+                          '(default: %d, never)' % config.POST_STATE_TTL)
+    p.set_defaults(func = cmd_bulk)
+
+    p = commands.add_parser('export', help = "back up many blogs' themes and settings to one archive")
+    p.add_argument('archive', help = 'zip archive to write (an existing one is updated)')
+    p.add_argument('blogs', nargs = '*', metavar = 'blog',
+                   help = 'blog(s) to export (default: every blog in the account registry)')
+    p.add_argument('-p', '--pattern', help = "only blogs matching this pattern (e.g. 'shop-*')")
+    p.add_argument('-l', '--login', help = 'only the blogs of this login')
+    p.add_argument('-w', '--workers', type = int, default = 8,
+                   help = 'number of blogs to fetch concurrently (default: 8)')
+    p.add_argument('--previous', help = 'an earlier export to carry unchanged blogs over from')
+    p.add_argument('--maxage', type = float,
+                   help = "don't refetch blogs whose theme was seen live (and unchanged "
+                          "since the last export) within this many seconds")
+    p.set_defaults(func = cmd_export)
+
+    p = commands.add_parser('vars', help = "list or set a blog's Custom Theme Variables")
+    p.add_argument('blog', help = 'blog whose theme to change')
+    p.add_argument('assignments', nargs = '*', metavar = 'name=value',
+                   help = "variables to set, all in one save (e.g. 'color:Background=#000000'); "
+                          "none: list them")
+    p.set_defaults(func = cmd_vars)
+
+    p = commands.add_parser('watch', help = 'push a theme file to a blog every time it is saved')
+    p.add_argument('theme', help = 'Theme HTML file')
+    p.add_argument('blog', help = 'blog to push it to')
+    p.add_argument('-d', '--debounce', type = float, default = 0.1,
+                   help = 'seconds to wait for a burst of changes to settle (default: 0.1)')
+    p.add_argument('--poll', action = 'store_true',
+                   help = 'poll the file instead of using inotify')
+    p.set_defaults(func = cmd_watch)
+
+    args = parser.parse_args(argv)
+
+    if args.verbose:
+        config.DEBUG = True
+    if args.stats:
+        instrument.enable()
+
+    try:
+        return args.func(args)
+    finally:
+        if args.stats:
+            stats = instrument.stats()
+            if 'tumblrpype.scheduler' in sys.modules:
+                from tumblrpype.scheduler import default_scheduler
+                stats['scheduler'] = default_scheduler().stats
+            sys.stderr.write(json.dumps(stats, indent = 2, sort_keys = True) + '\n')
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -7,7 +7,7 @@ setup(name = 'tumblrpype',
       license = 'MIT',
       url = 'https://github.com/felixbonkoski/tumblrpype',
       description = 'tumblrpype is a Python Page Editor tool for Tumblr',
-      requires = ['jsonlib', 'bs4', 'six'],
+      requires = ['jsonlib', 'six'],
       packages = ['tumblrpype'],
       scripts = ['bin/tumblrpype.py']
       )
@@ -0,0 +1,14 @@
+# -*- coding: utf-8 -*-
+"""
+!    tumblrpype's tests.  Run them from the top of the source tree with:
+!
+!        python -m unittest discover -s tests -t .
+!
+!    Everything tumblrpype writes (sessions, indexes, journals ...) goes to
+!    a temporary config directory, set here before tumblrpype is imported.
+"""
+
+import os
+import tempfile
+
+os.environ.setdefault('TUMBLRPYPE_CONFIG_DIR', tempfile.mkdtemp(prefix = 'tumblrpype-tests-'))
@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+"""
+!    Test cases that run against benchmarks.mockserver.MockTumblr, a local
+!    stand-in for www.tumblr.com.
+"""
+
+import itertools
+import os
+import tempfile
+import unittest
+
+from benchmarks.mockserver import MockTumblr
+
+LOGIN = 'bench@example.com'
+PASSWORD = 'secret'
+BLOGNAME = 'bench'
+
+_sessions = itertools.count()
+
+def next_session():
+    """A number no other session of the test run has - to name its cookies file."""
+    return next(_sessions)
+
+
+class MockTumblrTestCase(unittest.TestCase):
+
+    # keyword arguments to MockTumblr
+    MOCK = {}
+
+    @classmethod
+    def setUpClass(cls):
+        cls.mock = MockTumblr(**cls.MOCK)
+        cls.mock.start()
+        cls.workdir = tempfile.mkdtemp(prefix = 'tumblrpype-test-')
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.mock.stop()
+
+    def setUp(self):
+        self.mock.requests.clear()
+        self.sessions = []
+
+    def tearDown(self):
+        for session in self.sessions:
+            session.close()
+
+    def login(self, blogname = BLOGNAME, **kwargs):
+        """A TumblrLogin on the mock, with a session (cookies file) of its own."""
+        from tumblrpype import TumblrLogin
+
+        kwargs.setdefault('cookiesfile', os.path.join(self.workdir, 'cookies-%d' % next_session()))
+        session = TumblrLogin(LOGIN, PASSWORD, blogname, baseurl = self.mock.url, **kwargs)
+        self.sessions.append(session)
+        return session
+
+    def user(self, blogname = BLOGNAME):
+        from tumblrpype.user import TumblrUser
+
+        user = TumblrUser()
+        user.create(LOGIN, PASSWORD, blogname)
+        user.cookiesfile = os.path.join(self.workdir, 'cookies-%d' % next_session())
+        return user
+
+    def requests(self, method, route):
+        return self.mock.requests[(method, route)]
+
+#//end class MockTumblrTestCase
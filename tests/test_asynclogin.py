@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+
+import os
+import threading
+import time
+import unittest
+
+from tests.support import BLOGNAME, LOGIN, PASSWORD, MockTumblrTestCase, next_session
+
+
+class AsyncTumblrLoginTest(MockTumblrTestCase):
+
+    # long enough for the requests of a batch to overlap
+    MOCK = {'latency' : 0.05}
+
+    def async_login(self, **kwargs):
+        from tumblrpype.asynclogin import AsyncTumblrLogin
+
+        alogin = AsyncTumblrLogin(LOGIN, PASSWORD, BLOGNAME,
+                                  os.path.join(self.workdir, 'cookies-%d' % next_session()),
+                                  baseurl = self.mock.url, **kwargs)
+        self.addCleanup(alogin.close)
+        return alogin
+
+    def test_batch_results_are_in_order(self):
+        alogin = self.async_login(concurrency = 4)
+        postIDs = range(10, 22)
+        pages = alogin.batch('fetch', ['edit/%d' % postID for postID in postIDs])
+
+        self.assertEqual(len(pages), len(postIDs))
+        for postID, page in zip(postIDs, pages):
+            self.assertIn('id="post_id" value="%d"' % postID, page)
+
+    def test_concurrency_limit(self):
+        alogin = self.async_login(concurrency = 3)
+        fetch = alogin.session.fetch
+        counts = {'running' : 0, 'most' : 0}
+        lock = threading.Lock()
+
+        def counted_fetch(uriFrag):
+            with lock:
+                counts['running'] += 1
+                counts['most'] = max(counts['most'], counts['running'])
+            try:
+                time.sleep(0.02)
+                return fetch(uriFrag)
+            finally:
+                with lock:
+                    counts['running'] -= 1
+        alogin.session.fetch = counted_fetch
+
+        pages = alogin.batch('fetch', ['edit/%d' % postID for postID in range(12)])
+        self.assertTrue(all(pages))
+        self.assertEqual(counts['most'], 3)
+
+    def test_first_calls_share_one_login(self):
+        alogin = self.async_login(concurrency = 8)
+        self.assertEqual(self.requests('POST', 'login'), 0)
+
+        pages = alogin.batch('fetch', ['edit/%d' % postID for postID in range(8)])
+        self.assertTrue(all(pages))
+        self.assertEqual(self.requests('POST', 'login'), 1)
+
+#//end class AsyncTumblrLoginTest
+
+
+if __name__ == '__main__':
+    unittest.main()
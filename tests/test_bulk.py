@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+
+import os
+import tempfile
+import unittest
+
+from tumblrpype.bulk import Journal, journal_path, run_bulk
+from tumblrpype.postindex import PostIndex
+from tests.support import BLOGNAME, MockTumblrTestCase
+
+
+class RunBulkTest(MockTumblrTestCase):
+
+    def run_bulk(self, postIDs, job, **kwargs):
+        kwargs.setdefault('postindex', False)
+        return run_bulk(self.user(), postIDs, workers = 2, threads = 2, job = job,
+                        baseurl = self.mock.url, **kwargs)
+
+    def test_every_post_is_edited(self):
+        result = self.run_bulk([601, 602, 603], 'every-post')
+        self.assertTrue(result.complete)
+        self.assertEqual([self.mock.postStates.get(str(postID)) for postID in (601, 602, 603)],
+                         ['private'] * 3)
+        self.assertEqual(sum(worker.ok for worker in result.workers), 3)
+
+        # a finished job's journal is out of the way: the name can be used again
+        self.assertFalse(os.path.exists(journal_path(BLOGNAME, 'every-post')))
+        self.assertEqual(Journal(result.journal).finished(), set([601, 602, 603]))
+        self.assertTrue(self.run_bulk([601], 'every-post').complete)
+
+    def test_resume_skips_finished_posts(self):
+        journal = Journal(journal_path(BLOGNAME, 'resumed'))
+        journal.open()
+        journal.record(611, True, 0, 0.1)
+        journal.record(612, False, 0, 0.1, 'failed')
+        journal.close()
+
+        self.assertRaises(ValueError, self.run_bulk, [611, 612, 613], 'resumed')
+        self.assertEqual(self.requests('POST', 'edit'), 0)
+
+        result = self.run_bulk([611, 612, 613], 'resumed', resume = True)
+        self.assertTrue(result.complete)
+        self.assertEqual(result.skipped, 1)
+        self.assertNotIn('611', self.mock.postStates)
+        self.assertEqual(self.mock.postStates.get('612'), 'private')
+        self.assertEqual(self.requests('POST', 'edit'), 2)
+
+    def test_restart_starts_over(self):
+        journal = Journal(journal_path(BLOGNAME, 'restarted'))
+        journal.open()
+        journal.record(621, True, 0, 0.1)
+        journal.close()
+
+        result = self.run_bulk([621], 'restarted', restart = True)
+        self.assertEqual(result.skipped, 0)
+        self.assertEqual(self.mock.postStates.get('621'), 'private')
+
+    def test_resume_needs_a_job(self):
+        self.assertRaises(ValueError, self.run_bulk, [631], None, resume = True)
+
+    def test_resume_a_finished_job(self):
+        result = self.run_bulk([641, 642], 'finished')
+        self.assertTrue(result.complete)
+        edits = self.requests('POST', 'edit')
+
+        # e.g. after a crash that hid whether it finished: nothing left to do
+        result = self.run_bulk([641, 642], 'finished', resume = True)
+        self.assertTrue(result.complete)
+        self.assertEqual((result.skipped, result.workers), (2, []))
+        self.assertEqual(result.journal, journal_path(BLOGNAME, 'finished') + '.done')
+        self.assertEqual(self.requests('POST', 'edit'), edits)
+
+    def test_nothing_to_do_has_no_journal(self):
+        postIndex = PostIndex(os.path.join(self.workdir, 'posts-%s.db' % self.id()))
+        postIndex.put_many(BLOGNAME, [(651, 'photo', 'private'), (652, 'photo', 'private')])
+
+        result = self.run_bulk([651, 652], 'indexed', postindex = postIndex, maxage = 3600)
+        self.assertTrue(result.complete)
+        self.assertEqual((result.indexed, result.journal), (2, None))
+        self.assertEqual(self.requests('GET', 'edit'), 0)
+
+#//end class RunBulkTest
+
+
+class JournalTest(unittest.TestCase):
+
+    def test_retire(self):
+        journal = Journal(os.path.join(tempfile.mkdtemp(prefix = 'tumblrpype-test-'), 'job.journal'))
+        self.assertIsNone(journal.retire())
+
+        journal.open()
+        journal.record(661, True, 0, 0.1)
+        journal.close()
+        self.assertEqual(journal.retire(), journal.path + '.done')
+        self.assertFalse(os.path.exists(journal.path))
+        # again: still where it was put
+        self.assertEqual(journal.retire(), journal.path + '.done')
+        self.assertEqual(Journal(journal.path + '.done').finished(), set([661]))
+
+#//end class JournalTest
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+
+import cookielib
+import os
+import tempfile
+import time
+import unittest
+
+from benchmarks.mockserver import SESSION_COOKIE
+from tumblrpype.cookiestore import SessionStore, StoredCookieJar
+from tests.support import MockTumblrTestCase
+
+
+def make_cookie(name, value, expires = None, domain = '.tumblr.com', **rest):
+    return cookielib.Cookie(0, name, value, None, False, domain, True, True, '/', True,
+                            True, expires, expires is None, None, None, rest)
+
+
+class StoredCookieJarTest(unittest.TestCase):
+
+    def setUp(self):
+        workdir = tempfile.mkdtemp(prefix = 'tumblrpype-test-')
+        self.store = SessionStore(os.path.join(workdir, 'sessions.db'))
+        self.workdir = workdir
+
+    def jar(self, key = 'session', **kwargs):
+        jar = StoredCookieJar(self.store, key, **kwargs)
+        jar.load()
+        return jar
+
+    def cookies(self, jar):
+        return dict((cookie.name, cookie) for cookie in jar)
+
+    def test_round_trip(self):
+        expires = int(time.time()) + 3600
+        jar = self.jar()
+        jar.set_cookie(make_cookie('pfe', 's3ss10n', expires, HttpOnly = None))
+        jar.set_cookie(make_cookie('tmgioct', 'abc'))
+        jar.save()
+
+        cookies = self.cookies(self.jar())
+        self.assertEqual(sorted(cookies), ['pfe', 'tmgioct'])
+        self.assertEqual((cookies['pfe'].value, cookies['pfe'].expires), ('s3ss10n', expires))
+        self.assertTrue(cookies['pfe'].has_nonstandard_attr('HttpOnly'))
+        self.assertTrue(cookies['pfe'].secure)
+        self.assertTrue(cookies['tmgioct'].discard)
+
+        # other sessions don't see them
+        self.assertEqual(len(self.jar('other')), 0)
+
+    def test_only_changes_are_saved(self):
+        jar = self.jar()
+        jar.set_cookie(make_cookie('pfe', 'one'))
+        jar.save()
+        generation = self.store.generation('session')
+
+        jar.save()
+        self.assertEqual(self.store.generation('session'), generation)
+
+        jar.set_cookie(make_cookie('pfe', 'two'))
+        jar.save()
+        self.assertEqual(self.store.generation('session'), generation + 1)
+        self.assertEqual(self.cookies(self.jar())['pfe'].value, 'two')
+
+    def test_expired_cookies_are_removed(self):
+        jar = self.jar()
+        jar.set_cookie(make_cookie('pfe', 'one', int(time.time()) + 1))
+        jar.set_cookie(make_cookie('tmgioct', 'abc', int(time.time()) + 3600))
+        jar.save()
+
+        jar.clear_expired_cookies()
+        self.assertEqual(len(jar), 2)
+        time.sleep(1.1)
+        jar.clear_expired_cookies()
+        jar.save()
+        self.assertEqual(sorted(self.cookies(self.jar())), ['tmgioct'])
+
+    def test_reload(self):
+        jar = self.jar()
+        other = self.jar()
+        self.assertFalse(other.reload())
+
+        jar.set_cookie(make_cookie('pfe', 'new'))
+        jar.save()
+        self.assertTrue(other.reload())
+        self.assertEqual(self.cookies(other)['pfe'].value, 'new')
+        self.assertFalse(other.reload())
+
+    def test_legacy_cookies_file_is_imported(self):
+        legacyfile = os.path.join(self.workdir, 'cookies-legacy.tmp')
+        legacy = cookielib.LWPCookieJar(legacyfile)
+        legacy.set_cookie(make_cookie('pfe', 'legacy'))
+        legacy.save(ignore_discard = True, ignore_expires = True)
+
+        jar = self.jar('legacy', legacyfile = legacyfile)
+        self.assertEqual(self.cookies(jar)['pfe'].value, 'legacy')
+        self.assertIsNotNone(self.store.generation('legacy'))
+
+        # ... just the once
+        with open(legacyfile, 'wb') as F:
+            F.write('#LWP-Cookies-2.0\n')
+        self.assertEqual(self.cookies(self.jar('legacy', legacyfile = legacyfile))['pfe'].value, 'legacy')
+
+#//end class StoredCookieJarTest
+
+
+class SharedSessionTest(MockTumblrTestCase):
+
+    def session_cookie(self, session):
+        return [cookie.value for cookie in session.cookieJar if cookie.name == SESSION_COOKIE]
+
+    def test_second_login_uses_the_stored_session(self):
+        cookiesfile = os.path.join(self.workdir, 'cookies-shared')
+        first = self.login(cookiesfile = cookiesfile)
+        second = self.login(cookiesfile = cookiesfile, lazy = True)
+
+        self.assertTrue(second.fetch('edit/1'))
+        self.assertEqual(self.requests('POST', 'login'), 1)
+        self.assertEqual(self.session_cookie(second), self.session_cookie(first))
+
+    def test_expired_session_is_replaced_for_everyone(self):
+        cookiesfile = os.path.join(self.workdir, 'cookies-expired')
+        first = self.login(cookiesfile = cookiesfile)
+        old = self.session_cookie(first)
+        self.mock.expire_sessions()
+
+        self.assertTrue(first.fetch('edit/1'))
+        self.assertEqual(self.requests('POST', 'login'), 2)
+        self.assertNotEqual(self.session_cookie(first), old)
+
+        # a new worker picks up the new session, without logging in
+        second = self.login(cookiesfile = cookiesfile, lazy = True)
+        self.assertEqual(self.session_cookie(second), self.session_cookie(first))
+        self.assertTrue(second.fetch('edit/1'))
+        self.assertEqual(self.requests('POST', 'login'), 2)
+
+#//end class SharedSessionTest
+
+
+if __name__ == '__main__':
+    unittest.main()
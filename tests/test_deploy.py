@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+
+from tumblrpype.deploy import deploy_theme
+from tests.support import LOGIN, MockTumblrTestCase
+
+OTHER_LOGIN = 'other@example.com'
+
+
+class DeployThemeTest(MockTumblrTestCase):
+
+    MOCK = {'accounts' : {LOGIN : 'secret', OTHER_LOGIN : 'secret'}}
+
+    def users(self, *blognames, **kwargs):
+        users = [self.user(blogname) for blogname in blognames]
+        for user in users:
+            user.login = kwargs.get('login', LOGIN)
+        return users
+
+    def deploy(self, html, users, **kwargs):
+        return deploy_theme(html, users, workers = 4, baseurl = self.mock.url, **kwargs)
+
+    def test_deploy_and_skip_unchanged(self):
+        users = (self.users('deploy-a', 'deploy-b') +
+                 self.users('deploy-c', login = OTHER_LOGIN))
+        html = u'<html>Déployé</html>'
+
+        results = self.deploy(html, users)
+        self.assertEqual([(result.blogname, result.ok) for result in results],
+                         [('deploy-a', True), ('deploy-b', True), ('deploy-c', True)])
+        # one login per account
+        self.assertEqual(self.requests('POST', 'login'), 2)
+        self.assertEqual(self.requests('POST', 'customize_api'), 3)
+        for user in users:
+            self.assertEqual(self.mock.theme(user.blogname)['custom_theme'], html)
+
+        # deployed already: nothing is sent
+        results = self.deploy(html, users)
+        self.assertTrue(all(result.ok for result in results))
+        self.assertEqual(self.requests('POST', 'customize_api'), 3)
+
+        # ... unless forced, or changed
+        self.deploy(html, users[:1], force = True)
+        self.assertEqual(self.requests('POST', 'customize_api'), 4)
+        self.deploy(u'<html>Changé</html>', users)
+        self.assertEqual(self.requests('POST', 'customize_api'), 7)
+
+    def test_failed_login_fails_its_blogs_only(self):
+        users = self.users('deploy-e') + self.users('deploy-f', login = 'nobody@example.com')
+
+        results = self.deploy(u'<html>e</html>', users, sessionstore = False)
+        self.assertEqual([(result.blogname, result.ok) for result in results],
+                         [('deploy-e', True), ('deploy-f', False)])
+        self.assertIsNotNone(results[1].error)
+
+#//end class DeployThemeTest
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+
+import os
+import unittest
+
+from tumblrpype.export import export_themes, read_settings, read_theme
+from tests.support import MockTumblrTestCase
+
+
+class ExportThemesTest(MockTumblrTestCase):
+
+    def export(self, users, **kwargs):
+        return export_themes(users, self.path, workers = 2, baseurl = self.mock.url, **kwargs)
+
+    def statuses(self, results):
+        return dict((result.blogname, result.status) for result in results)
+
+    def setUp(self):
+        MockTumblrTestCase.setUp(self)
+        self.path = os.path.join(self.workdir, 'export-%s.zip' % self.id())
+
+    def test_export_and_skip(self):
+        users = [self.user('export-a'), self.user('export-b')]
+        self.assertEqual(self.statuses(self.export(users)),
+                         {'export-a' : 'changed', 'export-b' : 'changed'})
+        self.assertIn('{block:Posts}', read_theme(self.path, 'export-a'))
+        self.assertEqual(read_settings(self.path, 'export-b')['name'], 'export-b')
+
+        fetches = self.requests('GET', 'customize')
+        self.assertEqual(self.statuses(self.export(users, maxage = 3600)),
+                         {'export-a' : 'skipped', 'export-b' : 'skipped'})
+        self.assertEqual(self.requests('GET', 'customize'), fetches)
+
+    def test_changed_settings_are_fetched(self):
+        users = [self.user('export-c'), self.user('export-d')]
+        self.export(users)
+
+        session = self.login('export-c')
+        self.assertTrue(session.set_theme_variables({'color:Background' : '#000000'}))
+
+        self.assertEqual(self.statuses(self.export(users, maxage = 3600)),
+                         {'export-c' : 'changed', 'export-d' : 'skipped'})
+        self.assertEqual(read_settings(self.path, 'export-c')['params']['color:Background'], '#000000')
+
+    def test_bad_account_fails_alone(self):
+        good = self.user('export-e')
+        bad = self.user('export-f')
+        bad.login = 'other@example.com'
+        with open(bad.cookiesfile, 'wb') as F:
+            F.write('not a cookies file\n')
+
+        results = self.export([good, bad], sessionstore = False)
+        self.assertEqual(self.statuses(results), {'export-e' : 'changed', 'export-f' : 'failed'})
+        self.assertIsNotNone(results[1].error)
+
+#//end class ExportThemesTest
+
+
+if __name__ == '__main__':
+    unittest.main()
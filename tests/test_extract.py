@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+
+import StringIO
+import os
+import re
+import unittest
+
+import jsonlib
+
+from benchmarks.mockserver import FIXTURES_DIR
+from tumblrpype.extract import extract_edit_form, scan_customize_page
+from tests.support import MockTumblrTestCase
+
+EDIT_PAGE = '''<html><head><meta charset="utf-8"></head><body>
+<input type="hidden" id="upload_id" value="u1">
+<input type="hidden" id="form_key" value="fk">
+<input type="hidden" id="post_type" value="photo">
+<textarea id="post_two">&lt;p&gt;Caf\xc3\xa9 cr\xc3\xa8me &amp; &#233;clair&lt;/p&gt;&#13;</textarea>
+<input type="text" id="post_three" value="">
+<input type="text" id="post_tags" value="caf\xc3\xa9 &amp; bar">
+<input type="text" id="post_date" value="Jan 1st, 2012 12:00pm">
+<input type="text" id="post_source_url" value="">
+<select id="post_state"><option value="private" selected="selected">private</option></select>
+</body></html>'''
+
+
+class EditPageExtractorTest(unittest.TestCase):
+
+    def test_non_ascii_attribute_with_entity(self):
+        # every chunk size splits some multi-byte character somewhere
+        for chunksize in (1, 2, 3, 7, 16 * 1024):
+            fields = extract_edit_form(EDIT_PAGE, chunksize)
+            self.assertEqual(fields['post_tags'], u'café & bar')
+            self.assertEqual(fields['post_two'], u'<p>Café crème & &#233;clair</p>\r')
+            self.assertEqual(fields['post_state'], 'private')
+            self.assertEqual(fields['form_key'], 'fk')
+
+    def test_charset_of_the_page(self):
+        page = EDIT_PAGE.replace('utf-8', 'iso-8859-1').decode('utf-8').encode('iso-8859-1')
+        self.assertEqual(extract_edit_form(page)['post_tags'], u'café & bar')
+
+    def test_unicode_page(self):
+        self.assertEqual(extract_edit_form(EDIT_PAGE.decode('utf-8'))['post_tags'], u'café & bar')
+
+#//end class EditPageExtractorTest
+
+
+class NonASCIIEditPageTest(MockTumblrTestCase):
+
+    def setUp(self):
+        MockTumblrTestCase.setUp(self)
+        self.mock.page('edit_photo')
+        template = self.mock._fixtures['edit_photo']
+        self.mock._fixtures['edit_photo'] = (
+            template.replace('value="photo,benchmark"', 'value="caf\xc3\xa9 &amp; bar"')
+                .replace('A caption for post', 'Une l\xc3\xa9gende &amp; plus, pour'))
+        # read from its file again
+        self.addCleanup(self.mock._fixtures.pop, 'edit_photo', None)
+
+    def test_set_post_state(self):
+        session = self.login()
+        self.assertTrue(session.set_post_state(701, 'private'))
+        self.assertEqual(self.mock.postStates.get('701'), 'private')
+
+#//end class NonASCIIEditPageTest
+
+
+THEME_INFO = {'name' : 'scanner',
+              'title' : u'Brackets { [ and "quotes" \\ é',
+              'custom_theme' : u'<script>var o = {"a" : [1, 2]}; f("});\\n");</script>\n' * 50,
+              'params' : {'color:Background' : '#fff', 'text:Subtitle' : '}]'}}
+
+
+def customize_page(themeInfo = THEME_INFO, padding = 'x' * 40000):
+    with open(os.path.join(FIXTURES_DIR, 'customize.html'), 'rb') as F:
+        template = F.read()
+    values = {'blogname' : 'scanner', 'form_key' : 'fk123', 'padding' : padding,
+              'theme_json' : jsonlib.dumps(themeInfo).encode('utf-8')}
+    return re.sub(r'\{\{(\w+)\}\}', lambda m: values[m.group(1)], template)
+
+
+def old_parse(html):
+    # what the customize page was parsed with before: regexes over the whole page
+    userFormKey = re.search(r'Tumblr\.Customize\.user_form_key\s?=\s?[\'\"]([^\'\"]+)[\'\"];', html).group(1)
+    themeJSON = re.search(r'Tumblr\.Customize\.blog\.set\((.+)(?=\);\n)', html).group(1)
+    return userFormKey, jsonlib.loads(themeJSON)
+
+
+class CustomizePageScannerTest(unittest.TestCase):
+
+    def test_same_as_the_old_parse(self):
+        page = customize_page()
+        expected = old_parse(page)
+        self.assertEqual(expected[1], THEME_INFO)
+
+        for chunksize in (1, 7, 512, 4096, 16 * 1024, len(page)):
+            userFormKey, themeJSON = scan_customize_page(page, chunksize)
+            self.assertEqual((userFormKey, jsonlib.loads(themeJSON)), expected)
+
+    def test_stops_reading_after_the_json(self):
+        data = customize_page() + '<!-- %s -->' % ('y' * 100000)
+        page = StringIO.StringIO(data)
+        self.assertEqual(scan_customize_page(page, 1024)[0], 'fk123')
+        self.assertLess(page.tell(), len(data) - 90000)
+
+    def test_missing(self):
+        self.assertEqual(scan_customize_page('<html>nothing here</html>'), (None, None))
+
+#//end class CustomizePageScannerTest
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,202 @@
+# -*- coding: utf-8 -*-
+
+import BaseHTTPServer
+import collections
+import os
+import tempfile
+import threading
+import unittest
+import urllib2
+
+from tumblrpype.formdata import (CHUNK_SIZE, FileField, MultipartEncoder, MultipartTemplate,
+                                 UrlencodedTemplate, encode_multipart_formdata,
+                                 encode_urlencoded_formdata, get_content_type)
+from tumblrpype.session import ConnectionPool, KeepAliveHandler
+
+FIELDS = [('UPLOAD_IDENTIFIER', None),
+          ('post[state]', None),
+          ('post[slug]', ''),
+          ('custom_tweet', u'Photo: [URL] ♥'),
+          ('MAX_FILE_SIZE', 10485760),
+          ('images', ('', '')),
+          ('post[two]', None),
+          ('post[id]', None)]
+
+VARIABLE = ('UPLOAD_IDENTIFIER', 'post[state]', 'post[two]', 'post[id]')
+
+VALUES = {'UPLOAD_IDENTIFIER' : 'abc123',
+          'post[state]' : '2',
+          'post[two]' : u'caption & <b>été</b>\r\n',
+          'post[id]' : 123}
+
+
+def filled(values):
+    return [(fieldname, values[fieldname] if fieldname in values else value)
+            for fieldname, value in FIELDS]
+
+
+def reference_multipart(fields, boundary):
+    # the encoder formdata had before it streamed (urllib3's filepost), whole
+    # files read in
+    body = []
+    for fieldname, value in fields:
+        body.append('--%s\r\n' % boundary)
+        if isinstance(value, tuple):
+            filename, data = value
+            body.append(u'Content-Disposition: form-data; name="%s"; filename="%s"\r\n'
+                        % (fieldname, filename))
+            body.append('Content-Type: %s\r\n\r\n' % get_content_type(filename))
+        else:
+            data = value
+            body.append(u'Content-Disposition: form-data; name="%s"\r\n\r\n' % fieldname)
+        if isinstance(data, int):
+            data = str(data)
+        body.append(data)
+        body.append('\r\n')
+    body.append('--%s--\r\n' % boundary)
+    return ''.join(part.encode('utf-8') if isinstance(part, unicode) else part for part in body)
+
+
+class MultipartEncoderTest(unittest.TestCase):
+
+    def setUp(self):
+        workdir = tempfile.mkdtemp(prefix = 'tumblrpype-test-')
+        # more than a chunk, and not a whole number of them
+        self.data = os.urandom(2 * CHUNK_SIZE + 1234)
+        self.path = os.path.join(workdir, 'photo.jpg')
+        with open(self.path, 'wb') as F:
+            F.write(self.data)
+
+    def fields(self, F):
+        return [('post[id]', 123),
+                ('post[two]', u'légende & caption'),
+                ('images', ('small.png', '\x89PNG\r\n')),
+                ('photo', FileField(self.path)),
+                ('photo_again', F),
+                ('raw', ('photo.gif', FileField(self.path))),
+                ('form_key', 'fk')]
+
+    def reference(self):
+        return reference_multipart([('post[id]', 123),
+                                    ('post[two]', u'légende & caption'),
+                                    ('images', ('small.png', '\x89PNG\r\n')),
+                                    ('photo', ('photo.jpg', self.data)),
+                                    ('photo_again', ('photo.jpg', self.data)),
+                                    ('raw', ('photo.gif', self.data)),
+                                    ('form_key', 'fk')], 'xyzzy')
+
+    def test_streamed_body_is_the_reference(self):
+        with open(self.path, 'rb') as F:
+            encoder = MultipartEncoder(self.fields(F), boundary = 'xyzzy')
+            body = ''.join(encoder)
+            self.assertEqual(body, self.reference())
+            self.assertEqual(len(encoder), len(body))
+            # and again, for a retry
+            self.assertEqual(''.join(encoder), body)
+
+        self.assertEqual(encoder.content_type, 'multipart/form-data; boundary=xyzzy')
+
+    def test_files_are_read_in_chunks(self):
+        encoder = MultipartEncoder([('photo', FileField(self.path))], boundary = 'xyzzy')
+        self.assertLessEqual(max(len(chunk) for chunk in encoder), CHUNK_SIZE)
+
+    def test_file_object_from_its_position(self):
+        with open(self.path, 'rb') as F:
+            F.seek(1000)
+            field = FileField(F, 'rest.jpg')
+            self.assertEqual(len(field), len(self.data) - 1000)
+            self.assertEqual(''.join(field), self.data[1000:])
+
+    def test_encode_multipart_formdata(self):
+        with open(self.path, 'rb') as F:
+            body, contentType = encode_multipart_formdata(self.fields(F), boundary = 'xyzzy')
+        self.assertEqual(body, self.reference())
+
+    def test_content_length_on_the_wire(self):
+        received = {}
+
+        class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+            def do_POST(self):
+                received['length'] = int(self.headers['Content-Length'])
+                received['body'] = self.rfile.read(received['length'])
+                self.send_response(200)
+                self.send_header('Content-Length', '2')
+                self.end_headers()
+                self.wfile.write('ok')
+
+        server = BaseHTTPServer.HTTPServer(('127.0.0.1', 0), Handler)
+        thread = threading.Thread(target = server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        pool = ConnectionPool()
+        try:
+            with open(self.path, 'rb') as F:
+                encoder = MultipartEncoder(self.fields(F), boundary = 'xyzzy')
+                request = urllib2.Request('http://127.0.0.1:%d/edit' % server.server_port, encoder,
+                                          {'Content-Type' : encoder.content_type})
+                self.assertEqual(urllib2.build_opener(KeepAliveHandler(pool)).open(request).read(), 'ok')
+        finally:
+            pool.close()
+            server.shutdown()
+            server.server_close()
+
+        self.assertEqual(received['body'], self.reference())
+        self.assertEqual(received['length'], len(received['body']))
+
+#//end class MultipartEncoderTest
+
+
+class MultipartTemplateTest(unittest.TestCase):
+
+    def test_fill_is_encode_multipart_formdata(self):
+        template = MultipartTemplate(FIELDS, variable = VARIABLE, boundary = 'xyzzy')
+        body, contentType = encode_multipart_formdata(filled(VALUES), boundary = 'xyzzy')
+        self.assertEqual(template.fill(VALUES), body)
+        self.assertEqual(template.content_type, contentType)
+
+    def test_template_is_reusable(self):
+        template = MultipartTemplate(FIELDS, variable = VARIABLE, boundary = 'xyzzy')
+        values = dict(VALUES, **{'post[id]' : '456', 'post[two]' : ''})
+        template.fill(VALUES)
+        self.assertEqual(template.fill(values),
+                         encode_multipart_formdata(filled(values), boundary = 'xyzzy')[0])
+
+    def test_photo_edit_form(self):
+        from tumblrpype.login import _PHOTO_EDIT_FORM
+
+        values = dict((fieldname, 'value of %s' % fieldname) for fieldname in _PHOTO_EDIT_FORM.variable)
+        body = _PHOTO_EDIT_FORM.fill(values)
+        self.assertTrue(body.startswith('--%s\r\n' % _PHOTO_EDIT_FORM.boundary))
+        self.assertTrue(body.endswith('--%s--\r\n' % _PHOTO_EDIT_FORM.boundary))
+        for fieldname, value in values.iteritems():
+            self.assertIn('name="%s"\r\n\r\n%s\r\n' % (fieldname, value), body)
+
+    def test_file_is_refused(self):
+        with tempfile.TemporaryFile() as F:
+            self.assertRaises(ValueError, MultipartTemplate, [('photo', F)])
+
+#//end class MultipartTemplateTest
+
+
+class UrlencodedTemplateTest(unittest.TestCase):
+
+    def test_fill_is_encode_urlencoded_formdata(self):
+        fields = [(fieldname, value) for fieldname, value in FIELDS if not isinstance(value, tuple)]
+        fields.append(('tags', ['a b', u'é']))
+        template = UrlencodedTemplate(fields, variable = VARIABLE)
+
+        expected = encode_urlencoded_formdata(collections.OrderedDict(
+            (fieldname, VALUES[fieldname] if fieldname in VALUES else value)
+            for fieldname, value in fields))
+        self.assertEqual(template.fill(VALUES), expected)
+
+    def test_empty_form(self):
+        self.assertEqual(UrlencodedTemplate([]).fill({}), encode_urlencoded_formdata({}))
+
+#//end class UrlencodedTemplateTest
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+
+import StringIO
+import sys
+import unittest
+
+from tumblrpype import instrument
+from tumblrpype.instrument import Histogram
+from tests.support import MockTumblrTestCase
+
+
+class InstrumentTestMixin(object):
+
+    def setUp(self):
+        self.events = []
+        instrument.reset()
+        instrument.enable()
+        instrument.add_hook(self.events.append)
+        self.addCleanup(instrument.reset)
+        self.addCleanup(instrument.disable)
+        self.addCleanup(instrument.remove_hook, self.events.append)
+
+    def counters(self):
+        return instrument.stats()['counters']
+
+    def histogram(self, key):
+        return instrument.stats()['histograms'][key]
+
+#//end class InstrumentTestMixin
+
+
+class HistogramTest(unittest.TestCase):
+
+    def test_summary(self):
+        histogram = Histogram()
+        self.assertIsNone(histogram.percentile(0.5))
+        for value in [0.003] * 90 + [0.15] * 9 + [60.0]:
+            histogram.add(value)
+
+        summary = histogram.summary()
+        self.assertEqual((summary['count'], summary['min'], summary['max']), (100, 0.003, 60.0))
+        self.assertAlmostEqual(summary['mean'], (0.27 + 1.35 + 60.0) / 100)
+        # upper bounds of the buckets; past the last one, the largest value
+        self.assertEqual((summary['p50'], summary['p95'], summary['p99']), (0.005, 0.2, 0.2))
+        self.assertEqual(histogram.percentile(1.0), 60.0)
+        self.assertEqual((summary['buckets']['0.005'], summary['buckets']['inf']), (90, 1))
+
+#//end class HistogramTest
+
+
+class CollectTest(InstrumentTestMixin, unittest.TestCase):
+
+    def test_counters_and_timings(self):
+        instrument.emit({'type' : 'http', 'route' : 'edit', 'wait' : 0.03, 'total' : 0.04,
+                         'bytes_sent' : 10, 'bytes_received' : 100, 'bytes_decoded' : 400,
+                         'reused' : True})
+        instrument.emit({'type' : 'http', 'route' : 'edit', 'total' : 0.5, 'bytes_received' : 50,
+                         'error' : 'timeout', 'retries' : 2})
+
+        counters = self.counters()
+        self.assertEqual(counters['http.edit'], 2)
+        self.assertEqual(counters['http.edit.bytes_received'], 150)
+        self.assertEqual(counters['http.edit.bytes_saved'], 300)
+        self.assertEqual(counters['http.edit.reused'], 1)
+        self.assertEqual(counters['http.edit.errors'], 1)
+        self.assertEqual(counters['http.edit.retries'], 2)
+        self.assertEqual(self.histogram('http.edit.total')['count'], 2)
+        self.assertEqual(self.histogram('http.edit.wait')['count'], 1)
+        self.assertEqual(len(self.events), 2)
+
+    def test_timed(self):
+        with instrument.timed('parse', 'page') as event:
+            event['bytes'] = 42
+        try:
+            with instrument.timed('parse', 'page'):
+                raise ValueError('bad page')
+        except ValueError:
+            pass
+
+        self.assertEqual(self.counters()['parse.page'], 2)
+        self.assertEqual(self.counters()['parse.page.bytes'], 42)
+        self.assertEqual(self.counters()['parse.page.errors'], 1)
+        self.assertGreaterEqual(self.events[0]['total'], 0)
+        self.assertIn('bad page', self.events[1]['error'])
+
+    def test_count(self):
+        instrument.count('cache.hit')
+        instrument.count('cache.hit', 2)
+        self.assertEqual(self.counters()['cache.hit'], 3)
+
+        instrument.disable()
+        instrument.count('cache.hit')
+        self.assertEqual(self.counters()['cache.hit'], 3)
+
+    def test_failing_hook_is_reported(self):
+        def broken(event):
+            raise RuntimeError('broken hook')
+        instrument.add_hook(broken)
+        self.addCleanup(instrument.remove_hook, broken)
+
+        stderr = StringIO.StringIO()
+        self.addCleanup(setattr, sys, 'stderr', sys.stderr)
+        sys.stderr = stderr
+        instrument.emit({'type' : 'http', 'route' : 'edit'})
+
+        self.assertIn('broken hook', stderr.getvalue())
+        self.assertEqual(len(self.events), 1)
+
+    def test_off_measures_nothing(self):
+        instrument.remove_hook(self.events.append)
+        instrument.disable()
+        self.assertFalse(instrument.ENABLED)
+        with instrument.timed('parse', 'page') as event:
+            self.assertIsNone(event)
+        self.assertEqual(self.counters(), {})
+
+#//end class CollectTest
+
+
+class RequestEventsTest(InstrumentTestMixin, MockTumblrTestCase):
+
+    MOCK = {'compress' : True}
+
+    def setUp(self):
+        MockTumblrTestCase.setUp(self)
+        InstrumentTestMixin.setUp(self)
+
+    def test_requests_are_counted_and_timed(self):
+        session = self.login()
+        self.assertTrue(session.set_post_state(801, 'private'))
+
+        http = [event for event in self.events if event['type'] == 'http']
+        self.assertEqual([(event['method'], event['route']) for event in http],
+                         [('GET', 'login'), ('POST', 'login'), ('GET', 'edit'), ('POST', 'edit')])
+        for event in http:
+            self.assertEqual(event['status'], 200)
+            self.assertLessEqual(event['wait'], event['total'])
+            self.assertGreater(event['bytes_decoded'], event['bytes_received'])
+
+        counters = self.counters()
+        self.assertEqual((counters['http.login'], counters['http.edit'], counters['parse.edit_page']),
+                         (2, 2, 1))
+        self.assertEqual(counters['http.edit.bytes_received'],
+                         sum(event['bytes_received'] for event in http if event['route'] == 'edit'))
+        self.assertGreater(counters['http.edit.bytes_saved'], 0)
+        self.assertEqual(self.histogram('http.edit.total')['count'], 2)
+        self.assertEqual(self.histogram('parse.edit_page.total')['count'], 1)
+
+#//end class RequestEventsTest
+
+
+if __name__ == '__main__':
+    unittest.main()
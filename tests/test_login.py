@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+
+import os
+import threading
+import unittest
+
+from tests.support import MockTumblrTestCase
+
+
+class LoginTest(MockTumblrTestCase):
+
+    def test_login(self):
+        session = self.login()
+        self.assertTrue(session.logged_in)
+        self.assertEqual(self.requests('POST', 'login'), 1)
+
+    def test_lazy_login_waits_for_a_request(self):
+        session = self.login(lazy = True)
+        self.assertEqual(self.requests('POST', 'login'), 0)
+        self.assertTrue(session.fetch('edit/1'))
+        self.assertEqual(self.requests('POST', 'login'), 1)
+
+    def test_expired_session_get_is_retried(self):
+        session = self.login()
+        self.mock.expire_sessions()
+
+        page = session.fetch('edit/1')
+        self.assertIn('id="edit_post"', page)
+        self.assertEqual(self.requests('POST', 'login'), 2)
+
+    def test_expired_session_post_is_not_replayed(self):
+        session = self.login()
+        fetch = session.fetch
+
+        def fetch_then_expire(uriFrag):
+            # the session expires between the edit page and the edit
+            page = fetch(uriFrag)
+            if self.mock.sessions and self.requests('GET', 'edit') == 1:
+                self.mock.expire_sessions()
+            return page
+        session.fetch = fetch_then_expire
+
+        self.assertTrue(session.set_post_state(7, 'private'))
+        self.assertEqual(self.mock.postStates.get('7'), 'private')
+        # the edit page again (with the new form key), and one edit that went through
+        self.assertEqual(self.requests('GET', 'edit'), 2)
+        self.assertEqual(self.requests('POST', 'edit'), 2)
+        self.assertEqual(self.requests('POST', 'login'), 2)
+
+    def test_expired_session_post_raises(self):
+        from tumblrpype.login import SessionExpiredError
+
+        session = self.login()
+        self.mock.expire_sessions()
+        self.assertRaises(SessionExpiredError, session._open,
+                          '%s/edit/77' % self.mock.url, data = 'post[state]=private')
+        self.assertNotIn('77', self.mock.postStates)
+        # logged in again, for the next request
+        self.assertTrue(session.fetch('edit/77'))
+        self.assertEqual(self.requests('POST', 'login'), 2)
+
+    def test_for_blog_copies_share_the_login(self):
+        session = self.login()
+        others = [session.for_blog('bench%d' % i) for i in range(3)]
+        self.mock.expire_sessions()
+
+        for other in [session] + others:
+            self.assertTrue(other.fetch('edit/1'))
+        # one login again, for all of them
+        self.assertEqual(self.requests('POST', 'login'), 2)
+        self.assertTrue(all(other.logged_in for other in others))
+
+    def test_cached_pages_do_not_outlive_the_login(self):
+        from tumblrpype.httpcache import ResponseCache
+
+        cache = ResponseCache(os.path.join(self.workdir, 'responses-login.db'), ttl = 3600)
+        session = self.login(responsecache = cache)
+        self.assertTrue(session.fetch('edit/1'))
+        self.assertTrue(session.fetch('edit/1'))
+        self.assertEqual(self.requests('GET', 'edit'), 1)
+
+        self.mock.expire_sessions()
+        self.assertTrue(session.fetch('edit/2'))
+        self.assertEqual(self.requests('POST', 'login'), 2)
+
+        # the page of the old login had the old form key
+        edits = self.requests('GET', 'edit')
+        page = session.fetch('edit/1')
+        self.assertEqual(self.requests('GET', 'edit'), edits + 1)
+        formKey = self.mock.formKeys[list(self.mock.sessions)[0]]
+        self.assertIn(formKey, page)
+
+#//end class LoginTest
+
+
+class SlowLoginTest(MockTumblrTestCase):
+
+    # every request is under way at once
+    MOCK = {'latency' : 0.1}
+
+    def test_concurrent_for_blog_copies_login_once(self):
+        session = self.login()
+        others = [session.for_blog('bench%d' % i) for i in range(4)]
+        self.mock.expire_sessions()
+
+        pages = []
+        threads = [threading.Thread(target = lambda other = other: pages.append(other.fetch('edit/1')))
+                   for other in others]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(filter(None, pages)), len(others))
+        self.assertEqual(self.requests('POST', 'login'), 2)
+
+#//end class SlowLoginTest
+
+
+if __name__ == '__main__':
+    unittest.main()
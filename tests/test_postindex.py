@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+
+import os
+import tempfile
+import threading
+import time
+import unittest
+
+from tumblrpype.postindex import PostIndex
+from tests.support import BLOGNAME, MockTumblrTestCase
+
+
+class PostIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.index = PostIndex(os.path.join(tempfile.mkdtemp(prefix = 'tumblrpype-test-'), 'posts.db'))
+
+    def tearDown(self):
+        self.index.close()
+
+    def test_put_and_get(self):
+        self.index.put('blog', 1, 'photo', 'private', 'formkey')
+        post = self.index.get('blog', 1)
+        self.assertEqual((post.id, post.type, post.state), (1, 'photo', 'private'))
+        self.assertNotIn('formkey', post.formkey)
+        self.assertIsNone(self.index.get('other', 1))
+
+    def test_listing_keeps_type_and_form_key(self):
+        self.index.put('blog', 1, 'photo', 'private', 'formkey')
+        self.index.put_many('blog', [(1, None, 'published')])
+        post = self.index.get('blog', 1)
+        self.assertEqual((post.type, post.state), ('photo', 'published'))
+        self.assertIsNotNone(post.formkey)
+
+    def test_in_state_and_maxage(self):
+        self.index.put_many('blog', [(1, 'photo', 'private'), (2, 'photo', 'published')])
+        self.assertEqual(self.index.in_state('blog', [1, 2, 3], 'private'), set([1]))
+
+        time.sleep(0.05)
+        self.assertEqual(self.index.in_state('blog', [1, 2], 'private', maxage = 0.01), set())
+        self.assertEqual(self.index.expire(0.01), 2)
+        self.assertEqual(len(self.index), 0)
+
+    def test_forget(self):
+        self.index.put('blog', 1, 'photo', 'private')
+        self.index.forget('blog', [1])
+        self.assertIsNone(self.index.get('blog', 1))
+
+    def test_threads_create_the_database_at_once(self):
+        errors = []
+        def put(postID):
+            try:
+                self.index.put('blog', postID, 'photo', 'private')
+            except Exception as e:
+                errors.append(e)
+            finally:
+                self.index.close()
+
+        threads = [threading.Thread(target = put, args = (postID,)) for postID in range(16)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(len(self.index), 16)
+
+#//end class PostIndexTest
+
+
+class SetPostStateIndexTest(MockTumblrTestCase):
+
+    def setUp(self):
+        MockTumblrTestCase.setUp(self)
+        self.index = PostIndex(os.path.join(self.workdir, 'posts-%s.db' % self.id()))
+
+    def test_index_is_not_trusted_by_default(self):
+        # tumblrpype saw it private, but it was published on the web since
+        self.index.put(BLOGNAME, 501, 'photo', 'private')
+        session = self.login(postindex = self.index)
+
+        self.assertTrue(session.set_post_state(501, 'private'))
+        self.assertEqual(self.mock.postStates.get('501'), 'private')
+        self.assertEqual(self.requests('POST', 'edit'), 1)
+
+    def test_index_trusted_with_postmaxage(self):
+        self.index.put(BLOGNAME, 502, 'photo', 'private')
+        session = self.login(postindex = self.index, postmaxage = 60)
+
+        self.assertTrue(session.set_post_state(502, 'private'))
+        self.assertEqual(self.requests('GET', 'edit'), 0)
+
+    def test_post_in_state_is_not_saved_again(self):
+        session = self.login(postindex = self.index)
+        self.assertTrue(session.set_post_state(503, 'private'))
+        self.assertTrue(session.set_post_state(503, 'private'))
+        self.assertEqual(self.requests('GET', 'edit'), 2)
+        self.assertEqual(self.requests('POST', 'edit'), 1)
+        self.assertEqual(self.index.get(BLOGNAME, 503).state, 'private')
+
+#//end class SetPostStateIndexTest
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+
+from tumblrpype.posts import iter_posts, make_cursor, parse_cursor
+
+
+class _StubSession(object):
+    """Serves a fixed post listing: a list of pages of post IDs."""
+
+    blogname = 'stub'
+
+    def __init__(self, pages):
+        self.pages = pages
+
+    def _fetch_post_page(self, page):
+        if page > len(self.pages):
+            return []
+        return [(postID, 'photo', 'published') for postID in self.pages[page - 1]]
+
+
+def _ids(session, **kwargs):
+    return [post.id for post in iter_posts(session, **kwargs)]
+
+
+class IterPostsTest(unittest.TestCase):
+
+    def test_lists_every_page(self):
+        session = _StubSession([[30, 29, 28], [27, 26, 25], [24]])
+        self.assertEqual(_ids(session), [30, 29, 28, 27, 26, 25, 24])
+
+    def test_backdated_post_is_not_lost(self):
+        # listed by post date: post 20 was backdated below 9
+        session = _StubSession([[10, 9], [20, 8]])
+        self.assertEqual(_ids(session), [10, 9, 20, 8])
+
+    def test_post_pushed_down_a_page_is_listed_once(self):
+        session = _StubSession([[10, 9], [9, 8]])
+        self.assertEqual(_ids(session), [10, 9, 8])
+
+    def test_maxpages(self):
+        session = _StubSession([[6, 5], [4, 3], [2, 1]])
+        self.assertEqual(_ids(session, maxpages = 2), [6, 5, 4, 3])
+
+    def test_resume_after_cursor(self):
+        session = _StubSession([[6, 5], [4, 3], [2, 1]])
+        posts = list(iter_posts(session))
+        self.assertEqual(_ids(session, cursor = posts[2].cursor), [3, 2, 1])
+
+    def test_resume_after_backdated_post(self):
+        session = _StubSession([[10, 9], [20, 8], [7]])
+        posts = list(iter_posts(session))
+        self.assertEqual(posts[2].id, 20)
+        self.assertEqual(_ids(session, cursor = posts[2].cursor), [8, 7])
+
+    def test_resume_when_listing_moved_up(self):
+        session = _StubSession([[6, 5], [4, 3], [2, 1]])
+        cursor = list(iter_posts(session))[3].cursor
+        # post 6 and 5 deleted meanwhile: 3 is on the first page now
+        session.pages = [[4, 3], [2, 1]]
+        self.assertEqual(_ids(session, cursor = cursor), [2, 1])
+
+    def test_resume_when_post_is_gone(self):
+        session = _StubSession([[6, 5], [4, 3], [2, 1]])
+        cursor = list(iter_posts(session))[2].cursor
+        # post 4 deleted, and one added in its place
+        session.pages = [[6, 5], [11, 3], [2, 1]]
+        self.assertEqual(_ids(session, cursor = cursor), [3, 2, 1])
+
+    def test_cursor_roundtrip(self):
+        self.assertEqual(parse_cursor(make_cursor(3, 7, 12345)), (3, 7, 12345))
+        self.assertRaises(ValueError, parse_cursor, '3:12345')
+        self.assertRaises(ValueError, parse_cursor, None)
+
+#//end class IterPostsTest
+
+
+if __name__ == '__main__':
+    unittest.main()
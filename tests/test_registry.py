@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+
+import os
+import tempfile
+import unittest
+
+from tumblrpype.config import _CONFIG_DIR
+from tumblrpype.registry import AccountRegistry
+from tumblrpype.user import TumblrUser
+
+
+def old_layout_blog(configdir, blogname, login, password = 'secret'):
+    # what TumblrUser.save() used to write
+    userDir = os.path.join(configdir, blogname)
+    os.mkdir(userDir)
+    with open(os.path.join(userDir, 'credentials'), 'wb') as F:
+        F.write('%s\n%s\n%s\n' % (login, password, blogname))
+    with open(os.path.join(userDir, 'cookies'), 'wb') as F:
+        F.write('#LWP-Cookies-2.0\n')
+    return userDir
+
+
+class MigrateTest(unittest.TestCase):
+
+    def setUp(self):
+        self.configdir = tempfile.mkdtemp(prefix = 'tumblrpype-test-')
+        self.registry = AccountRegistry(configdir = self.configdir)
+
+    def test_migrate_old_layout(self):
+        userDir = old_layout_blog(self.configdir, 'old-a', 'a@example.com')
+        old_layout_blog(self.configdir, 'old-b', 'b@example.com')
+        old_layout_blog(self.configdir, 'old-c', 'a@example.com')
+        # not blogs
+        os.mkdir(os.path.join(self.configdir, 'themes'))
+        with open(os.path.join(self.configdir, 'sessions.db'), 'wb') as F:
+            F.write('')
+
+        self.assertEqual(self.registry.migrate(), 3)
+        self.assertEqual(len(self.registry), 3)
+
+        user = self.registry.get('old-a')
+        self.assertEqual((user.login, user.password, user.blogname),
+                         ('a@example.com', 'secret', 'old-a'))
+        # still the session it was stored under
+        self.assertEqual(user.cookiesfile, os.path.join(userDir, 'cookies'))
+        self.assertEqual(self.registry.blognames(login = 'a@example.com'), ['old-a', 'old-c'])
+
+    def test_registered_blogs_are_left_alone(self):
+        old_layout_blog(self.configdir, 'old-d', 'd@example.com', password = 'old')
+        self.assertEqual(self.registry.migrate(), 1)
+
+        user = self.registry.get('old-d')
+        user.password = 'new'
+        self.registry.put(user)
+
+        self.assertEqual(self.registry.migrate(), 0)
+        self.assertEqual(self.registry.get('old-d').password, 'new')
+
+    def test_only_the_blognames_given(self):
+        old_layout_blog(self.configdir, 'old-e', 'e@example.com')
+        old_layout_blog(self.configdir, 'old-f', 'f@example.com')
+
+        self.assertEqual(self.registry.migrate(['old-f', 'missing']), 1)
+        self.assertEqual(self.registry.blognames(), ['old-f'])
+
+    def test_no_config_dir(self):
+        registry = AccountRegistry(os.path.join(self.configdir, 'accounts-nodir.db'),
+                                   configdir = os.path.join(self.configdir, 'missing'))
+        self.assertEqual(registry.migrate(), 0)
+
+#//end class MigrateTest
+
+
+class UserLoadTest(unittest.TestCase):
+
+    def test_load_migrates_the_blog(self):
+        old_layout_blog(_CONFIG_DIR, 'old-load', 'load@example.com')
+
+        user = TumblrUser()
+        user.load('old-load')
+        self.assertEqual((user.login, user.blogname), ('load@example.com', 'old-load'))
+
+    def test_unknown_blog(self):
+        self.assertRaises(IOError, TumblrUser().load, 'no-such-blog')
+
+#//end class UserLoadTest
+
+
+if __name__ == '__main__':
+    unittest.main()
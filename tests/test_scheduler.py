@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+
+import email.utils
+import os
+import tempfile
+import time
+import unittest
+import urlparse
+
+from tumblrpype.scheduler import MIN_RATE, RequestScheduler, TokenBucket, retry_after
+from tests.support import MockTumblrTestCase
+
+
+class TokenBucketTest(unittest.TestCase):
+
+    def test_paced(self):
+        bucket = TokenBucket(rate = 10, burst = 1)
+        self.assertEqual(bucket.take(), 0.0)
+        # (less whatever time passed in between)
+        second = bucket.take()
+        third = bucket.take()
+        self.assertTrue(0.05 < second <= 0.1, second)
+        self.assertTrue(0.15 < third <= 0.2, third)
+
+    def test_unpaced_until_throttled(self):
+        bucket = TokenBucket()
+        for i in range(20):
+            self.assertEqual(bucket.take(), 0.0)
+        self.assertEqual(bucket.rate(), 0.0)
+
+        # pacing starts from (below) the rate requests were going out at
+        rate = bucket.throttled()
+        self.assertGreater(rate, MIN_RATE)
+        self.assertEqual(bucket.rate(), rate)
+        self.assertGreater(bucket.take(), 0.0)
+
+    def test_throttled_and_succeeded(self):
+        bucket = TokenBucket(rate = 10)
+        self.assertAlmostEqual(bucket.throttled(), 7.0)
+        self.assertAlmostEqual(bucket.throttled(), 4.9)
+
+        bucket.succeeded()
+        self.assertAlmostEqual(bucket.rate(), 4.9 * 1.02)
+        for i in range(100):
+            bucket.succeeded()
+        # never past the configured rate
+        self.assertEqual(bucket.rate(), 10)
+
+    def test_never_below_min_rate(self):
+        bucket = TokenBucket(rate = 1)
+        for i in range(50):
+            bucket.throttled()
+        self.assertEqual(bucket.rate(), MIN_RATE)
+
+    def test_retry_after_blocks(self):
+        bucket = TokenBucket(rate = 100, burst = 100)
+        bucket.throttled(retryAfter = 5)
+        self.assertAlmostEqual(bucket.take(), 5, delta = 0.1)
+
+    def test_state_is_shared_through_the_file(self):
+        path = os.path.join(tempfile.mkdtemp(prefix = 'tumblrpype-test-'), 'www.tumblr.com')
+        one = TokenBucket(path = path)
+        other = TokenBucket(path = path)
+        self.assertEqual(one.take(), 0.0)
+        self.assertEqual(other.take(), 0.0)
+
+        rate = one.throttled(retryAfter = 2)
+        self.assertEqual(other.rate(), rate)
+        self.assertAlmostEqual(other.take(), 2, delta = 0.1)
+
+#//end class TokenBucketTest
+
+
+class RetryAfterTest(unittest.TestCase):
+
+    def test_seconds(self):
+        self.assertEqual(retry_after('120'), 120.0)
+        self.assertEqual(retry_after('0'), 0.0)
+
+    def test_http_date(self):
+        self.assertAlmostEqual(retry_after(email.utils.formatdate(time.time() + 30, usegmt = True)),
+                               30, delta = 1.5)
+        # in the past: no need to wait
+        self.assertEqual(retry_after('Wed, 21 Oct 2015 07:28:00 GMT'), 0.0)
+
+    def test_missing_or_invalid(self):
+        self.assertIsNone(retry_after(None))
+        self.assertIsNone(retry_after(''))
+        self.assertIsNone(retry_after('soon'))
+
+#//end class RetryAfterTest
+
+
+class RequestSchedulerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.scheduler = RequestScheduler(retries = 3, shared = False)
+
+    def test_idempotent_requests_are_retried(self):
+        self.assertTrue(self.scheduler.should_retry('GET', 0, 503))
+        self.assertTrue(self.scheduler.should_retry('GET', 2))
+        self.assertFalse(self.scheduler.should_retry('GET', 3, 503))
+
+    def test_non_idempotent_requests_only_after_429(self):
+        self.assertTrue(self.scheduler.should_retry('POST', 0, 429))
+        self.assertFalse(self.scheduler.should_retry('POST', 0, 503))
+        self.assertFalse(self.scheduler.should_retry('POST', 0))
+        self.assertFalse(self.scheduler.should_retry('POST', 3, 429))
+
+    def test_retry_delay(self):
+        for attempt in range(5):
+            self.assertLessEqual(self.scheduler.retry_delay(attempt), 0.5 * 2 ** attempt)
+        self.assertEqual(self.scheduler.retry_delay(0, retryAfter = 10), 10)
+        self.assertEqual(self.scheduler.retry_delay(0, retryAfter = 3600), 30.0)
+
+#//end class RequestSchedulerTest
+
+
+class ThrottledMockTest(MockTumblrTestCase):
+
+    MOCK = {'ratelimit' : 40}
+
+    def test_throttled_requests_are_paced_and_retried(self):
+        scheduler = RequestScheduler(retries = 5, backoff = 0.05, shared = False)
+        session = self.login(scheduler = scheduler)
+
+        for postID in range(30):
+            self.assertTrue(session.fetch('edit/%d' % postID))
+        self.assertGreater(scheduler.stats['throttled'], 0)
+        self.assertGreater(scheduler.bucket(urlparse.urlparse(self.mock.url).netloc).rate(), 0)
+
+#//end class ThrottledMockTest
+
+
+if __name__ == '__main__':
+    unittest.main()
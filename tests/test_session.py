@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+
+import BaseHTTPServer
+import SocketServer
+import collections
+import threading
+import unittest
+import urllib2
+import zlib
+
+from benchmarks.mockserver import SESSION_COOKIE
+from tumblrpype.session import ConnectionPool, KeepAliveHandler, _Decoder, gzip_compress
+from tests.support import MockTumblrTestCase
+
+
+class _Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+    # keep-alive; '/drop' paths are read, then hung up on without an answer
+    # - the first time only
+
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def _handle(self):
+        server = self.server
+        length = int(self.headers.get('Content-Length') or 0)
+        if length:
+            self.rfile.read(length)
+
+        with server.lock:
+            server.received[(self.command, self.path)] += 1
+            drop = self.path.startswith('/drop') and self.path not in server.dropped
+            if drop:
+                server.dropped.add(self.path)
+
+        if drop:
+            self.close_connection = 1
+            return
+
+        body = 'ok'
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_GET = do_POST = _handle
+
+#//end class _Handler
+
+
+class _Server(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class KeepAliveRetryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = _Server(('127.0.0.1', 0), _Handler)
+        self.server.lock = threading.Lock()
+        self.server.received = collections.Counter()
+        self.server.dropped = set()
+        thread = threading.Thread(target = self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+        self.url = 'http://127.0.0.1:%d' % self.server.server_port
+        self.pool = ConnectionPool()
+        self.opener = urllib2.build_opener(KeepAliveHandler(self.pool))
+
+    def tearDown(self):
+        self.pool.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def open(self, path, data = None):
+        return self.opener.open(self.url + path, data = data).read()
+
+    def test_connection_is_reused(self):
+        self.open('/a')
+        self.open('/b')
+        self.assertEqual(self.pool.stats['opened'], 1)
+        self.assertEqual(self.pool.stats['reused'], 1)
+
+    def test_dropped_get_is_retried(self):
+        self.open('/a')
+        self.assertEqual(self.open('/drop-get'), 'ok')
+        self.assertEqual(self.server.received[('GET', '/drop-get')], 2)
+
+    def test_dropped_post_is_not_sent_again(self):
+        self.open('/a')
+        self.assertRaises(urllib2.URLError, self.open, '/drop-post', 'x=1')
+        self.assertEqual(self.server.received[('POST', '/drop-post')], 1)
+
+#//end class KeepAliveRetryTest
+
+
+class DecoderTest(unittest.TestCase):
+
+    PAGE = ''.join('<p>line %d</p>\n' % i for i in range(5000))
+
+    def decode(self, encoding, data, chunksize = 1000):
+        decoder = _Decoder(encoding)
+        chunks = [decoder.decompress(data[i:i + chunksize]) for i in xrange(0, len(data), chunksize)]
+        return ''.join(chunks) + decoder.flush()
+
+    def test_gzip(self):
+        self.assertEqual(self.decode('gzip', gzip_compress(self.PAGE)), self.PAGE)
+
+    def test_deflate(self):
+        self.assertEqual(self.decode('deflate', zlib.compress(self.PAGE)), self.PAGE)
+
+    def test_raw_deflate(self):
+        compressor = zlib.compressobj(6, zlib.DEFLATED, -zlib.MAX_WBITS)
+        data = compressor.compress(self.PAGE) + compressor.flush()
+        self.assertEqual(self.decode('deflate', data), self.PAGE)
+
+#//end class DecoderTest
+
+
+class CompressedResponseTest(MockTumblrTestCase):
+
+    MOCK = {'compress' : True}
+
+    def test_pages_decode(self):
+        session = self.login()
+        mockSession = [cookie.value for cookie in session.cookieJar if cookie.name == SESSION_COOKIE][0]
+
+        # (bigger than a decoded chunk)
+        page = session.fetch('edit/3')
+        self.assertGreater(len(page), 64 * 1024)
+        self.assertEqual(page, self.mock.edit_page('3', mockSession))
+
+    def test_compressed_request_is_taken(self):
+        session = self.login(compressrequests = True)
+        self.assertTrue(session.set_post_state(811, 'private'))
+        self.assertEqual(self.requests('POST', 'edit'), 1)
+
+#//end class CompressedResponseTest
+
+
+class DeflatedResponseTest(CompressedResponseTest):
+
+    MOCK = {'compress' : 'deflate'}
+
+#//end class DeflatedResponseTest
+
+
+class CompressedRequestTest(MockTumblrTestCase):
+
+    def test_415_resends_uncompressed_once(self):
+        session = self.login(compressrequests = True)
+
+        self.assertTrue(session.set_post_state(801, 'private'))
+        self.assertEqual(self.mock.postStates.get('801'), 'private')
+        self.assertEqual(self.requests('POST', 'edit'), 2)
+
+        # this host is known not to take them now
+        self.assertTrue(session.set_post_state(802, 'private'))
+        self.assertEqual(self.requests('POST', 'edit'), 3)
+
+#//end class CompressedRequestTest
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+
+import tempfile
+import unittest
+
+from tumblrpype import themecache
+from tumblrpype.themecache import ThemeInfoCache
+from tests.support import MockTumblrTestCase
+
+THEME_INFO = {'name' : 'blog', 'id' : 'blog', 'user_form_key' : 'fk',
+              'params' : {'color:Background' : '#fff'}, 'custom_theme' : u'<html></html>'}
+
+
+class ThemeInfoCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.configdir = tempfile.mkdtemp(prefix = 'tumblrpype-test-')
+        self.cache = ThemeInfoCache('a@example.com', self.configdir)
+
+    def forget_memory(self):
+        # as if in another process
+        with themecache._LOCK:
+            for key in list(themecache._MEMORY):
+                if key[0] == self.configdir:
+                    del themecache._MEMORY[key]
+
+    def test_miss_and_hit(self):
+        self.assertIsNone(self.cache.get('blog'))
+        self.cache.put('blog', THEME_INFO)
+
+        themeInfo = self.cache.get('blog')
+        self.assertEqual(themeInfo['user_form_key'], 'fk')
+        # the Theme HTML isn't kept
+        self.assertNotIn('custom_theme', themeInfo)
+
+        # a copy: changing it doesn't change the cache
+        themeInfo['params']['color:Background'] = '#000'
+        self.assertEqual(self.cache.get('blog')['params']['color:Background'], '#fff')
+
+    def test_kept_on_disk(self):
+        self.cache.put('blog', THEME_INFO)
+        self.forget_memory()
+        self.assertEqual(ThemeInfoCache('a@example.com', self.configdir).get('blog')['params'], THEME_INFO['params'])
+
+    def test_invalidate(self):
+        self.cache.put('blog', THEME_INFO)
+        self.cache.invalidate('blog')
+        self.assertIsNone(self.cache.get('blog'))
+        self.forget_memory()
+        self.assertIsNone(self.cache.get('blog'))
+
+    def test_update_keeps_the_form_key(self):
+        self.cache.put('blog', THEME_INFO)
+        self.cache.update('blog', {'name' : 'blog', 'params' : {'color:Background' : '#000'}}, 'fk')
+        themeInfo = self.cache.get('blog')
+        self.assertEqual((themeInfo['user_form_key'], themeInfo['params']['color:Background']),
+                         ('fk', '#000'))
+
+    def test_no_form_key_not_cached(self):
+        self.cache.put('blog', {'name' : 'blog'})
+        self.assertIsNone(self.cache.get('blog'))
+
+    def test_kept_per_account(self):
+        other = ThemeInfoCache('b@example.com', self.configdir)
+        self.cache.put('blog', THEME_INFO)
+        self.assertIsNone(other.get('blog'))
+
+        other.put('blog', dict(THEME_INFO, user_form_key = 'other'))
+        other.invalidate('blog')
+        self.forget_memory()
+        self.assertEqual(self.cache.get('blog')['user_form_key'], 'fk')
+
+#//end class ThemeInfoCacheTest
+
+
+class SaveThemeCacheTest(MockTumblrTestCase):
+
+    def test_second_save_uses_the_cache(self):
+        session = self.login('cache-hit')
+        self.assertTrue(session.save_theme_html(u'<html>one</html>'))
+        self.assertTrue(session.save_theme_html(u'<html>two</html>'))
+
+        self.assertEqual(self.requests('GET', 'customize'), 1)
+        self.assertEqual(self.requests('POST', 'customize_api'), 2)
+        self.assertEqual(self.mock.theme('cache-hit')['custom_theme'], u'<html>two</html>')
+
+    def test_stale_form_key_is_refetched(self):
+        session = self.login('cache-stale')
+        self.assertTrue(session.save_theme_html(u'<html>one</html>'))
+
+        # a new login, with a new form key: the cached one is refused
+        self.mock.expire_sessions()
+        self.assertTrue(session.save_theme_html(u'<html>two</html>'))
+        self.assertEqual(self.requests('GET', 'customize'), 2)
+        self.assertEqual(self.mock.theme('cache-stale')['custom_theme'], u'<html>two</html>')
+
+        # ... and the cache holds the new one
+        self.assertTrue(session.save_theme_html(u'<html>three</html>'))
+        self.assertEqual(self.requests('GET', 'customize'), 2)
+
+#//end class SaveThemeCacheTest
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+
+import StringIO
+import unittest
+
+import jsonlib
+
+from tumblrpype.themejson import LAZY, LOAD, SKIP, LazyJSONString, ThemeBody, parse_theme_json
+
+HTML = (u'<html>\n\t<title>{Title} "été"</title>\r\n'
+        u'<script>var s = "a\\\\b";\x01</script></html>\n').encode('utf-8')
+
+THEME_INFO = {'id' : 42,
+              'title' : u'My ♥ blog',
+              'params' : {'color:Text' : '#000', 'custom_theme' : 'not this one'},
+              'custom_theme' : 'the old theme'}
+
+
+def theme_json(themeInfo = THEME_INFO, html = HTML):
+    return jsonlib.dumps(dict(themeInfo, custom_theme = html.decode('utf-8'))).encode('utf-8')
+
+
+class ThemeBodyTest(unittest.TestCase):
+
+    def test_body_is_the_json(self):
+        for chunksize in (1, 3, 7, 1024):
+            body = ThemeBody(THEME_INFO, HTML, chunksize = chunksize)
+            data = ''.join(body)
+            self.assertEqual(len(body), len(data))
+            self.assertEqual(jsonlib.loads(data), jsonlib.loads(theme_json()))
+
+    def test_no_settings(self):
+        body = ''.join(ThemeBody({}, u'<b>é</b>'))
+        self.assertEqual(jsonlib.loads(body), {'custom_theme' : u'<b>é</b>'})
+
+    def test_body_can_be_sent_again(self):
+        body = ThemeBody(THEME_INFO, HTML, chunksize = 5)
+        self.assertEqual(''.join(body), ''.join(body))
+
+    def test_html_must_be_utf8(self):
+        self.assertRaises(UnicodeDecodeError, ThemeBody, THEME_INFO, '\xff<html>')
+
+#//end class ThemeBodyTest
+
+
+class ParseThemeJSONTest(unittest.TestCase):
+
+    def parse(self, data, theme, chunksize):
+        return parse_theme_json(StringIO.StringIO(data), theme = theme, chunksize = chunksize)
+
+    def test_lazy(self):
+        for chunksize in (1, 2, 5, 64 * 1024):
+            themeInfo = self.parse(theme_json(), LAZY, chunksize)
+            self.assertIsInstance(themeInfo['custom_theme'], LazyJSONString)
+            self.assertEqual(themeInfo['custom_theme'].value(), HTML.decode('utf-8'))
+            self.assertEqual(dict(themeInfo, custom_theme = None),
+                             dict(jsonlib.loads(theme_json()), custom_theme = None))
+
+    def test_skip(self):
+        for chunksize in (1, 3, 64 * 1024):
+            themeInfo = self.parse(theme_json(), SKIP, chunksize)
+            self.assertNotIn('custom_theme', themeInfo)
+            # only the top-level field is left out
+            self.assertEqual(themeInfo['params']['custom_theme'], 'not this one')
+            self.assertEqual(themeInfo['title'], THEME_INFO['title'])
+
+    def test_load(self):
+        self.assertEqual(self.parse(theme_json(), LOAD, 4), jsonlib.loads(theme_json()))
+
+    def test_escapes_split_across_chunks(self):
+        html = '\\' * 9 + '"' * 3 + '\\"'
+        data = theme_json({'id' : 1}, html)
+        for chunksize in xrange(1, 8):
+            themeInfo = self.parse(data, LAZY, chunksize)
+            self.assertEqual(themeInfo['custom_theme'].value(), html)
+
+    def test_roundtrip(self):
+        themeInfo = self.parse(''.join(ThemeBody(THEME_INFO, HTML)), LAZY, 16)
+        self.assertEqual(themeInfo['custom_theme'].value().encode('utf-8'), HTML)
+
+#//end class ParseThemeJSONTest
+
+
+if __name__ == '__main__':
+    unittest.main()
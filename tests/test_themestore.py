@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from tumblrpype.themestore import DEPLOYED, FETCHED, ThemeStore
+from tests.support import MockTumblrTestCase
+
+
+class ThemeStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.configdir = tempfile.mkdtemp(prefix = 'tumblrpype-test-')
+        self.store = ThemeStore('a@example.com', 'blog', self.configdir)
+
+    def test_add_and_load(self):
+        themeHash = self.store.add(u'<html>é</html>', DEPLOYED)
+        self.assertEqual(self.store.load(themeHash[:8]), u'<html>é</html>'.encode('utf-8'))
+        self.assertEqual(self.store.current().hash, themeHash)
+
+    def test_fetched_is_not_current(self):
+        self.store.add('<html>A</html>', FETCHED)
+        self.assertFalse(self.store.is_current('<html>A</html>'))
+
+    def test_deployed_is_current(self):
+        self.store.add('<html>A</html>', DEPLOYED)
+        self.assertTrue(self.store.is_current('<html>A</html>'))
+        self.assertFalse(self.store.is_current('<html>B</html>'))
+
+        # seen live again since: still current
+        self.store.add('<html>A</html>', FETCHED)
+        self.assertTrue(self.store.is_current('<html>A</html>'))
+
+    def test_replaced_since_deployed(self):
+        self.store.add('<html>A</html>', DEPLOYED)
+        self.store.add('<html>B</html>', FETCHED)
+        self.assertFalse(self.store.is_current('<html>A</html>'))
+        self.assertEqual(self.store.last_deployed().hash, self.store.history(DEPLOYED)[-1].hash)
+
+    def test_kept_per_account(self):
+        self.store.add('<html>A</html>', DEPLOYED)
+        other = ThemeStore('b@example.com', 'blog', self.configdir)
+        self.assertIsNone(other.current())
+        self.assertFalse(other.is_current('<html>A</html>'))
+
+    def test_old_store_is_moved(self):
+        themeHash = self.store.add('<html>A</html>', DEPLOYED)
+        # where it used to be kept
+        shutil.move(self.store.storeDir, os.path.join(self.configdir, 'old-blog', 'themes'))
+
+        store = ThemeStore('a@example.com', 'old-blog', self.configdir)
+        self.assertEqual(store.current().hash, themeHash)
+        self.assertEqual(store.load(themeHash), '<html>A</html>')
+        self.assertFalse(os.path.exists(os.path.join(self.configdir, 'old-blog', 'themes')))
+
+#//end class ThemeStoreTest
+
+
+class SaveThemeSkipTest(MockTumblrTestCase):
+
+    def test_fetched_theme_is_saved(self):
+        session = self.login('skip-fetched')
+        html = session.get_theme_html()
+
+        ret = session.save_theme_html(html)
+        self.assertIsInstance(ret, dict)
+        self.assertEqual(self.requests('POST', 'customize_api'), 1)
+
+    def test_deployed_theme_is_skipped(self):
+        session = self.login('skip-deployed')
+        html = u'<html>Déployé</html>'
+
+        saved = session.save_theme_html(html)
+        self.assertEqual(saved['custom_theme'].value(), html)
+        skipped = session.save_theme_html(html)
+        self.assertEqual(self.requests('POST', 'customize_api'), 1)
+
+        # the same kind of answer as a save
+        self.assertIsInstance(skipped, dict)
+        self.assertEqual(skipped['custom_theme'].value(), html)
+        self.assertEqual(skipped['name'], saved['name'])
+
+        self.assertTrue(session.save_theme_html(html, force = True))
+        self.assertEqual(self.requests('POST', 'customize_api'), 2)
+
+#//end class SaveThemeSkipTest
+
+
+if __name__ == '__main__':
+    unittest.main()
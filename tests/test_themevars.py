@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+
+import threading
+import unittest
+
+from tumblrpype.themevars import (apply_theme_variables, coalesce, merge_theme_variables,
+                                  parse_assignments)
+from tests.support import BLOGNAME, MockTumblrTestCase
+
+
+def _theme():
+    return {'params' : {'color:Background' : '#ffffff', 'if:Show avatar' : 1}}
+
+
+class ThemeVariablesTest(unittest.TestCase):
+
+    def test_parse_assignments(self):
+        self.assertEqual(parse_assignments(['color:Background=#000', 'if:Show avatar=no']),
+                         {u'color:Background' : u'#000', u'if:Show avatar' : 0})
+        self.assertRaises(ValueError, parse_assignments, ['color:Background'])
+        self.assertRaises(ValueError, parse_assignments, ['if:Show avatar=maybe'])
+
+    def test_apply(self):
+        themeInfo = _theme()
+        self.assertEqual(apply_theme_variables(themeInfo, {'color:Background' : '#000'}),
+                         ['color:Background'])
+        self.assertEqual(apply_theme_variables(themeInfo, {'color:Background' : '#000'}), [])
+        self.assertRaises(KeyError, apply_theme_variables, themeInfo, {'nope' : 1})
+
+    def test_merge_keeps_bad_calls_out(self):
+        changes, errors = merge_theme_variables(_theme(), [{'color:Background' : '#111'},
+                                                           {'color:Background' : '#222', 'nope' : 1},
+                                                           {'if:Show avatar' : 'maybe'},
+                                                           {'if:Show avatar' : 'no'}])
+        self.assertEqual(changes, {'color:Background' : '#111', 'if:Show avatar' : 0})
+        self.assertIsNone(errors[0])
+        self.assertIsInstance(errors[1], KeyError)
+        self.assertIsInstance(errors[2], ValueError)
+        self.assertIsNone(errors[3])
+
+    def test_coalesce_gives_each_call_its_result(self):
+        writes = []
+        def write(changesList):
+            writes.append(list(changesList))
+            return [ValueError('bad') if 'bad' in changes else len(changesList)
+                    for changes in changesList]
+
+        results = {}
+        def call(name):
+            try:
+                results[name] = coalesce('key', {name : 1}, write, delay = 0.2)
+            except ValueError as e:
+                results[name] = e
+
+        threads = [threading.Thread(target = call, args = (name,)) for name in ('a', 'bad', 'c')]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(writes), 1)
+        self.assertEqual(results['a'], 3)
+        self.assertEqual(results['c'], 3)
+        self.assertIsInstance(results['bad'], ValueError)
+
+    def test_coalesce_write_error_goes_to_every_call(self):
+        def write(changesList):
+            raise IOError('down')
+        self.assertRaises(IOError, coalesce, 'key-error', {'a' : 1}, write, delay = 0)
+
+    def test_lone_call_does_not_wait(self):
+        import tumblrpype.themevars as themevars
+
+        sleeps = []
+        sleep = themevars.time.sleep
+        themevars.time.sleep = sleeps.append
+        try:
+            self.assertEqual(coalesce('key-alone', {'a' : 1}, lambda changesList: [True]), True)
+        finally:
+            themevars.time.sleep = sleep
+        self.assertEqual(sleeps, [])
+
+#//end class ThemeVariablesTest
+
+
+class SetThemeVariablesTest(MockTumblrTestCase):
+
+    def test_unknown_variable_fails_only_its_call(self):
+        session = self.login()
+        results = {}
+
+        def call(name, changes):
+            try:
+                results[name] = session.set_theme_variables(changes, coalesce = 0.2)
+            except KeyError as e:
+                results[name] = e
+
+        threads = [threading.Thread(target = call, args = ('good', {'color:Background' : '#123456'})),
+                   threading.Thread(target = call, args = ('bad', {'color:Nope' : '#000000'})),
+                   threading.Thread(target = call, args = ('also good', {'text:Subtitle' : 'hi'}))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertIsInstance(results['bad'], KeyError)
+        self.assertTrue(results['good'])
+        self.assertTrue(results['also good'])
+        params = self.mock.theme(BLOGNAME)['params']
+        self.assertEqual(params['color:Background'], '#123456')
+        self.assertEqual(params['text:Subtitle'], 'hi')
+        self.assertEqual(self.requests('POST', 'customize_api'), 1)
+
+#//end class SetThemeVariablesTest
+
+
+if __name__ == '__main__':
+    unittest.main()
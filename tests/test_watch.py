@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+
+import Queue
+import os
+import threading
+import unittest
+
+from tumblrpype import watch
+from tests.support import MockTumblrTestCase
+
+
+class StopWatching(Exception):
+    pass
+
+
+class WatchThemeTest(MockTumblrTestCase):
+
+    def setUp(self):
+        MockTumblrTestCase.setUp(self)
+        self.watching = threading.Event()
+
+        # know when the watch has started - changes before that aren't seen
+        FileWatcher = watch.FileWatcher
+        watching = self.watching
+        class SignallingWatcher(FileWatcher):
+            def __init__(self, *args, **kwargs):
+                FileWatcher.__init__(self, *args, **kwargs)
+                watching.set()
+        watch.FileWatcher = SignallingWatcher
+        self.addCleanup(setattr, watch, 'FileWatcher', FileWatcher)
+
+    def write(self, path, html):
+        with open(path, 'wb') as F:
+            F.write(html)
+
+    def watch(self, blogname, poll, pushes):
+        """Watch a theme file until ``pushes`` pushes; returns (path, queue of pushes)."""
+        session = self.login(blogname, lazy = True)
+        path = os.path.join(self.workdir, '%s.html' % blogname)
+        self.write(path, '<html>start</html>')
+
+        pushed = Queue.Queue()
+        count = [0]
+        def report(result, seconds, error):
+            pushed.put((result, error))
+            count[0] += 1
+            if count[0] >= pushes:
+                raise StopWatching()
+
+        def run():
+            try:
+                watch.watch_theme(session, path, debounce = 0.05, poll = poll, report = report)
+            except StopWatching:
+                pass
+        thread = threading.Thread(target = run)
+        thread.daemon = True
+        thread.start()
+        self.addCleanup(lambda: self.assertFalse(thread.is_alive()))
+        self.addCleanup(thread.join, 5)
+
+        self.assertTrue(self.watching.wait(5))
+        return path, pushed
+
+    def check_pushes(self, blogname, poll):
+        path, pushed = self.watch(blogname, poll, pushes = 2)
+
+        self.write(path, '<html>one</html>')
+        result, error = pushed.get(timeout = 5)
+        self.assertIsNone(error)
+        self.assertEqual(self.mock.theme(blogname)['custom_theme'], u'<html>one</html>')
+
+        # the same again isn't pushed; the next change is
+        self.write(path, '<html>one</html>')
+        self.write(path, '<html>two</html>')
+        result, error = pushed.get(timeout = 5)
+        self.assertIsNone(error)
+        self.assertEqual(self.mock.theme(blogname)['custom_theme'], u'<html>two</html>')
+        self.assertEqual(self.requests('POST', 'customize_api'), 2)
+
+    def test_change_is_pushed_polling(self):
+        self.check_pushes('watch-poll', poll = True)
+
+    def test_change_is_pushed(self):
+        # inotify where there is one, polling otherwise
+        self.check_pushes('watch-notify', poll = False)
+
+    def test_burst_is_pushed_once(self):
+        path, pushed = self.watch('watch-burst', poll = False, pushes = 1)
+
+        for i in range(5):
+            self.write(path, '<html>draft %d</html>' % i)
+        result, error = pushed.get(timeout = 5)
+        self.assertIsNone(error)
+        self.assertEqual(self.mock.theme('watch-burst')['custom_theme'], u'<html>draft 4</html>')
+        self.assertEqual(self.requests('POST', 'customize_api'), 1)
+
+#//end class WatchThemeTest
+
+
+if __name__ == '__main__':
+    unittest.main()
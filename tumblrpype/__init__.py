@@ -22,21 +22,46 @@ __author__ = "Felix Bonkoski <felix@post-theory.com>"
 __copyright__ = "Copyright 2012, Felix Bonkoski"
 __license__ = "MIT License"
 
-__all__ = [ 'TumblrUser', 'TumblrLogin', 'FetchError', 'LoginError']
+__all__ = [ 'TumblrUser', 'TumblrLogin', 'AsyncTumblrLogin', 'AccountRegistry', 'FetchError', 'LoginError']
 
 #-------------------------------------------------------------------------------
 
-import os
+import sys
+import types
 
-from login import TumblrLogin, FetchError, LoginError
 from user import TumblrUser
 from config import _CONFIG_DIR
+import instrument
 
 #-------------------------------------------------------------------------------
+#   Everything that talks to Tumblr (and pulls in urllib2, cookielib, jsonlib
+#   ...) is only imported the first time it is used, so that `import tumblrpype`
+#   stays cheap for scripts that don't need it.
 
-if not os.path.exists(_CONFIG_DIR):
-    os.mkdir(_CONFIG_DIR)
-else:
-    if not os.path.isdir(_CONFIG_DIR):
-        raise IOError('Could not use config directory: %s' % _CONFIG_DIR)
+_LAZY_ATTRIBUTES = {'TumblrLogin' : 'login',
+                    'FetchError' : 'login',
+                    'LoginError' : 'login',
+                    'AsyncTumblrLogin' : 'asynclogin',
+                    'AccountRegistry' : 'registry'}
 
+class _Package(types.ModuleType):
+
+    def __getattr__(self, name):
+        moduleName = _LAZY_ATTRIBUTES.get(name)
+        if moduleName is None:
+            raise AttributeError("'module' object has no attribute '%s'" % name)
+
+        module = __import__('%s.%s' % (self.__name__, moduleName), fromlist = [name])
+        value = getattr(module, name)
+        setattr(self, name, value)
+        return value
+
+    def __dir__(self):
+        return sorted(set(self.__dict__) | set(_LAZY_ATTRIBUTES))
+
+_package = _Package(__name__, __doc__)
+_package.__dict__.update(globals())
+# keep the original module alive - Python 2 clears a module's globals when it
+# is garbage collected
+_package._module = sys.modules[__name__]
+sys.modules[__name__] = _package
@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+"""
+!    asynclogin.py
+!  --------------------------------------------------------------------------
+!
+!    Implements AsyncTumblrLogin: the same operations as TumblrLogin, but
+!    each call returns a Future right away, and up to `concurrency` of them
+!    run at the same time - all sharing one cookie jar and one pool of
+!    keep-alive connections.
+!
+!    Except where otherwise noted, the code in tumblrpype is
+!        Copyright (c) 2012  Felix Bonkoski <felix@post-theory.com>
+!        Licensed under the MIT license:
+!            <http://www.opensource.org/licenses/mit-license.php>
+!
+"""
+
+from login import TumblrLogin
+from workers import WorkerPool, gather
+
+__all__ = ['AsyncTumblrLogin']
+
+#-------------------------------------------------------------------------------
+
+class AsyncTumblrLogin(object):
+    """
+    Usage::
+
+        alogin = AsyncTumblrLogin(user, concurrency = 16)
+        results = alogin.batch('mark_post_private', postIDs)
+
+    Takes the same arguments as TumblrLogin, plus ``concurrency`` - the
+    maximum number of requests in flight at once.  Logging in is deferred to
+    the first request (``lazy``), so constructing one doesn't block.
+    """
+
+    def __init__(self, login, password = None, blogname = None, cookiesfile = None,
+                 concurrency = 8, **kwargs):
+
+        kwargs.setdefault('lazy', True)
+        kwargs.setdefault('poolsize', concurrency)
+
+        self.session = TumblrLogin(login, password, blogname, cookiesfile, **kwargs)
+        self.concurrency = concurrency
+        self.workers = WorkerPool(concurrency, name = 'tumblrpype-%s' % self.session.blogname)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.workers.shutdown()
+        self.session.close()
+
+    def submit(self, method, *args, **kwargs):
+        """Run ``TumblrLogin.<method>(*args, **kwargs)`` on a worker thread."""
+        return self.workers.submit(getattr(self.session, method), *args, **kwargs)
+
+    def fetch(self, uriFrag):
+        return self.submit('fetch', uriFrag)
+
+    def get_theme_html(self):
+        return self.submit('get_theme_html')
+
+    def save_theme_html(self, newHTML):
+        return self.submit('save_theme_html', newHTML)
+
+    def set_theme_variables(self, changes, coalesce = 0):
+        return self.submit('set_theme_variables', changes, coalesce)
+
+    def mark_post_private(self, postID, **kwargs):
+        return self.submit('mark_post_private', postID, **kwargs)
+
+    def set_post_state(self, postID, state):
+        return self.submit('set_post_state', postID, state)
+
+    def batch(self, method, argsList, return_exceptions = True):
+        """
+        Call ``method`` once for every entry of ``argsList`` (a single argument,
+        or a tuple of arguments), concurrently, and return the results in order.
+        """
+        futures = []
+        for args in argsList:
+            if not isinstance(args, tuple):
+                args = (args,)
+            futures.append(self.submit(method, *args))
+
+        return gather(futures, return_exceptions = return_exceptions)
+
+#//end class AsyncTumblrLogin
@@ -0,0 +1,332 @@
+# -*- coding: utf-8 -*-
+"""
+!    bulk.py
+!  --------------------------------------------------------------------------
+!
+!    Runs one post operation (mark_post_private, set_post_state, ...) over
+!    many posts of a blog, on a pool of worker processes:
+!
+!        result = run_bulk(user, postIDs, 'set_post_state', ('private',))
+!
+!    The post IDs are sharded across `workers` processes - so the parsing
+!    of edit pages is spread over the cores too - and each worker keeps one
+!    warm TumblrLogin, with `threads` requests in flight on it.
+!
+!    Every finished post is appended to a journal under `_CONFIG_DIR`
+!    (`journals/<blog>.<job>.journal`), one line per post, as soon as it is
+!    done:
+!
+!        <postID> ok|error <worker> <seconds> [<error>]
+!
+!    Every run is a new job (named after the operation and the time it
+!    started), unless it is asked to `resume` one: then the posts that job's
+!    journal has as done are skipped - so after a crash, or Ctrl-C, it
+!    carries on where it stopped (and tries the failed ones again).  Once
+!    every post of a job is done, its journal is renamed `<...>.journal.done`:
+!    resuming it again does nothing.  Changing posts' state can also skip,
+!    before any worker starts, the posts the post index (see postindex.py)
+!    saw in that state within `maxage` seconds - if asked to: by default,
+!    every post is looked at.
+!
+!    Except where otherwise noted, the code in tumblrpype is
+!        Copyright (c) 2012  Felix Bonkoski <felix@post-theory.com>
+!        Licensed under the MIT license:
+!            <http://www.opensource.org/licenses/mit-license.php>
+!
+"""
+
+import collections
+import errno
+import multiprocessing
+import os
+import Queue
+import threading
+import time
+
+from config import _CONFIG_DIR, POST_STATE_TTL, debug, ensure_config_dir
+from postindex import post_index
+from workers import WorkerPool
+
+__all__ = ['BulkResult', 'Journal', 'WorkerStats', 'journal_path', 'new_job_name', 'run_bulk']
+
+#-------------------------------------------------------------------------------
+
+OK = 'ok'
+ERROR = 'error'
+
+
+def journal_path(blogname, job):
+    return os.path.join(_CONFIG_DIR, 'journals', '%s.%s.journal' % (blogname, job))
+
+
+def new_job_name(method, args = ()):
+    """A name for a new job: the method, its arguments and the time."""
+    return '-'.join([method] + [str(arg) for arg in args] + [time.strftime('%Y%m%d-%H%M%S')])
+
+
+class Journal(object):
+    """
+    The append-only record of a bulk job.  Each line is written with a single
+    write() to a file opened for appending, so lines from many processes
+    don't mix; a line cut short by a crash is ignored.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        # where it is kept once the job is done (see retire())
+        self.donePath = path + '.done'
+        self._fd = None
+
+    def statuses(self):
+        """postID -> OK / ERROR, as of the last line for each post."""
+        statuses = {}
+        if not os.path.exists(self.path):
+            return statuses
+
+        with open(self.path, 'rb') as F:
+            for line in F:
+                if not line.endswith('\n'):
+                    break
+                fields = line.split(' ', 4)
+                if len(fields) < 4 or fields[1] not in (OK, ERROR):
+                    continue
+                try:
+                    statuses[int(fields[0])] = fields[1]
+                except ValueError:
+                    continue
+        return statuses
+
+    def finished(self):
+        return set(postID for postID, status in self.statuses().iteritems() if status == OK)
+
+    def open(self):
+        ensure_config_dir()
+        journalDir = os.path.dirname(self.path)
+        if journalDir and not os.path.isdir(journalDir):
+            try:
+                os.makedirs(journalDir)
+            except OSError as e:
+                # (another worker got there first)
+                if e.errno != errno.EEXIST:
+                    raise
+        self._fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0600)
+
+    def record(self, postID, ok, worker, seconds, error = None):
+        line = '%d %s %d %.3f' % (postID, OK if ok else ERROR, worker, seconds)
+        if error is not None:
+            line += ' ' + ' '.join(str(error).split())
+        os.write(self._fd, line + '\n')
+
+    def close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def remove(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def retire(self):
+        """
+        Keep the journal of a finished job as `<path>.done`, out of the way of
+        resuming.  Returns that path - or None, if the job never had a journal.
+        """
+        if os.path.exists(self.path):
+            os.rename(self.path, self.donePath)
+        return self.donePath if os.path.exists(self.donePath) else None
+
+#//end class Journal
+
+
+class WorkerStats(collections.namedtuple('WorkerStats', 'worker pid posts ok errors seconds exitcode')):
+
+    @property
+    def throughput(self):
+        """Posts per second."""
+        return self.posts / self.seconds if self.seconds else 0.0
+
+    @property
+    def error_rate(self):
+        return float(self.errors) / self.posts if self.posts else 0.0
+
+#//end class WorkerStats
+
+
+# `total` posts asked for, `skipped` of them already done (in the journal of
+# the job resumed), `indexed` of them known to be in the target state (in the
+# post index); `complete` if every post is done now - and `journal` renamed
+# to <...>.done.  `workers` is a list of WorkerStats.
+BulkResult = collections.namedtuple('BulkResult',
+                                    'job journal total skipped indexed complete workers')
+
+
+def _target_state(method, args):
+    # the state the posts end up in, for the methods that change it
+    if method == 'mark_post_private':
+        return 'private'
+    if method == 'set_post_state' and args:
+        return args[0]
+    return None
+
+
+def _work(index, user, postIDs, method, args, threads, journalPath, results, kwargs):
+    # runs in a worker process: one warm session for the whole shard
+    from login import TumblrLogin
+
+    started = time.time()
+    counts = {'ok' : 0, 'errors' : 0}
+    countsLock = threading.Lock()
+
+    journal = Journal(journalPath)
+    journal.open()
+
+    kwargs = dict(kwargs, lazy = True)
+    kwargs.setdefault('poolsize', threads)
+    session = TumblrLogin(user, **kwargs)
+
+    # the threads take the next post from a shared iterator, until there
+    # are none left - or `stop` is set
+    shard = iter(postIDs)
+    shardLock = threading.Lock()
+    stop = threading.Event()
+
+    def edit_all():
+        while not stop.is_set():
+            with shardLock:
+                postID = next(shard, None)
+            if postID is None:
+                return
+            edit(postID)
+
+    def edit(postID):
+        postStarted = time.time()
+        try:
+            ok = bool(getattr(session, method)(postID, *args))
+            error = None if ok else 'failed'
+        except Exception as e:
+            ok, error = False, '%s: %s' % (type(e).__name__, e)
+
+        journal.record(postID, ok, index, time.time() - postStarted, error)
+        with countsLock:
+            counts['ok' if ok else 'errors'] += 1
+
+    try:
+        session._ensure_login()
+        with WorkerPool(threads, name = 'tumblrpype-bulk-%d' % index) as pool:
+            futures = [pool.submit(edit_all) for i in xrange(threads)]
+            try:
+                # (a plain wait couldn't be interrupted)
+                while not all(future.done() for future in futures):
+                    time.sleep(0.1)
+            except KeyboardInterrupt:
+                # let the posts in flight finish, and make it into the journal
+                stop.set()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        session.close()
+        journal.close()
+        results.put(WorkerStats(index, os.getpid(), counts['ok'] + counts['errors'],
+                                counts['ok'], counts['errors'], time.time() - started, None))
+
+
+def run_bulk(user, postIDs, method = 'mark_post_private', args = (), workers = 4, threads = 2,
+             job = None, resume = False, restart = False, maxage = POST_STATE_TTL, **kwargs):
+    """
+    Call ``TumblrLogin.<method>(postID, *args)`` for every post in ``postIDs``
+    of ``user``'s blog, on ``workers`` processes of ``threads`` threads, as
+    the job ``job`` (by default, a new_job_name()).  With ``resume``, the
+    posts the job's journal has as done are skipped.  Without it, the job
+    mustn't have a journal yet - unless ``restart``, which throws it away.
+    Posts the post index saw in the target state within ``maxage`` seconds
+    are skipped too (by default 0: look at every post).  Extra keyword arguments are
+    passed on to TumblrLogin.
+
+    Returns a BulkResult.
+    """
+    if job is None:
+        if resume:
+            raise ValueError('Which job to resume?')
+        job = new_job_name(method, args)
+
+    journal = Journal(journal_path(user.blogname, job))
+    if restart:
+        journal.remove()
+    elif not resume and os.path.exists(journal.path):
+        raise ValueError('Job %s of [%s] was started before - resume it, or restart it'
+                         % (job, user.blogname))
+
+    postIDs = [int(postID) for postID in postIDs]
+    finished = set()
+    if resume:
+        # a job that was done already has only its retired journal left
+        if not os.path.exists(journal.path) and os.path.exists(journal.donePath):
+            finished = Journal(journal.donePath).finished()
+        else:
+            finished = journal.finished()
+    pending = [postID for postID in postIDs if postID not in finished]
+    skipped = len(postIDs) - len(pending)
+
+    state = _target_state(method, args)
+    postIndex = kwargs.get('postindex', True)
+    if postIndex is True:
+        postIndex = post_index()
+
+    indexed = 0
+    if state is not None and postIndex not in (None, False) and maxage:
+        known = postIndex.in_state(user.blogname, pending, state, maxage)
+        pending = [postID for postID in pending if postID not in known]
+        indexed = len(known)
+        # the workers skip the posts that get there meanwhile, too
+        kwargs.setdefault('postmaxage', maxage)
+
+    debug("Bulk %s [%s]: %d post(s), %d done already, %d %s already"
+          % (job, user.blogname, len(postIDs), skipped, indexed, state))
+
+    if not pending:
+        # nothing to run (and maybe no journal either)
+        return BulkResult(job, journal.retire(), len(postIDs), skipped, indexed, True, [])
+
+    workers = max(1, min(workers, len(pending)))
+    results = multiprocessing.Queue()
+    processes = []
+
+    for index in xrange(workers):
+        shard = pending[index::workers]
+        process = multiprocessing.Process(target = _work,
+                                          args = (index, user, shard, method, args, threads,
+                                                  journal.path, results, kwargs),
+                                          name = 'tumblrpype-bulk-%d' % index)
+        process.start()
+        processes.append(process)
+
+    stats = {}
+    try:
+        while len(stats) < len(processes):
+            try:
+                worker = results.get(timeout = 1.0)
+            except Queue.Empty:
+                # the queue is empty: check on workers that died without a word
+                if all(not process.is_alive() for process in processes):
+                    break
+                continue
+            stats[worker.worker] = worker
+    finally:
+        for process in processes:
+            process.join()
+
+    report = []
+    for index, process in enumerate(processes):
+        worker = stats.get(index)
+        if worker is None:
+            # killed before it could report: its posts are in the journal
+            worker = WorkerStats(index, process.pid, 0, 0, 0, 0.0, None)
+        report.append(worker._replace(exitcode = process.exitcode))
+
+    left = set(pending) - journal.finished()
+    path = journal.path
+    if not left:
+        path = journal.retire()
+        debug("Bulk %s [%s]: done" % (job, user.blogname))
+
+    return BulkResult(job, path, len(postIDs), skipped, indexed, not left, report)
@@ -13,13 +13,67 @@
 """
 import os
 import sys
+import time
+import urllib
+
+import instrument
 
 _DEFAULT_CONFIG_DIR = os.path.expanduser("~/.tumblrpype")
 
-_CONFIG_DIR = _DEFAULT_CONFIG_DIR
+# TUMBLRPYPE_CONFIG_DIR overrides the default (e.g. for benchmarks, or to
+# keep several configurations apart)
+_CONFIG_DIR = os.environ.get('TUMBLRPYPE_CONFIG_DIR') or _DEFAULT_CONFIG_DIR
+
+# Progress messages from debug() go to stderr when DEBUG is set - which it
+# is, if TUMBLRPYPE_DEBUG is set in the environment.  For timings and byte
+# counts, register a hook with tumblrpype.instrument instead.
+DEBUG = bool(os.environ.get('TUMBLRPYPE_DEBUG'))
+
+# How long (in seconds) a lazy TumblrLogin trusts a session that was
+# validated before, without checking it again.
+LOGIN_TTL = 60 * 60
+
+# How long (in seconds) bulk edits trust the post index (see postindex.py)
+# on a post's state: a post it saw in the target state more recently than
+# that is skipped without a request.  0 (the default) trusts it not at all:
+# the post may have been changed on the web since.  Either way, a post
+# whose edit page shows the target state isn't saved again.
+POST_STATE_TTL = 0
+
+# Requests per second (per host) the request scheduler lets through, shared
+# by every thread and process - and how many may go out in one burst.  None
+# means no pacing until Tumblr pushes back (see scheduler.py).
+RATE_LIMIT = float(os.environ['TUMBLRPYPE_RATE_LIMIT']) if os.environ.get('TUMBLRPYPE_RATE_LIMIT') else None
+RATE_BURST = None
 
-DEBUG = True
+_config_dir_ok = False
+
+def ensure_config_dir():
+    """Create the config directory, if needed - called before anything is written to it."""
+    global _config_dir_ok
+    if _config_dir_ok:
+        return
+
+    if not os.path.exists(_CONFIG_DIR):
+        os.makedirs(_CONFIG_DIR)
+    elif not os.path.isdir(_CONFIG_DIR):
+        raise IOError('Could not use config directory: %s' % _CONFIG_DIR)
+
+    _config_dir_ok = True
+
+def account_dir(login, blogname = None, configdir = None):
+    """
+    Where the files of ``login``'s account - and of its blog ``blogname``, if
+    given - are kept: `<_CONFIG_DIR>/accounts/<login>[/<blogname>]`.
+    """
+    path = os.path.join(configdir or _CONFIG_DIR, 'accounts', urllib.quote(login, safe = '@'))
+    if blogname is not None:
+        path = os.path.join(path, urllib.quote(blogname, safe = ''))
+    return path
 
 def debug(s):
     if DEBUG:
         sys.stderr.write('%s\n' % s)
+
+    if instrument.ENABLED:
+        instrument.emit({'type' : 'log', 'message' : s, 'time' : time.time()})
@@ -0,0 +1,239 @@
+# -*- coding: utf-8 -*-
+"""
+!    cookiestore.py
+!  --------------------------------------------------------------------------
+!
+!    Keeps the login sessions (cookies, and when each session was last
+!    validated) in one SQLite database, `<_CONFIG_DIR>/sessions.db`, so
+!    that any number of threads and processes can share them:
+!
+!      - a StoredCookieJar reads its session once, and then answers from
+!        memory.  save() only writes the cookies that changed.
+!      - every save bumps the session's `generation`, so a jar can tell
+!        cheaply whether someone else has logged in since (see reload()).
+!      - SessionStore.lock() is held while logging in, so parallel workers
+!        wait for one login and then share its session.
+!
+!    A session is keyed by the path of the (old style) LWP cookies file;
+!    cookies found in that file are imported the first time it is used.
+!
+!    Except where otherwise noted, the code in tumblrpype is
+!        Copyright (c) 2012  Felix Bonkoski <felix@post-theory.com>
+!        Licensed under the MIT license:
+!            <http://www.opensource.org/licenses/mit-license.php>
+!
+"""
+
+import cookielib
+import hashlib
+import json
+import os
+import threading
+import time
+
+from config import _CONFIG_DIR, debug
+from filelock import file_lock
+from sqlstore import SQLiteStore
+
+__all__ = ['SessionStore', 'StoredCookieJar', 'session_store']
+
+#-------------------------------------------------------------------------------
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    key         TEXT PRIMARY KEY,
+    generation  INTEGER NOT NULL DEFAULT 0,
+    validated   REAL NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS cookies (
+    key                 TEXT NOT NULL,
+    domain              TEXT NOT NULL,
+    path                TEXT NOT NULL,
+    name                TEXT NOT NULL,
+    value               TEXT,
+    version             INTEGER,
+    port                TEXT,
+    port_specified      INTEGER,
+    domain_specified    INTEGER,
+    domain_initial_dot  INTEGER,
+    path_specified      INTEGER,
+    secure              INTEGER,
+    expires             INTEGER,
+    discard             INTEGER,
+    comment             TEXT,
+    comment_url         TEXT,
+    rest                TEXT,
+    PRIMARY KEY (key, domain, path, name)
+);
+"""
+
+_COLUMNS = ('domain', 'path', 'name', 'value', 'version', 'port', 'port_specified',
+            'domain_specified', 'domain_initial_dot', 'path_specified', 'secure',
+            'expires', 'discard', 'comment', 'comment_url', 'rest')
+
+
+def _cookie_row(cookie):
+    """The database row for ``cookie`` - its first three values identify it."""
+    return (cookie.domain, cookie.path, cookie.name, cookie.value, cookie.version,
+            cookie.port, int(cookie.port_specified), int(cookie.domain_specified),
+            int(cookie.domain_initial_dot), int(cookie.path_specified), int(cookie.secure),
+            cookie.expires, int(cookie.discard), cookie.comment, cookie.comment_url,
+            json.dumps(cookie._rest, sort_keys = True) if cookie._rest else None)
+
+def _row_cookie(row):
+    (domain, path, name, value, version, port, port_specified, domain_specified,
+     domain_initial_dot, path_specified, secure, expires, discard, comment,
+     comment_url, rest) = row
+
+    return cookielib.Cookie(version, name, value, port, bool(port_specified),
+                            domain, bool(domain_specified), bool(domain_initial_dot),
+                            path, bool(path_specified), bool(secure), expires,
+                            bool(discard), comment, comment_url,
+                            json.loads(rest) if rest else {})
+
+
+class SessionStore(SQLiteStore):
+
+    SCHEMA = _SCHEMA
+
+    def __init__(self, path = None):
+        SQLiteStore.__init__(self, path or os.path.join(_CONFIG_DIR, 'sessions.db'))
+
+    def __write(self, key, statements):
+        with self._transaction() as conn:
+            conn.execute('INSERT OR IGNORE INTO sessions (key) VALUES (?)', (key,))
+            for sql, args in statements:
+                if isinstance(args, list):
+                    conn.executemany(sql, args)
+                else:
+                    conn.execute(sql, args)
+            return conn.execute('SELECT generation FROM sessions WHERE key = ?',
+                                (key,)).fetchone()[0]
+
+    def lock(self, key):
+        """The (cross-process) lock to hold while logging in to session ``key``."""
+        return file_lock('%s-%s.lock' % (self.path, hashlib.sha1(key).hexdigest()[:12]))
+
+    def generation(self, key):
+        """How many times session ``key`` was saved (None if never)."""
+        rows = self._query('SELECT generation FROM sessions WHERE key = ?', (key,))
+        return rows[0][0] if rows else None
+
+    def load(self, key):
+        """``(generation, rows)`` of session ``key``."""
+        if not os.path.exists(self.path):
+            return None, []
+
+        # one read transaction, so generation and cookies agree
+        with self._transaction(write = False) as conn:
+            rows = conn.execute('SELECT generation FROM sessions WHERE key = ?', (key,)).fetchall()
+            cookies = conn.execute('SELECT %s FROM cookies WHERE key = ?' % ', '.join(_COLUMNS),
+                                   (key,)).fetchall()
+
+        return (rows[0][0] if rows else None), cookies
+
+    def save(self, key, changed, removed):
+        """Write the ``changed`` cookie rows, delete the ``removed`` (domain, path, name)s."""
+        return self.__write(key, [
+            ('INSERT OR REPLACE INTO cookies (key, %s) VALUES (?%s)'
+             % (', '.join(_COLUMNS), ', ?' * len(_COLUMNS)),
+             [(key,) + tuple(row) for row in changed]),
+            ('DELETE FROM cookies WHERE key = ? AND domain = ? AND path = ? AND name = ?',
+             [(key,) + tuple(ident) for ident in removed]),
+            ('UPDATE sessions SET generation = generation + 1 WHERE key = ?', (key,))])
+
+    def validated(self, key):
+        """When session ``key`` was last known to be logged in (0 if never)."""
+        rows = self._query('SELECT validated FROM sessions WHERE key = ?', (key,))
+        return rows[0][0] if rows else 0
+
+    def mark_validated(self, key, when = None):
+        self.__write(key, [('UPDATE sessions SET validated = ? WHERE key = ?',
+                            (time.time() if when is None else when, key))])
+
+    def delete(self, key):
+        self.__write(key, [('DELETE FROM cookies WHERE key = ?', (key,)),
+                           ('DELETE FROM sessions WHERE key = ?', (key,))])
+
+#//end class SessionStore
+
+
+_STORES = {}
+_STORES_LOCK = threading.Lock()
+
+def session_store(path = None):
+    """The SessionStore for ``path`` (shared by everything in the process)."""
+    path = os.path.abspath(path or os.path.join(_CONFIG_DIR, 'sessions.db'))
+    with _STORES_LOCK:
+        store = _STORES.get(path)
+        if store is None:
+            store = _STORES[path] = SessionStore(path)
+        return store
+
+
+class StoredCookieJar(cookielib.CookieJar):
+    """
+    A CookieJar backed by a SessionStore.  Cookies are looked up in memory;
+    the store is only read by load() / reload(), and written by save().
+    """
+
+    def __init__(self, store, key, legacyfile = None, policy = None):
+        cookielib.CookieJar.__init__(self, policy)
+        self.store = store
+        self.key = key
+        self.legacyfile = legacyfile
+        self.generation = None
+
+        # the rows as they are in the store, by (domain, path, name)
+        self._saved = {}
+
+    def load(self):
+        generation, rows = self.store.load(self.key)
+
+        with self._cookies_lock:
+            self._cookies = {}
+            for row in rows:
+                self.set_cookie(_row_cookie(row))
+            self._saved = dict((row[:3], tuple(row)) for row in rows)
+            self.generation = generation
+
+        if generation is None and self.legacyfile:
+            self.__import_legacy()
+
+    def reload(self):
+        """Load the session again if it was saved by someone else.  True if it was."""
+        if self.store.generation(self.key) == self.generation:
+            return False
+        self.load()
+        return True
+
+    def save(self):
+        with self._cookies_lock:
+            current = dict((row[:3], row) for row in (_cookie_row(c) for c in self))
+
+        changed = [row for ident, row in current.iteritems() if self._saved.get(ident) != row]
+        removed = [ident for ident in self._saved if ident not in current]
+        if not changed and not removed and self.generation is not None:
+            return
+
+        self.generation = self.store.save(self.key, changed, removed)
+        self._saved = current
+
+    def __import_legacy(self):
+        if not os.path.exists(self.legacyfile):
+            return
+
+        legacy = cookielib.LWPCookieJar(self.legacyfile)
+        try:
+            legacy.load(ignore_discard = True, ignore_expires = True)
+        except (IOError, cookielib.LoadError) as e:
+            debug("  !! Ignoring unreadable cookies file [%s]: %s" % (self.legacyfile, e))
+            return
+
+        if len(legacy):
+            debug("  >> Importing cookies from [%s]" % self.legacyfile)
+            for cookie in legacy:
+                self.set_cookie(cookie)
+            self.save()
+
+#//end class StoredCookieJar
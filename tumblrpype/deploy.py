@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+"""
+!    deploy.py
+!  --------------------------------------------------------------------------
+!
+!    Deploys one theme to many blogs at once.  Blogs are grouped by the
+!    account (login) they belong to, each account logs in only once, and
+!    the saves for all blogs run concurrently on a bounded pool of workers.
+!
+!    Except where otherwise noted, the code in tumblrpype is
+!        Copyright (c) 2012  Felix Bonkoski <felix@post-theory.com>
+!        Licensed under the MIT license:
+!            <http://www.opensource.org/licenses/mit-license.php>
+!
+"""
+
+import collections
+import time
+
+from config import debug
+from login import TumblrLogin
+from workers import WorkerPool
+
+__all__ = ['DeployResult', 'deploy_theme', 'group_by_account']
+
+#-------------------------------------------------------------------------------
+
+# `ok` is True on success; `error` holds the exception (or message) otherwise
+DeployResult = collections.namedtuple('DeployResult', 'blogname ok seconds error')
+
+
+def group_by_account(users):
+    """Group TumblrUsers by login - returns an ordered dict of login -> [users]."""
+    groups = collections.OrderedDict()
+    for user in users:
+        groups.setdefault(user.login, []).append(user)
+    return groups
+
+
+def _save(session, newHTML, force):
+    started = time.time()
+    try:
+        ret = session.save_theme_html(newHTML, force = force)
+    except Exception as e:
+        return DeployResult(session.blogname, False, time.time() - started, e)
+
+    ok = bool(ret)
+    return DeployResult(session.blogname, ok, time.time() - started,
+                        None if ok else 'Theme save failed')
+
+
+def deploy_theme(newHTML, users, workers = 8, force = False, **kwargs):
+    """
+    Save ``newHTML`` as the Theme HTML of every blog in ``users`` (TumblrUser
+    objects), ``workers`` blogs at a time.  Extra keyword arguments are passed
+    on to TumblrLogin.
+
+    Returns a list of DeployResult, in the order of ``users``.
+    """
+    kwargs.setdefault('poolsize', workers)
+    kwargs['lazy'] = True
+
+    order = dict((user.blogname, i) for i, user in enumerate(users))
+    results = []
+    futures = []
+    sessions = []
+
+    with WorkerPool(workers, name = 'tumblrpype-deploy') as pool:
+        for login, accountUsers in group_by_account(users).iteritems():
+            debug("Deploying to %d blog(s) of [%s]" % (len(accountUsers), login))
+
+            # one session (and one login) for all of the account's blogs
+            started = time.time()
+            try:
+                session = TumblrLogin(accountUsers[0], **kwargs)
+                session._ensure_login()
+                sessions.append(session)
+            except Exception as e:
+                seconds = time.time() - started
+                results.extend(DeployResult(user.blogname, False, seconds, e) for user in accountUsers)
+                continue
+
+            for user in accountUsers:
+                futures.append(pool.submit(_save, session.for_blog(user.blogname), newHTML, force))
+
+        results.extend(future.result() for future in futures)
+
+    for session in sessions:
+        session.close()
+
+    results.sort(key = lambda result: order[result.blogname])
+    return results
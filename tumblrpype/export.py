@@ -0,0 +1,259 @@
+# -*- coding: utf-8 -*-
+"""
+!    export.py
+!  --------------------------------------------------------------------------
+!
+!    Backs up the theme of many blogs - its Theme HTML and all of its settings,
+!    as the customize page has them - into one zip archive:
+!
+!        index.json               blog -> {login, theme, settings, fetched}
+!        themes/<sha1>.html       each distinct Theme HTML, once
+!        settings/<sha1>.json     each distinct set of settings, once
+!
+!    The customize pages are fetched concurrently on a bounded pool of
+!    workers (one session per account, like deploy.py); blogs that share a
+!    theme share its entry in the archive.
+!
+!    Given the previous export, a run is incremental: a blog whose theme
+!    tumblrpype saw live less than `maxage` seconds ago, and that is the
+!    theme - Theme HTML and settings - in the previous export, isn't fetched
+!    again: its entries are copied over.
+!
+!    Except where otherwise noted, the code in tumblrpype is
+!        Copyright (c) 2012  Felix Bonkoski <felix@post-theory.com>
+!        Licensed under the MIT license:
+!            <http://www.opensource.org/licenses/mit-license.php>
+!
+"""
+
+import collections
+import hashlib
+import json
+import os
+import Queue
+import time
+import zipfile
+
+from config import debug
+from deploy import group_by_account
+from login import TumblrLogin
+from themecache import ThemeInfoCache
+from themestore import ThemeStore, theme_hash
+from workers import WorkerPool
+
+__all__ = ['ExportResult', 'export_themes', 'read_index', 'read_settings', 'read_theme']
+
+#-------------------------------------------------------------------------------
+
+INDEX_NAME = 'index.json'
+ARCHIVE_VERSION = 1
+
+# not settings, and not something to keep in a backup: the form key is a secret
+_NOT_SETTINGS = ('custom_theme', 'user_form_key')
+
+# `status` is one of: 'changed' (new, or different from the previous export),
+# 'unchanged', 'skipped' (not fetched, copied from the previous export) or
+# 'failed' (`error` holds the exception or message)
+ExportResult = collections.namedtuple('ExportResult', 'blogname status seconds error')
+
+
+def _theme_member(themeHash):
+    return 'themes/%s.html' % themeHash
+
+def _settings_member(settingsHash):
+    return 'settings/%s.json' % settingsHash
+
+
+def read_index(path):
+    """The index of the export archive at ``path`` - None if it isn't one."""
+    try:
+        with zipfile.ZipFile(path) as archive:
+            index = json.loads(archive.read(INDEX_NAME))
+    except (IOError, KeyError, ValueError, zipfile.BadZipfile):
+        return None
+
+    if index.get('version') != ARCHIVE_VERSION:
+        return None
+    return index
+
+
+def read_theme(path, blogname):
+    """The Theme HTML (utf-8 bytes) of ``blogname`` in the export archive at ``path``."""
+    with zipfile.ZipFile(path) as archive:
+        entry = json.loads(archive.read(INDEX_NAME))['blogs'][blogname]
+        return archive.read(_theme_member(entry['theme']))
+
+
+def read_settings(path, blogname):
+    """The theme settings (a dict) of ``blogname`` in the export archive at ``path``."""
+    with zipfile.ZipFile(path) as archive:
+        entry = json.loads(archive.read(INDEX_NAME))['blogs'][blogname]
+        return json.loads(archive.read(_settings_member(entry['settings'])))
+
+
+def _settings_json(themeInfo):
+    settings = dict((key, value) for key, value in themeInfo.iteritems() if key not in _NOT_SETTINGS)
+    # sorted, so that the same settings always hash the same
+    return json.dumps(settings, sort_keys = True, separators = (',', ':'))
+
+
+def _fetch(session):
+    started = time.time()
+    try:
+        themeInfo = session.get_theme_info()
+    except Exception as e:
+        return session.blogname, None, None, time.time() - started, e
+
+    if not themeInfo:
+        return session.blogname, None, None, time.time() - started, 'Could not fetch the customize page'
+
+    html = (themeInfo.get('custom_theme') or u'').encode('utf-8')
+    return session.blogname, html, _settings_json(themeInfo), time.time() - started, None
+
+
+def _seen_since(user, entry, maxage):
+    """
+    Whether tumblrpype saw ``entry``'s theme live on the blog of ``user``
+    within ``maxage`` seconds - its Theme HTML, and the settings it last
+    fetched or saved (theme variables ...) too.
+    """
+    themeStore = ThemeStore(user.login, user.blogname)
+    current = themeStore.current()
+    if (current is None or current.hash != entry['theme']
+            or time.time() - themeStore.last_checked() > maxage):
+        return False
+
+    themeInfo = ThemeInfoCache(user.login).get(user.blogname)
+    return (themeInfo is not None
+            and hashlib.sha1(_settings_json(themeInfo)).hexdigest() == entry['settings'])
+
+
+def export_themes(users, path, workers = 8, previous = None, maxage = None, **kwargs):
+    """
+    Export the theme of every blog in ``users`` (TumblrUser objects) to the
+    zip archive ``path``, ``workers`` blogs at a time.  Extra keyword
+    arguments are passed on to TumblrLogin.
+
+    ``previous`` is an earlier export (by default ``path`` itself, if it
+    exists) to carry entries over from: blogs that fail to fetch keep their
+    previous entry, and - with ``maxage`` - blogs whose theme was seen live
+    within ``maxage`` seconds, unchanged since, aren't fetched at all.
+
+    Returns a list of ExportResult, in the order of ``users``.
+    """
+    kwargs.setdefault('poolsize', workers)
+    kwargs['lazy'] = True
+
+    if previous is None and os.path.exists(path):
+        previous = path
+
+    oldIndex = read_index(previous) if previous else None
+    oldBlogs = oldIndex['blogs'] if oldIndex else {}
+    oldArchive = zipfile.ZipFile(previous) if oldIndex else None
+
+    order = dict((user.blogname, i) for i, user in enumerate(users))
+    results = []
+    blogs = {}
+    written = set()
+
+    tmpFile = '%s.%d.tmp' % (path, os.getpid())
+    archive = zipfile.ZipFile(tmpFile, 'w', zipfile.ZIP_DEFLATED, allowZip64 = True)
+
+    def add(member, data):
+        if member not in written:
+            archive.writestr(member, data)
+            written.add(member)
+
+    def carry_over(blogname):
+        entry = oldBlogs[blogname]
+        for member in (_theme_member(entry['theme']), _settings_member(entry['settings'])):
+            if member not in written:
+                add(member, oldArchive.read(member))
+        blogs[blogname] = entry
+
+    def failed(blogname, seconds, error):
+        # the blog keeps its previous entry, if it has one
+        if blogname in oldBlogs:
+            carry_over(blogname)
+        results.append(ExportResult(blogname, 'failed', seconds, error))
+
+    try:
+        toFetch = []
+        for user in users:
+            entry = oldBlogs.get(user.blogname)
+            if maxage is not None and entry and _seen_since(user, entry, maxage):
+                debug("Theme of [%s] unchanged since the last export - skipping" % user.blogname)
+                carry_over(user.blogname)
+                results.append(ExportResult(user.blogname, 'skipped', 0.0, None))
+            else:
+                toFetch.append(user)
+
+        # workers hand their results to this thread, which alone writes the archive
+        done = Queue.Queue()
+        sessions = []
+        pending = 0
+
+        with WorkerPool(workers, name = 'tumblrpype-export') as pool:
+            for login, accountUsers in group_by_account(toFetch).iteritems():
+                debug("Exporting %d blog(s) of [%s]" % (len(accountUsers), login))
+
+                # one session (and one login) for all of the account's blogs
+                try:
+                    session = TumblrLogin(accountUsers[0], **kwargs)
+                except Exception as e:
+                    debug("  !! Could not open a session for [%s]: %s" % (login, e))
+                    for user in accountUsers:
+                        failed(user.blogname, 0.0, e)
+                    continue
+                sessions.append(session)
+
+                for user in accountUsers:
+                    future = pool.submit(_fetch, session.for_blog(user.blogname))
+                    future.add_done_callback(done.put)
+                    pending += 1
+
+            for i in xrange(pending):
+                blogname, html, settings, seconds, error = done.get().result()
+
+                if error is not None:
+                    failed(blogname, seconds, error)
+                    continue
+
+                themeHash = theme_hash(html)
+                settingsHash = hashlib.sha1(settings).hexdigest()
+                add(_theme_member(themeHash), html)
+                add(_settings_member(settingsHash), settings)
+
+                entry = oldBlogs.get(blogname)
+                unchanged = (entry is not None and entry['theme'] == themeHash
+                             and entry['settings'] == settingsHash)
+
+                blogs[blogname] = {'login' : users[order[blogname]].login,
+                                   'theme' : themeHash,
+                                   'settings' : settingsHash,
+                                   'fetched' : time.time()}
+                results.append(ExportResult(blogname, 'unchanged' if unchanged else 'changed',
+                                            seconds, None))
+
+        for session in sessions:
+            session.close()
+
+        archive.writestr(INDEX_NAME, json.dumps({'version' : ARCHIVE_VERSION,
+                                                 'created' : time.time(),
+                                                 'blogs' : blogs},
+                                                indent = 1, sort_keys = True))
+        archive.close()
+        os.rename(tmpFile, path)
+
+    finally:
+        archive.close()
+        if oldArchive is not None:
+            oldArchive.close()
+        if os.path.exists(tmpFile):
+            os.remove(tmpFile)
+
+    debug("Exported %d blog(s), %d distinct theme(s)"
+          % (len(blogs), len([member for member in written if member.startswith('themes/')])))
+
+    results.sort(key = lambda result: order[result.blogname])
+    return results
@@ -0,0 +1,380 @@
+# -*- coding: utf-8 -*-
+"""
+!    extract.py
+!  --------------------------------------------------------------------------
+!
+!    Lightweight, single-pass extractors for the few values tumblrpype needs
+!    out of Tumblr's (large) HTML pages.  Instead of building a full document
+!    tree, the page is fed to a streaming parser a chunk at a time, and
+!    parsing stops as soon as every wanted value has been seen.
+!
+!    Except where otherwise noted, the code in tumblrpype is
+!        Copyright (c) 2012  Felix Bonkoski <felix@post-theory.com>
+!        Licensed under the MIT license:
+!            <http://www.opensource.org/licenses/mit-license.php>
+!
+"""
+
+import codecs
+import HTMLParser
+import re
+
+from config import debug
+
+__all__ = ['EditPageExtractor', 'extract_edit_form', 'EDIT_FORM_IDS',
+           'CustomizePageScanner', 'scan_customize_page', 'extract_posts']
+
+#-------------------------------------------------------------------------------
+
+# ids of the <input>s on /edit/<id> whose `value` the edit form needs
+EDIT_FORM_IDS = ('upload_id', 'post_date', 'post_source_url', 'post_tags',
+                 'form_key', 'post_three', 'post_type')
+
+# ids of the <textarea>s on /edit/<id> whose text the edit form needs
+EDIT_FORM_TEXTAREAS = ('post_two',)
+
+# ids of the <select>s on /edit/<id> whose selected value is wanted: the
+# post's current state
+EDIT_FORM_SELECTS = ('post_state',)
+
+# Only these entities are decoded in textarea text (the rest are kept as-is,
+# so the text goes back to Tumblr exactly as it came)
+_TEXTAREA_ENTITIES = {'lt' : '<', 'gt' : '>', 'amp' : '&'}
+_TEXTAREA_CHARREFS = {'13' : '\r'}
+
+_CHUNK_SIZE = 16 * 1024
+
+# the charset a page names in its <meta>, if any
+_META_CHARSET_RE = re.compile(r'<meta\b[^>]*?\bcharset=["\']?([\w-]+)', re.I)
+_DEFAULT_CHARSET = 'utf-8'
+
+
+def _page_charset(chunk):
+    m = _META_CHARSET_RE.search(chunk)
+    if m:
+        try:
+            return codecs.lookup(m.group(1)).name
+        except LookupError:
+            pass
+    return _DEFAULT_CHARSET
+
+
+class _Done(Exception): pass
+
+
+class EditPageExtractor(HTMLParser.HTMLParser):
+    """
+    Collects the ``value`` attribute of the elements with the given ``ids``,
+    the text of the ``<textarea>`` elements with the given ``textareas`` ids
+    and the value of the selected ``<option>`` of the ``<select>`` elements
+    with the given ``selects`` ids into ``self.values`` (keyed by id).  A
+    found element without a ``value`` (or a selected option) maps to None.
+    """
+
+    def __init__(self, ids = EDIT_FORM_IDS, textareas = EDIT_FORM_TEXTAREAS,
+                 selects = EDIT_FORM_SELECTS):
+        HTMLParser.HTMLParser.__init__(self)
+
+        self.wanted = set(ids) | set(textareas) | set(selects)
+        self.textareas = set(textareas)
+        self.selects = set(selects)
+        self.values = {}
+
+        self._textarea = None
+        self._text = []
+        self._select = None
+
+    @property
+    def done(self):
+        return len(self.values) == len(self.wanted)
+
+    def handle_starttag(self, tag, attrs):
+        if self._textarea:
+            return
+
+        if self._select:
+            if tag == 'option' and 'selected' in (name for name, value in attrs):
+                self.values[self._select] = dict(attrs).get('value')
+            return
+
+        for name, value in attrs:
+            if name == 'id':
+                elemID = value
+                break
+        else:
+            return
+
+        if elemID not in self.wanted or elemID in self.values:
+            return
+
+        if elemID in self.textareas:
+            if tag == 'textarea':
+                self._textarea = elemID
+                self._text = []
+            return
+
+        if elemID in self.selects:
+            if tag == 'select':
+                self._select = elemID
+            return
+
+        self.values[elemID] = dict(attrs).get('value')
+        if self.done:
+            raise _Done()
+
+    def handle_endtag(self, tag):
+        if self._textarea and tag == 'textarea':
+            self.values[self._textarea] = ''.join(self._text)
+            self._textarea = None
+            if self.done:
+                raise _Done()
+
+        elif self._select and tag == 'select':
+            self.values.setdefault(self._select, None)
+            self._select = None
+            if self.done:
+                raise _Done()
+
+    def handle_data(self, data):
+        if self._textarea:
+            self._text.append(data)
+
+    def handle_entityref(self, name):
+        if self._textarea:
+            self._text.append(_TEXTAREA_ENTITIES.get(name, '&%s;' % name))
+
+    def handle_charref(self, name):
+        if self._textarea:
+            self._text.append(_TEXTAREA_CHARREFS.get(name, '&#%s;' % name))
+
+    def extract(self, page, chunksize = _CHUNK_SIZE, encoding = None):
+        """
+        Parse ``page`` (a string, or a file-like object) until every wanted
+        value is found, or the page ends.  Returns ``self.values``, as unicode.
+
+        A page of bytes is decoded as ``encoding`` - by default, the charset
+        its <meta> names, or utf-8 - as it is fed: HTMLParser unescapes
+        attribute values to unicode, which can't be mixed with non-ASCII bytes.
+        """
+        if hasattr(page, 'read'):
+            chunks = iter(lambda: page.read(chunksize), '')
+        else:
+            chunks = (page[i:i + chunksize] for i in xrange(0, len(page), chunksize))
+
+        decoder = None
+        try:
+            for chunk in chunks:
+                if not isinstance(chunk, unicode):
+                    if decoder is None:
+                        charset = encoding or _page_charset(chunk)
+                        decoder = codecs.getincrementaldecoder(charset)('replace')
+                    chunk = decoder.decode(chunk)
+                self.feed(chunk)
+            if decoder is not None:
+                self.feed(decoder.decode('', True))
+            self.close()
+
+        except _Done:
+            pass
+
+        except HTMLParser.HTMLParseError as e:
+            debug("  !! Parse error in page, after finding %s: %s" % (sorted(self.values), e))
+
+        return self.values
+
+#//end class EditPageExtractor
+
+
+def extract_edit_form(page, chunksize = _CHUNK_SIZE, encoding = None):
+    """Extract the values the post edit form needs from an /edit/<id> page."""
+    return EditPageExtractor().extract(page, chunksize, encoding)
+
+
+#-------------------------------------------------------------------------------
+
+_FORM_KEY_RE = re.compile(r'Tumblr\.Customize\.user_form_key\s?=\s?[\'\"]([^\'\"]+)[\'\"];')
+_BLOG_SET = 'Tumblr.Customize.blog.set('
+
+# how much of the previous chunk is kept, so that matches spanning two
+# chunks aren't missed
+_FORM_KEY_OVERLAP = 512
+
+# what is interesting to the bracket-balancing scan, outside / inside strings
+_JSON_STRUCTURE_RE = re.compile(r'[\"{}\[\]]')
+_JSON_STRING_RE = re.compile(r'[\"\\]')
+
+
+class CustomizePageScanner(object):
+    """
+    Incrementally scans a /customize/<blog> page for the two things we need
+    from it: the ``user_form_key``, and the JSON object passed to
+    ``Tumblr.Customize.blog.set(...)``.  Feed it the page a chunk at a time;
+    ``feed`` returns True once both have been found, and the rest of the
+    page can be skipped.
+
+    The end of the JSON object is found by balancing brackets (skipping over
+    strings), so only the object itself is ever buffered.
+    """
+
+    def __init__(self):
+        self.userFormKey = None
+        self.themeJSON = None
+
+        self._keyTail = ''
+        self._setTail = ''
+
+        self._jsonParts = None
+        self._depth = 0
+        self._inString = False
+        self._escaped = False
+
+    @property
+    def done(self):
+        return self.userFormKey is not None and self.themeJSON is not None
+
+    def feed(self, chunk):
+        if self.userFormKey is None:
+            self._scan_form_key(chunk)
+
+        if self.themeJSON is None:
+            if self._jsonParts is None:
+                self._find_blog_set(chunk)
+            else:
+                self._scan_json(chunk)
+
+        return self.done
+
+    def _scan_form_key(self, chunk):
+        window = self._keyTail + chunk
+        m = _FORM_KEY_RE.search(window)
+        if m:
+            self.userFormKey = m.group(1)
+            self._keyTail = ''
+        else:
+            self._keyTail = window[-_FORM_KEY_OVERLAP:]
+
+    def _find_blog_set(self, chunk):
+        window = self._setTail + chunk
+        i = window.find(_BLOG_SET)
+        if i < 0:
+            self._setTail = window[-len(_BLOG_SET):]
+            return
+
+        self._setTail = ''
+        self._jsonParts = []
+        self._scan_json(window[i + len(_BLOG_SET):])
+
+    def _scan_json(self, chunk):
+        i = 0
+        n = len(chunk)
+
+        if self._escaped and n:
+            self._escaped = False
+            i = 1
+
+        while i < n:
+            if self._inString:
+                m = _JSON_STRING_RE.search(chunk, i)
+                if not m:
+                    break
+
+                i = m.end()
+                if m.group() == '\\':
+                    if i >= n:
+                        self._escaped = True
+                        break
+                    i += 1
+                else:
+                    self._inString = False
+
+            else:
+                m = _JSON_STRUCTURE_RE.search(chunk, i)
+                if not m:
+                    break
+
+                i = m.end()
+                c = m.group()
+                if c == '"':
+                    self._inString = True
+                elif c in '{[':
+                    self._depth += 1
+                else:
+                    self._depth -= 1
+                    if self._depth <= 0:
+                        self._jsonParts.append(chunk[:i])
+                        self.themeJSON = ''.join(self._jsonParts).strip()
+                        self._jsonParts = []
+                        return
+
+        self._jsonParts.append(chunk)
+
+    def scan(self, page, chunksize = _CHUNK_SIZE):
+        """
+        Feed ``page`` (a string, or a file-like object) until both values are
+        found, or the page ends.  Returns ``(userFormKey, themeJSON)``; either
+        may be None if it wasn't found.
+        """
+        if hasattr(page, 'read'):
+            chunks = iter(lambda: page.read(chunksize), '')
+        else:
+            chunks = (page[i:i + chunksize] for i in xrange(0, len(page), chunksize))
+
+        for chunk in chunks:
+            if self.feed(chunk):
+                break
+
+        return self.userFormKey, self.themeJSON
+
+#//end class CustomizePageScanner
+
+
+def scan_customize_page(page, chunksize = _CHUNK_SIZE):
+    """Find the ``user_form_key`` and the theme JSON on a /customize/<blog> page."""
+    return CustomizePageScanner().scan(page, chunksize)
+
+
+#-------------------------------------------------------------------------------
+#   The posts on a page of a blog's post listing (www.tumblr.com/blog/<blog>)
+
+POST_TYPES = ('text', 'photo', 'photoset', 'quote', 'link', 'chat', 'conversation',
+              'audio', 'video', 'answer', 'regular')
+
+# classes marking a post that isn't (publicly) published
+_POST_STATES = (('is_private', 'private'), ('is_queued', 'queued'), ('is_draft', 'draft'))
+
+_POST_TAG_RE = re.compile(r'<(?:li|div)\b[^>]*?\bid=["\']post_(\d+)["\'][^>]*>')
+_CLASS_RE = re.compile(r'\bclass=["\']([^"\']*)["\']')
+
+
+def extract_posts(page):
+    """
+    The ``(id, type, state)`` of every post on a page of the post listing,
+    in the order they appear.  ``state`` is 'published', 'private', 'queued'
+    or 'draft'.
+    """
+    posts = []
+    seen = set()
+    for m in _POST_TAG_RE.finditer(page):
+        postID = int(m.group(1))
+        if postID in seen:
+            continue
+        seen.add(postID)
+
+        classMatch = _CLASS_RE.search(m.group(0))
+        classes = classMatch.group(1).split() if classMatch else ()
+
+        postType = None
+        for cls in classes:
+            if cls in POST_TYPES:
+                postType = cls
+                break
+
+        state = 'published'
+        for cls, name in _POST_STATES:
+            if cls in classes:
+                state = name
+                break
+
+        posts.append((postID, postType, state))
+
+    return posts
@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+"""
+!    filelock.py
+!  --------------------------------------------------------------------------
+!
+!    A lock that is shared by the threads of this process *and* by other
+!    processes: an in-process RLock, plus an exclusive flock() on a lock
+!    file.  Used e.g. so that parallel workers using the same session don't
+!    all log in at once.
+!
+!        with file_lock('/path/to/something.lock'):
+!            ...
+!
+!    file_lock() hands out one lock per path, so taking the same lock again
+!    further down the stack (in the same thread) doesn't deadlock.  Where
+!    fcntl isn't available, only the threads of this process are kept apart.
+!
+!    Except where otherwise noted, the code in tumblrpype is
+!        Copyright (c) 2012  Felix Bonkoski <felix@post-theory.com>
+!        Licensed under the MIT license:
+!            <http://www.opensource.org/licenses/mit-license.php>
+!
+"""
+
+import os
+import threading
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+from config import ensure_config_dir
+
+__all__ = ['FileLock', 'file_lock']
+
+#-------------------------------------------------------------------------------
+
+_LOCKS = {}
+_LOCKS_LOCK = threading.Lock()
+
+
+class FileLock(object):
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.RLock()
+        self._depth = 0
+        self._fd = None
+
+    def acquire(self):
+        self._lock.acquire()
+        try:
+            if self._depth == 0 and fcntl is not None:
+                ensure_config_dir()
+                lockDir = os.path.dirname(self.path)
+                if lockDir and not os.path.isdir(lockDir):
+                    os.makedirs(lockDir)
+
+                fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0600)
+                try:
+                    fcntl.flock(fd, fcntl.LOCK_EX)
+                except:
+                    os.close(fd)
+                    raise
+                self._fd = fd
+        except:
+            self._lock.release()
+            raise
+
+        self._depth += 1
+
+    def release(self):
+        self._depth -= 1
+        if self._depth == 0 and self._fd is not None:
+            fd, self._fd = self._fd, None
+            fcntl.flock(fd, fcntl.LOCK_UN)
+            os.close(fd)
+        self._lock.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, excType, exc, tb):
+        self.release()
+
+#//end class FileLock
+
+
+def file_lock(path):
+    """The FileLock for ``path`` (the same object for the same path)."""
+    path = os.path.abspath(path)
+    with _LOCKS_LOCK:
+        lock = _LOCKS.get(path)
+        if lock is None:
+            lock = _LOCKS[path] = FileLock(path)
+        return lock
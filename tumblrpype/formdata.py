@@ -10,15 +10,15 @@
 !
 """
 
+import os
 import urllib
-import codecs
 import mimetypes
 from uuid import uuid4
-from io import BytesIO
 import six
 from six import b
 
-writer = codecs.lookup('utf-8')[3]
+# Size of the chunks that file-backed fields are read (and sent) in
+CHUNK_SIZE = 64 * 1024
 
 #----------------------------------------------------------------------------------------------------------------------
 #   These functions are taken from the Python urllib3 library, 'filepost.py'
@@ -64,42 +64,153 @@ def encode_multipart_formdata(fields, boundary = None):
     :param boundary:
         If not specified, then a random boundary will be generated using
         :func:`mimetools.choose_boundary`.
+
+    Returns a tuple of the whole body (as one string) and the Content-Type.
+    Use :class:`MultipartEncoder` to stream the body instead.
     """
-    body = BytesIO()
-    if boundary is None:
-        boundary = choose_boundary()
+    encoder = MultipartEncoder(fields, boundary)
+
+    return b('').join(encoder), encoder.content_type
+
+#----------------------------------------------------------------------------------------------------------------------
+#   Streaming multipart/form-data
+
 
-    for fieldname, value in iter_fields(fields):
-        body.write(b('--%s\r\n' % (boundary)))
+def _to_bytes(s):
+    if isinstance(s, six.text_type):
+        return s.encode('utf-8')
+    return s
+
+
+class FileField(object):
+    """
+    A form-data value whose body is read from a file - either a path, or a
+    file object (read from its current position) - in chunks, as it is sent.
+    """
 
-        if isinstance(value, tuple):
-            filename, data = value
-            writer(body).write('Content-Disposition: form-data; name="%s"; '
-                               'filename="%s"\r\n' % (fieldname, filename))
-            body.write(b('Content-Type: %s\r\n\r\n' %
-                       (get_content_type(filename))))
+    def __init__(self, source, filename = None):
+        self.source = source
+
+        if filename is None:
+            if isinstance(source, six.string_types):
+                filename = os.path.basename(source)
+            else:
+                filename = os.path.basename(getattr(source, 'name', '') or '')
+
+        self.filename = filename
+
+        if isinstance(source, six.string_types):
+            self.offset = 0
+            self.size = os.path.getsize(source)
         else:
-            data = value
-            writer(body).write('Content-Disposition: form-data; name="%s"\r\n\r\n'
-                               % (fieldname))
-            #body.write(b'Content-Type: text/plain\r\n\r\n')
-            #body.write(b'\r\n')
+            self.offset = source.tell()
+            try:
+                self.size = os.fstat(source.fileno()).st_size - self.offset
+            except (AttributeError, IOError, OSError):
+                source.seek(0, os.SEEK_END)
+                self.size = source.tell() - self.offset
+                source.seek(self.offset)
 
-        if isinstance(data, int):
-            data = str(data)  # Backwards compatibility
+    def __len__(self):
+        return self.size
 
-        if isinstance(data, six.text_type):
-            writer(body).write(data)
+    def __iter__(self):
+        if isinstance(self.source, six.string_types):
+            F = open(self.source, 'rb')
         else:
-            body.write(data)
+            F = self.source
+            F.seek(self.offset)
+
+        try:
+            remaining = self.size
+            while remaining > 0:
+                chunk = F.read(min(CHUNK_SIZE, remaining))
+                if not chunk:
+                    raise IOError('%s is shorter than expected' % (self.filename or 'File'))
+                remaining -= len(chunk)
+                yield chunk
+        finally:
+            if F is not self.source:
+                F.close()
 
-        body.write(b'\r\n')
+#//end class FileField
 
-    body.write(b('--%s--\r\n' % (boundary)))
 
-    content_type = b('multipart/form-data; boundary=%s' % boundary)
+class MultipartEncoder(object):
+    """
+    Streaming version of :func:`encode_multipart_formdata`.
+
+    Iterating over the encoder yields the body in chunks, and ``len()`` gives
+    its exact length up front, so it can be passed straight to urllib2 as the
+    request data.  Besides strings, a value (or the data of a
+    ``(filename, data)`` tuple) may be a :class:`FileField` or a file object;
+    those are only read while the body is being sent.  The encoder can be
+    iterated more than once (e.g. to retry a request).
+    """
+
+    def __init__(self, fields, boundary = None):
+        if boundary is None:
+            boundary = choose_boundary()
 
-    return body.getvalue(), content_type
+        self.boundary = boundary
+        self.content_type = b('multipart/form-data; boundary=%s' % boundary)
+
+        # the body is a list of parts: byte strings, and FileFields
+        parts = []
+        pending = []
+
+        for fieldname, value in iter_fields(fields):
+            pending.append(b('--%s\r\n' % boundary))
+
+            if isinstance(value, FileField):
+                value = (value.filename, value)
+            elif hasattr(value, 'read'):
+                value = FileField(value)
+                value = (value.filename, value)
+
+            if isinstance(value, tuple):
+                filename, data = value
+                pending.append(_to_bytes(u'Content-Disposition: form-data; name="%s"; '
+                                         u'filename="%s"\r\n' % (fieldname, filename)))
+                pending.append(b('Content-Type: %s\r\n\r\n' % get_content_type(filename)))
+            else:
+                data = value
+                pending.append(_to_bytes(u'Content-Disposition: form-data; name="%s"\r\n\r\n'
+                                         % fieldname))
+
+            if isinstance(data, int):
+                data = str(data)  # Backwards compatibility
+
+            if hasattr(data, 'read'):
+                data = FileField(data)
+
+            if isinstance(data, FileField):
+                parts.append(b('').join(pending))
+                parts.append(data)
+                pending = []
+            else:
+                pending.append(_to_bytes(data))
+
+            pending.append(b'\r\n')
+
+        pending.append(b('--%s--\r\n' % boundary))
+        parts.append(b('').join(pending))
+
+        self.parts = parts
+        self.length = sum(len(part) for part in parts)
+
+    def __len__(self):
+        return self.length
+
+    def __iter__(self):
+        for part in self.parts:
+            if isinstance(part, FileField):
+                for chunk in part:
+                    yield chunk
+            elif part:
+                yield part
+
+#//end class MultipartEncoder
 
 
 
@@ -138,9 +249,147 @@ def to_utf8_optional_iterator(x):
     else:
         return [ to_utf8_if_string(e) for e in l ]
 
+def _quote(s):
+    # what urllib.urlencode() does, with spaces as %20 rather than '+'
+    return urllib.quote(s, '')
+
 def encode_urlencoded_formdata(kvDict):
     """Serialize as post data for a POST request."""
-    d = {}
+    # the same as urllib.urlencode(..., doseq = True), in a single pass
+    pairs = []
     for k, v in kvDict.iteritems():
-        d[k.encode('utf-8')] = to_utf8_optional_iterator(v)
-    return urllib.urlencode(d, True).replace('+', '%20')
+        k = _quote(k.encode('utf-8'))
+        if isinstance(v, basestring):
+            pairs.append('%s=%s' % (k, _quote(to_utf8(v))))
+            continue
+        try:
+            values = iter(v)
+        except TypeError:
+            pairs.append('%s=%s' % (k, _quote(str(v))))
+            continue
+        for value in values:
+            pairs.append('%s=%s' % (k, _quote(str(to_utf8_if_string(value)))))
+    return '&'.join(pairs)
+
+
+
+#----------------------------------------------------------------------------------------------------------------------
+#   Form templates: the same form, sent over and over with only a few fields changing
+
+
+class _FormTemplate(object):
+    """
+    The encoded form as a list of byte strings, with a None where the value
+    of each variable field goes; fill() puts those in, and joins it all.
+    """
+
+    def __init__(self, variable):
+        self.variable = frozenset(variable)
+        self.parts = []
+        self.slots = []
+
+    def _constant(self, data):
+        if self.parts and self.parts[-1] is not None:
+            self.parts[-1] += data
+        else:
+            self.parts.append(data)
+
+    def _slot(self, fieldname):
+        self.slots.append((len(self.parts), fieldname))
+        self.parts.append(None)
+
+    def _encode_value(self, value):
+        raise NotImplementedError
+
+    def fill(self, values):
+        """The whole body, with the variable fields' ``values`` (a dict) put in."""
+        parts = list(self.parts)
+        encode = self._encode_value
+        for index, fieldname in self.slots:
+            parts[index] = encode(values[fieldname])
+        return b('').join(parts)
+
+#//end class _FormTemplate
+
+
+class MultipartTemplate(_FormTemplate):
+    """
+    A multipart/form-data form with everything but the ``variable`` fields -
+    every constant value, and every part's headers - encoded up front:
+
+        template = MultipartTemplate(fields, variable = ('post[id]',))
+        body = template.fill({'post[id]' : '123'})
+
+    ``fields`` is as for :func:`encode_multipart_formdata` (but without file
+    objects); the values given for the variable fields only hold their
+    place.  The filled in body is the same as encode_multipart_formdata()
+    makes of the same fields, with the template's ``boundary``.
+    """
+
+    def __init__(self, fields, variable = (), boundary = None):
+        _FormTemplate.__init__(self, variable)
+
+        if boundary is None:
+            boundary = choose_boundary()
+
+        self.boundary = boundary
+        self.content_type = b('multipart/form-data; boundary=%s' % boundary)
+
+        closing = b('--%s--\r\n' % boundary)
+
+        for fieldname, value in iter_fields(fields):
+            if fieldname in self.variable:
+                self._constant(b('--%s\r\n' % boundary))
+                self._constant(_to_bytes(u'Content-Disposition: form-data; name="%s"\r\n\r\n'
+                                         % fieldname))
+                self._slot(fieldname)
+                self._constant(b'\r\n')
+                continue
+
+            encoder = MultipartEncoder([(fieldname, value)], boundary)
+            if any(isinstance(part, FileField) for part in encoder.parts):
+                raise ValueError('A form template can not hold a file: %s' % fieldname)
+            self._constant(b('').join(encoder)[:-len(closing)])
+
+        self._constant(closing)
+
+    def _encode_value(self, value):
+        if isinstance(value, int):
+            return str(value)
+        return _to_bytes(value)
+
+#//end class MultipartTemplate
+
+
+class UrlencodedTemplate(_FormTemplate):
+    """
+    The same for an application/x-www-form-urlencoded form: the filled in
+    body is what encode_urlencoded_formdata() makes of the same fields.
+    """
+
+    content_type = b'application/x-www-form-urlencoded'
+
+    def __init__(self, fields, variable = ()):
+        _FormTemplate.__init__(self, variable)
+
+        separator = b''
+        for fieldname, value in iter_fields(fields):
+            if fieldname in self.variable:
+                self._constant(b('%s%s=' % (separator, _quote(to_utf8(fieldname)))))
+                self._slot(fieldname)
+            else:
+                pairs = encode_urlencoded_formdata({fieldname : value})
+                if not pairs:
+                    continue
+                self._constant(separator + pairs)
+            separator = b'&'
+
+        if not self.parts:
+            self._constant(b'')
+
+    def _encode_value(self, value):
+        if isinstance(value, int):
+            return str(value)
+        return _quote(to_utf8(value))
+
+#//end class UrlencodedTemplate
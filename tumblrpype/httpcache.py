@@ -0,0 +1,340 @@
+# -*- coding: utf-8 -*-
+"""
+!    httpcache.py
+!  --------------------------------------------------------------------------
+!
+!    An (opt-in) cache of the pages TumblrLogin.fetch() downloads - the post
+!    listing, edit pages, the dashboard ...:
+!
+!        session = TumblrLogin(user, responsecache = True)
+!
+!    Pages are kept per URL *and* session (the same URL shows every login
+!    something else), zlib compressed, in one SQLite table,
+!    `<_CONFIG_DIR>/responses.db`; the most recently used ones are also kept,
+!    as they are, in memory.
+!
+!    How long a page is served from the cache without asking Tumblr depends
+!    on its route: `ttls` is a list of (regular expression, seconds), matched
+!    against the path of the URL ('blog/<blog>/2', 'edit/<id>' ...), the
+!    first match winning.  After that, the page is asked for again with its
+!    ETag / Last-Modified, and only downloaded again if it changed (anything
+!    but a 304 Not Modified).  By default every page is revalidated every
+!    time (`ttl` 0); None doesn't cache the route at all.
+!
+!    Once the table holds more than `maxsize` (compressed) bytes, the least
+!    recently used pages go.  `stats` counts hits (served without a request),
+!    revalidations, misses, and the pages stored and evicted.
+!
+!    Except where otherwise noted, the code in tumblrpype is
+!        Copyright (c) 2012  Felix Bonkoski <felix@post-theory.com>
+!        Licensed under the MIT license:
+!            <http://www.opensource.org/licenses/mit-license.php>
+!
+"""
+
+import collections
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+import urllib2
+import urlparse
+import zlib
+
+from config import _CONFIG_DIR, debug
+from sqlstore import SQLiteStore
+
+__all__ = ['CachedResponse', 'ResponseCache', 'response_cache']
+
+#-------------------------------------------------------------------------------
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key           TEXT PRIMARY KEY,
+    url           TEXT NOT NULL,
+    etag          TEXT,
+    lastmodified  TEXT,
+    body          BLOB NOT NULL,
+    size          INTEGER NOT NULL,
+    validated     REAL NOT NULL,
+    used          REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS responses_used ON responses (used);
+"""
+
+# seconds a page is served without asking (0: always revalidate, None: not cached)
+DEFAULT_TTL = 0
+
+# compressed bytes on disk, uncompressed bytes in memory
+MAX_SIZE = 64 * 1024 * 1024
+MEMORY_SIZE = 8 * 1024 * 1024
+
+# eviction makes room for this much more than it has to, so that it doesn't
+# run on every store
+_EVICT_TO = 0.9
+
+COMPRESS_LEVEL = 6
+
+# `validated` is when the server last said this is the page
+CachedResponse = collections.namedtuple('CachedResponse', 'body etag lastmodified validated')
+
+
+def _key(session, url):
+    return hashlib.sha1('%s\0%s' % (session, url)).hexdigest()
+
+
+class ResponseCache(SQLiteStore):
+
+    SCHEMA = _SCHEMA
+
+    def __init__(self, path = None, ttls = (), ttl = DEFAULT_TTL, maxsize = MAX_SIZE,
+                 memorysize = MEMORY_SIZE):
+        SQLiteStore.__init__(self, path or os.path.join(_CONFIG_DIR, 'responses.db'))
+
+        self.ttls = [(re.compile(pattern), seconds) for pattern, seconds in ttls]
+        self.ttl = ttl
+        self.maxSize = maxsize
+        self.memorySize = memorysize
+
+        # key -> CachedResponse, least recently used first
+        self._memory = collections.OrderedDict()
+        self._memoryBytes = 0
+        self._lock = threading.Lock()
+
+        self.stats = {'hits' : 0,
+                      'memory_hits' : 0,
+                      'revalidated' : 0,
+                      'misses' : 0,
+                      'uncached' : 0,
+                      'stored' : 0,
+                      'evicted' : 0}
+
+    def __count(self, name):
+        with self._lock:
+            self.stats[name] += 1
+
+    def hit_ratio(self):
+        """The share of fetches that didn't download the page: hits, and successful revalidations."""
+        with self._lock:
+            saved = self.stats['hits'] + self.stats['revalidated']
+            total = saved + self.stats['misses']
+        return float(saved) / total if total else 0.0
+
+    def ttl_for(self, url):
+        path = urlparse.urlparse(url).path.lstrip('/')
+        for pattern, seconds in self.ttls:
+            if pattern.match(path):
+                return seconds
+        return self.ttl
+
+    #---------------------------------------------------------------------------
+
+    def __remember(self, key, cached):
+        # in memory, as the most recently used - if it fits at all
+        with self._lock:
+            old = self._memory.pop(key, None)
+            if old is not None:
+                self._memoryBytes -= len(old.body)
+            if len(cached.body) > self.memorySize:
+                return
+
+            self._memory[key] = cached
+            self._memoryBytes += len(cached.body)
+            while self._memoryBytes > self.memorySize:
+                oldKey, old = self._memory.popitem(last = False)
+                self._memoryBytes -= len(old.body)
+
+    def __forget_in_memory(self, key):
+        with self._lock:
+            old = self._memory.pop(key, None)
+            if old is not None:
+                self._memoryBytes -= len(old.body)
+
+    def get(self, session, url):
+        """The CachedResponse of ``url`` for ``session``, or None."""
+        key = _key(session, url)
+
+        with self._lock:
+            cached = self._memory.pop(key, None)
+            if cached is not None:
+                self._memory[key] = cached
+                return cached
+
+        rows = self._query('SELECT body, etag, lastmodified, validated FROM responses WHERE key = ?', (key,))
+        if not rows:
+            return None
+
+        body, etag, lastModified, validated = rows[0]
+        try:
+            cached = CachedResponse(zlib.decompress(body), etag, lastModified, validated)
+        except zlib.error:
+            debug("  !! Cached copy of %s is corrupt - dropping it" % url)
+            self.forget(session, url)
+            return None
+
+        self.__touch(key)
+        self.__remember(key, cached)
+        return cached
+
+    def __touch(self, key):
+        # keeps pages in use from being evicted; a page served from memory
+        # isn't touched on disk every time
+        try:
+            with self._transaction() as conn:
+                conn.execute('UPDATE responses SET used = ? WHERE key = ?', (time.time(), key))
+        except sqlite3.OperationalError as e:
+            debug("  .. could not mark cached page as used: %s" % e)
+
+    def put(self, session, url, body, etag = None, lastmodified = None):
+        key = _key(session, url)
+        now = time.time()
+        compressed = zlib.compress(body, COMPRESS_LEVEL)
+
+        with self._transaction() as conn:
+            conn.execute('INSERT OR REPLACE INTO responses '
+                         '(key, url, etag, lastmodified, body, size, validated, used) '
+                         'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                         (key, url, etag, lastmodified, sqlite3.Binary(compressed),
+                          len(compressed), now, now))
+            evicted = self.__evict(conn)
+
+        self.__remember(key, CachedResponse(body, etag, lastmodified, now))
+        with self._lock:
+            self.stats['stored'] += 1
+            self.stats['evicted'] += len(evicted)
+        for key in evicted:
+            self.__forget_in_memory(key)
+
+    def __evict(self, conn):
+        total = conn.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+        if total <= self.maxSize:
+            return []
+
+        target = self.maxSize * _EVICT_TO
+        evicted = []
+        for key, size in conn.execute('SELECT key, size FROM responses ORDER BY used').fetchall():
+            if total <= target:
+                break
+            evicted.append(key)
+            total -= size
+
+        conn.executemany('DELETE FROM responses WHERE key = ?', [(key,) for key in evicted])
+        debug("  .. evicted %d page(s) from the response cache" % len(evicted))
+        return evicted
+
+    def revalidated(self, session, url, cached, etag = None, lastmodified = None):
+        """Record that the server said (just now) ``cached`` is still the page.  Returns it, updated."""
+        key = _key(session, url)
+        now = time.time()
+        cached = cached._replace(etag = etag or cached.etag,
+                                 lastmodified = lastmodified or cached.lastmodified,
+                                 validated = now)
+
+        with self._transaction() as conn:
+            conn.execute('UPDATE responses SET etag = ?, lastmodified = ?, validated = ?, used = ? '
+                         'WHERE key = ?', (cached.etag, cached.lastmodified, now, now, key))
+
+        self.__remember(key, cached)
+        return cached
+
+    def forget(self, session, url):
+        key = _key(session, url)
+        self.__forget_in_memory(key)
+        if os.path.exists(self.path):
+            with self._transaction() as conn:
+                conn.execute('DELETE FROM responses WHERE key = ?', (key,))
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            self._memoryBytes = 0
+        if os.path.exists(self.path):
+            with self._transaction() as conn:
+                conn.execute('DELETE FROM responses')
+
+    #---------------------------------------------------------------------------
+
+    def fetch(self, session, url, open):
+        """
+        The body of ``url``, as ``session`` sees it: from the cache while it
+        is fresh, else from ``open(headers)`` - which opens ``url`` with the
+        extra request ``headers``, and returns the response (or raises the
+        urllib2.HTTPError, as for a 304).  Returns None for a response other
+        than 200.
+        """
+        ttl = self.ttl_for(url)
+        if ttl is None:
+            self.__count('uncached')
+            return self.__download(open, {})
+
+        with self._lock:
+            inMemory = _key(session, url) in self._memory
+        cached = self.get(session, url)
+
+        if cached is not None and ttl and time.time() - cached.validated < ttl:
+            debug("  .. served from the response cache")
+            with self._lock:
+                self.stats['hits'] += 1
+                if inMemory:
+                    self.stats['memory_hits'] += 1
+            return cached.body
+
+        headers = {}
+        if cached is not None:
+            if cached.etag:
+                headers['If-None-Match'] = cached.etag
+            if cached.lastmodified:
+                headers['If-Modified-Since'] = cached.lastmodified
+
+        try:
+            resp = open(headers)
+        except urllib2.HTTPError as e:
+            if e.code != 304 or cached is None:
+                raise
+            info = e.info()
+            e.close()
+            debug("  .. not modified - served from the response cache")
+            self.__count('revalidated')
+            return self.revalidated(session, url, cached, info.getheader('etag'),
+                                    info.getheader('last-modified')).body
+
+        self.__count('misses')
+        if resp.code != 200:
+            debug("  !! Failed to fetch: Error [%s]" % (resp.code))
+            return None
+
+        body = resp.fp.read()
+        info = resp.info()
+        etag = info.getheader('etag')
+        lastModified = info.getheader('last-modified')
+
+        if 'no-store' in (info.getheader('cache-control') or ''):
+            self.forget(session, url)
+        else:
+            self.put(session, url, body, etag, lastModified)
+
+        return body
+
+    def __download(self, open, headers):
+        resp = open(headers)
+        if resp.code != 200:
+            debug("  !! Failed to fetch: Error [%s]" % (resp.code))
+            return None
+        return resp.fp.read()
+
+#//end class ResponseCache
+
+
+_CACHES = {}
+_CACHES_LOCK = threading.Lock()
+
+def response_cache(path = None):
+    """The ResponseCache for ``path`` (shared by everything in the process), with the default policy."""
+    path = os.path.abspath(path or os.path.join(_CONFIG_DIR, 'responses.db'))
+    with _CACHES_LOCK:
+        cache = _CACHES.get(path)
+        if cache is None:
+            cache = _CACHES[path] = ResponseCache(path)
+        return cache
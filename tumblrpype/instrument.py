@@ -0,0 +1,239 @@
+# -*- coding: utf-8 -*-
+"""
+!    instrument.py
+!  --------------------------------------------------------------------------
+!
+!    Structured, per-request instrumentation.
+!
+!    Every HTTP exchange (and every parse step) made by TumblrLogin emits an
+!    event - a plain dict - with its timings and byte counts:
+!
+!        {'type': 'http', 'method': 'GET', 'route': 'customize',
+!         'url': 'http://www.tumblr.com/customize/myblog', 'status': 200,
+!         'reused': True, 'connect': 0.0, 'wait': 0.081, 'download': 0.012,
+!         'total': 0.094, 'bytes_sent': 0, 'bytes_received': 73311}
+!
+!        {'type': 'parse', 'name': 'edit_page', 'total': 0.004, 'bytes': 64210}
+!
+!    Byte counts are what went over the wire.  A compressed response also
+!    has `bytes_decoded` (and a compressed request `bytes_sent_raw`): the
+!    size before compression.  The difference is counted as `bytes_saved`.
+!
+!    Events go to the hooks registered with add_hook(), and (once enable()d)
+!    into in-process latency histograms and counters, see stats().  While no
+!    hook is registered and collecting is off, nothing is measured at all.
+!
+!    Except where otherwise noted, the code in tumblrpype is
+!        Copyright (c) 2012  Felix Bonkoski <felix@post-theory.com>
+!        Licensed under the MIT license:
+!            <http://www.opensource.org/licenses/mit-license.php>
+!
+"""
+
+import bisect
+import sys
+import threading
+import time
+
+__all__ = ['ENABLED', 'add_hook', 'remove_hook', 'enable', 'disable', 'reset',
+           'emit', 'timed', 'count', 'stats', 'Histogram']
+
+#-------------------------------------------------------------------------------
+
+# True while anything listens: checked before taking any measurements
+ENABLED = False
+
+_hooks = []
+_collecting = False
+
+_lock = threading.Lock()
+_histograms = {}
+_counters = {}
+
+# the timings of an event that are fed to the histograms ('queue' is the
+# time a request waited for the scheduler)
+_TIMINGS = ('queue', 'connect', 'wait', 'download', 'total')
+
+# histogram bucket upper bounds, in seconds
+BUCKETS = (0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1.0, 2.0, 5.0, 10.0, 30.0)
+
+
+def _update_enabled():
+    global ENABLED
+    ENABLED = bool(_hooks) or _collecting
+
+
+class Histogram(object):
+    """A latency histogram, with fixed (roughly logarithmic) buckets."""
+
+    def __init__(self):
+        self.buckets = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = None
+
+    def add(self, value):
+        self.buckets[bisect.bisect_left(BUCKETS, value)] += 1
+        self.count += 1
+        self.sum += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def percentile(self, fraction):
+        """The upper bound of the bucket holding the ``fraction`` percentile."""
+        if not self.count:
+            return None
+
+        target = fraction * self.count
+        seen = 0
+        for i, n in enumerate(self.buckets):
+            seen += n
+            if seen >= target:
+                return BUCKETS[i] if i < len(BUCKETS) else self.max
+
+        return self.max
+
+    def summary(self):
+        return {'count' : self.count,
+                'sum' : self.sum,
+                'mean' : self.sum / self.count if self.count else None,
+                'min' : self.min,
+                'max' : self.max,
+                'p50' : self.percentile(0.5),
+                'p95' : self.percentile(0.95),
+                'p99' : self.percentile(0.99),
+                'buckets' : dict(zip([str(b) for b in BUCKETS] + ['inf'], self.buckets))}
+
+#//end class Histogram
+
+
+def add_hook(fn):
+    """Call ``fn(event)`` for every event (in the thread that made the request)."""
+    with _lock:
+        if fn not in _hooks:
+            _hooks.append(fn)
+        _update_enabled()
+
+def remove_hook(fn):
+    with _lock:
+        if fn in _hooks:
+            _hooks.remove(fn)
+        _update_enabled()
+
+def enable():
+    """Start collecting histograms and counters."""
+    global _collecting
+    with _lock:
+        _collecting = True
+        _update_enabled()
+
+def disable():
+    """Stop collecting histograms and counters (hooks stay registered)."""
+    global _collecting
+    with _lock:
+        _collecting = False
+        _update_enabled()
+
+def reset():
+    with _lock:
+        _histograms.clear()
+        _counters.clear()
+
+
+def count(name, n = 1):
+    """Bump the counter ``name`` (only while collecting)."""
+    if not _collecting:
+        return
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + n
+
+
+def _collect(event):
+    prefix = '%s.%s' % (event['type'], event.get('route') or event.get('name'))
+
+    with _lock:
+        for timing in _TIMINGS:
+            value = event.get(timing)
+            if value is None:
+                continue
+            key = '%s.%s' % (prefix, timing)
+            histogram = _histograms.get(key)
+            if histogram is None:
+                histogram = _histograms[key] = Histogram()
+            histogram.add(value)
+
+        _counters[prefix] = _counters.get(prefix, 0) + 1
+        for key in ('bytes_sent', 'bytes_received', 'bytes', 'bytes_decoded', 'bytes_sent_raw'):
+            if event.get(key):
+                name = '%s.%s' % (prefix, key)
+                _counters[name] = _counters.get(name, 0) + event[key]
+        saved = 0
+        if 'bytes_decoded' in event:
+            saved += event['bytes_decoded'] - event['bytes_received']
+        if 'bytes_sent_raw' in event:
+            saved += event['bytes_sent_raw'] - event['bytes_sent']
+        if saved:
+            name = '%s.bytes_saved' % prefix
+            _counters[name] = _counters.get(name, 0) + saved
+        if event.get('reused'):
+            name = '%s.reused' % prefix
+            _counters[name] = _counters.get(name, 0) + 1
+        if event.get('error'):
+            name = '%s.errors' % prefix
+            _counters[name] = _counters.get(name, 0) + 1
+        if event.get('retries'):
+            name = '%s.retries' % prefix
+            _counters[name] = _counters.get(name, 0) + event['retries']
+
+
+def emit(event):
+    """Hand ``event`` to the histograms and every hook.  A failing hook is reported, not raised."""
+    if _collecting and event.get('type') != 'log':
+        _collect(event)
+
+    for fn in list(_hooks):
+        try:
+            fn(event)
+        except Exception as e:
+            sys.stderr.write('tumblrpype: instrumentation hook %r failed: %s\n' % (fn, e))
+
+
+class timed(object):
+    """
+    Context manager emitting an event for a (parse) step::
+
+        with timed('parse', 'customize_page') as event:
+            ...
+            event['bytes'] = len(page)
+
+    ``event`` is None when instrumentation is off.
+    """
+
+    def __init__(self, type, name, **fields):
+        self.type = type
+        self.name = name
+        self.fields = fields
+        self.event = None
+
+    def __enter__(self):
+        if ENABLED:
+            self.event = dict(self.fields, type = self.type, name = self.name)
+            self.started = time.time()
+        return self.event
+
+    def __exit__(self, excType, exc, tb):
+        if self.event is not None:
+            self.event['total'] = time.time() - self.started
+            if excType is not None:
+                self.event['error'] = repr(exc)
+            emit(self.event)
+
+
+def stats():
+    """A snapshot of the histograms and counters collected so far."""
+    with _lock:
+        return {'histograms' : dict((key, h.summary()) for key, h in _histograms.iteritems()),
+                'counters' : dict(_counters)}
@@ -15,26 +15,44 @@
 
 import urllib2
 import cookielib
-import re
-import jsonlib
+import copy
+import hashlib
+import mmap
 import os
-
-from bs4 import BeautifulSoup #, Tag
-
-from formdata import encode_multipart_formdata, encode_urlencoded_formdata
-from config import _CONFIG_DIR, DEBUG, debug
+import threading
+import time
+import urlparse
+
+import instrument
+from formdata import MultipartTemplate, encode_urlencoded_formdata
+from config import _CONFIG_DIR, LOGIN_TTL, debug, ensure_config_dir
+from cookiestore import StoredCookieJar, session_store
+from extract import CustomizePageScanner, extract_edit_form, extract_posts
+from filelock import file_lock
+from httpcache import response_cache
+from postindex import post_index
+from scheduler import default_scheduler
+from session import ConnectionPool, KeepAliveHandler
+from themecache import ThemeInfoCache
+from themejson import LAZY, LazyJSONString, ThemeBody, parse_theme_json
+from themestore import ThemeStore, DEPLOYED, FETCHED
+from themevars import apply_theme_variables, coalesce as coalesce_changes, merge_theme_variables
 from user import TumblrUser
 
-__all__ = ['FetchError', 'LoginError', 'TumblrLogin']
+__all__ = ['FetchError', 'LoginError', 'POST_STATES', 'SessionExpiredError', 'TumblrLogin']
 
 #-------------------------------------------------------------------------------
 
 class FetchError(Exception): pass
 class LoginError(Exception): pass
 
-class HTTPFileCookieProcessor(urllib2.BaseHandler):
-    def __init__(self, cookieFile):
-        self.cookiejar = cookielib.LWPCookieJar(cookieFile)
+# A request with a body was bounced to /login: it wasn't made, and its form
+# key (from the old session) won't do - the form has to be fetched again.
+class SessionExpiredError(LoginError): pass
+
+class HTTPCookieJarProcessor(urllib2.BaseHandler):
+    def __init__(self, cookiejar):
+        self.cookiejar = cookiejar
 
     def http_request(self, request):
         self.cookiejar.add_cookie_header(request)
@@ -57,6 +75,68 @@ class HTTPPostHandler(urllib2.BaseHandler):
 
     https_request = http_request
 
+class NoRedirectHandler(urllib2.HTTPRedirectHandler):
+    # Hands 3xx responses back to the caller instead of following them
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        return None
+
+
+# what the edit form's post[state] is, for each state extract_posts() reports
+POST_STATES = {'published' : '0',
+               'draft' : '1',
+               'queued' : '2',
+               'private' : 'private'}
+
+# the selected post[state] of an edit page -> the post's state
+_EDIT_PAGE_STATES = dict((value, state) for state, value in POST_STATES.iteritems())
+
+# The edit form of a photo post.  Most of it is the same for every post, and
+# is encoded once, here; only the `variable` fields are filled in per post.
+_PHOTO_EDIT_FORM = MultipartTemplate([
+        ('UPLOAD_IDENTIFIER', None),
+        ('post[state]', None),
+        ('post[publish_on]', ''),
+        ('post[draft_status]', ''),
+        ('post[date]', None),
+        ('post[source_url]', None),
+        ('post[tags]', None),
+        ('post[slug]', ''),
+        ('custom_tweet', 'Photo: [URL]'),
+        ('custom_tweet_changed', '0'),
+        ('is_rich_text[one]', '0'),
+        ('is_rich_text[two]', '1'),
+        ('is_rich_text[three]', '0'),
+        ('form_key', None),
+        ('photo_raw', ''),
+        ('images', ('', '')),
+        ('photo_src', ''),
+        ('MAX_FILE_SIZE', '10485760'),
+        ('post[two]', None),
+        ('post[three]', None),
+        ('post[type]', 'photo'),
+        ('post[id]', None),
+        ('post[promotion_data][message]', '(No message)'),
+        ('post[promotion_data][icon]', '/images/highlighted_posts/icons/bolt_white.png'),
+        ('post[promotion_data][color]', '#bb3434'),
+    ], variable = ('UPLOAD_IDENTIFIER', 'post[state]', 'post[date]', 'post[source_url]',
+                   'post[tags]', 'form_key', 'post[two]', 'post[three]', 'post[id]'))
+
+
+class _LoginState(object):
+    """
+    Whether a session is logged in, and how many times it logged in - one
+    object, shared by every TumblrLogin on the session (see for_blog()).
+    """
+
+    def __init__(self):
+        # guards logging in, so concurrent requests on a shared login
+        # (see AsyncTumblrLogin) don't all login at once
+        self.lock = threading.RLock()
+        self.count = 0
+        self.loggedIn = False
+
+#//end class _LoginState
+
 
 class TumblrLogin(object):
 
@@ -75,41 +155,307 @@ class TumblrLogin(object):
         if cookiesfile is None:
             cookiesfile = os.path.join(_CONFIG_DIR, 'cookies-%s.tmp' % blogname)
 
-        self.cookieHandler = HTTPFileCookieProcessor(cookiesfile)
-        self.cookieJar = self.cookieHandler.cookiejar
-        self.cookieFile = self.cookieJar.filename
+        self.cookieFile = cookiesfile
+
+        # Sessions live in the shared SQLite session store (see cookiestore),
+        # unless `sessionstore` is False: then in the LWP cookies file, as
+        # they used to.  Either way, the lock is held while logging in.
+        sessionStore = kwargs.get('sessionstore', True)
+        if sessionStore is True:
+            sessionStore = session_store()
+        self.sessionStore = sessionStore or None
+
+        if self.sessionStore is not None:
+            self.sessionKey = os.path.abspath(cookiesfile)
+            self.cookieJar = StoredCookieJar(self.sessionStore, self.sessionKey, legacyfile = cookiesfile)
+            self.sessionLock = self.sessionStore.lock(self.sessionKey)
+        else:
+            self.sessionKey = None
+            self.cookieJar = cookielib.LWPCookieJar(cookiesfile)
+            self.sessionLock = file_lock('%s.lock' % cookiesfile)
+
+        self.cookieHandler = HTTPCookieJarProcessor(self.cookieJar)
 
         self.load_cookies()
 
-        self.logged_in = False
-        self._login()
+        # every opener built by this login shares one pool of keep-alive
+        # connections, so consecutive requests skip the TCP+TLS handshake
+        self.connectionPool = ConnectionPool(maxsize = kwargs.get('poolsize', 4),
+                                             idletimeout = kwargs.get('idletimeout', 60.0))
+        # responses always come compressed if the server wants to; request
+        # bodies are only compressed when asked to (`compressrequests`), as
+        # not every server takes them
+        #
+        # Every request waits for its turn with the `scheduler` (by default,
+        # the one shared by the whole process - False turns it off), which
+        # also retries throttled requests.
+        scheduler = kwargs.get('scheduler', True)
+        if scheduler is True:
+            scheduler = default_scheduler()
+        self.scheduler = scheduler or None
+        self.keepAliveHandler = KeepAliveHandler(self.connectionPool,
+                                                 compressrequests = kwargs.get('compressrequests', False),
+                                                 scheduler = self.scheduler)
+
+        # In lazy mode, the session is only checked right before the first
+        # real request - and not at all if it was validated less than
+        # `loginttl` seconds ago.
+        self.lazy = kwargs.get('lazy', False)
+        self.loginTTL = kwargs.get('loginttl', LOGIN_TTL)
+        self.validatedFile = '%s.validated' % self.cookieFile
+
+        # kept per account: the cached form key belongs to this login
+        self.themeCache = ThemeInfoCache(self.login)
+        self.themeStore = ThemeStore(self.login, self.blogname)
+
+        # What is seen of posts goes into the post index (by default, the
+        # one shared by the whole process - False turns it off).
+        # set_post_state() skips a post the index saw in the wanted state
+        # less than `postmaxage` seconds ago, without a request.
+        postIndex = kwargs.get('postindex', True)
+        if postIndex is True:
+            postIndex = post_index()
+        self.postIndex = postIndex if postIndex is not False else None
+        self.postMaxAge = kwargs.get('postmaxage', 0)
+
+        # fetch() goes through the `responsecache` (a ResponseCache, or True
+        # for the one shared by the whole process) if there is one
+        responseCache = kwargs.get('responsecache', False)
+        if responseCache is True:
+            responseCache = response_cache()
+        self.responseCache = responseCache if responseCache is not False else None
+
+        # `baseurl` points every request somewhere other than www.tumblr.com
+        # (e.g. a local stand-in server)
+        baseURL = kwargs.get('baseurl')
+        self.baseURL = (baseURL or 'http://www.tumblr.com').rstrip('/')
+        self.secureURL = (baseURL or 'https://www.tumblr.com').rstrip('/')
+
+        self._loginState = _LoginState()
+        if not self.lazy:
+            self._login()
+
+    # the login state lives in self._loginState, shared with for_blog() copies
+
+    @property
+    def logged_in(self):
+        return self._loginState.loggedIn
+
+    @logged_in.setter
+    def logged_in(self, loggedIn):
+        self._loginState.loggedIn = loggedIn
+
+    @property
+    def _loginCount(self):
+        return self._loginState.count
+
+    @_loginCount.setter
+    def _loginCount(self, count):
+        self._loginState.count = count
+
+    @property
+    def _loginLock(self):
+        return self._loginState.lock
 
     def save_cookies(self):
+        if self.sessionStore is not None:
+            self.cookieJar.save()
+            return
+
+        ensure_config_dir()
+        cookieDir = os.path.dirname(self.cookieFile)
+        if cookieDir and not os.path.isdir(cookieDir):
+            os.makedirs(cookieDir)
         self.cookieJar.save(ignore_discard = True, ignore_expires = True)
 
     def load_cookies(self):
-        if os.path.exists(self.cookieFile):
+        if self.sessionStore is not None:
+            self.cookieJar.load()
+        elif os.path.exists(self.cookieFile):
             self.cookieJar.load(ignore_discard = True, ignore_expires = True)
 
+    def for_blog(self, blogname):
+        """
+        Return a TumblrLogin for another blog of the same account, that shares
+        this one's session: cookies, keep-alive connections and login state.
+        """
+        other = copy.copy(self)
+        other.blogname = blogname
+        other.themeStore = ThemeStore(self.login, blogname)
+        return other
+
+    def connection_stats(self):
+        return dict(self.connectionPool.stats)
+
+    def cache_stats(self):
+        return dict(self.responseCache.stats) if self.responseCache is not None else {}
+
+    def _cache_session(self):
+        # what the response cache tells sessions apart by: the session, and
+        # the cookies it sends - pages (their form keys) don't outlive a login
+        cookies = sorted('%s=%s' % (cookie.name, cookie.value) for cookie in self.cookieJar)
+        return '%s:%s' % (self.sessionKey or os.path.abspath(self.cookieFile),
+                          hashlib.sha1('\n'.join(cookies)).hexdigest())
+
+    def close(self):
+        self.connectionPool.close()
+
     def _make_opener(self):
 
-        opener = urllib2.build_opener(self.cookieHandler)
+        opener = urllib2.build_opener(self.cookieHandler, self.keepAliveHandler)
 
         opener.addheaders = [('User-agent', 'tumblrpype/0.1')]
 
         return opener
 
-    def _login(self):
+    def _last_validated(self):
+        if self.sessionStore is not None:
+            return self.sessionStore.validated(self.sessionKey)
+
+        try:
+            with open(self.validatedFile, 'rb') as F:
+                return float(F.read().strip() or 0)
+        except (IOError, ValueError):
+            return 0
+
+    def _mark_validated(self):
+        if self.sessionStore is not None:
+            self.sessionStore.mark_validated(self.sessionKey)
+            return
+
+        ensure_config_dir()
+        with open(self.validatedFile, 'wb') as F:
+            F.write('%f\n' % time.time())
+
+    def _check_session(self):
+        # Cheap session check: HEAD the dashboard without following redirects.
+        # A logged-out session gets bounced to /login.
+
+        debug("  >> Checking session...")
+
+        opener = urllib2.build_opener(self.cookieHandler, self.keepAliveHandler, NoRedirectHandler)
+        opener.addheaders = [('User-agent', 'tumblrpype/0.1')]
+
+        req = urllib2.Request('%s/dashboard' % self.secureURL)
+        req.get_method = lambda: 'HEAD'
+
+        try:
+            resp = opener.open(req)
+        except urllib2.HTTPError as e:
+            e.close()
+            debug("  .. session check returned [%s]" % e.code)
+            return False
+
+        resp.fp.read()
+        return resp.code == 200
+
+    def _ensure_login(self):
+
+        if self.logged_in:
+            return
+
+        with self._loginLock:
+            if not self.logged_in:
+                with self.sessionLock:
+                    self.__ensure_login()
+
+    def __ensure_login(self):
+
+        # pick up a session saved by another process since we loaded ours
+        if self.sessionStore is not None:
+            self.cookieJar.reload()
+
+        if len(self.cookieJar):
+            if time.time() - self._last_validated() < self.loginTTL:
+                debug("  <3 Session validated recently - trusting cookies.")
+                self.logged_in = True
+                return
+
+            if self._check_session():
+                debug("  <3 Good - already logged in.")
+                self._mark_validated()
+                self.logged_in = True
+                return
+
+        self._login(checkcookies = False)
+
+    def _login_redirected(self, resp, url):
+        path = urlparse.urlparse(resp.geturl()).path
+        return path.startswith('/login') and not urlparse.urlparse(url).path.startswith('/login')
+
+    def _open(self, url, data = None, opener = None, headers = None):
+        # Opens `url` (with the extra request `headers`), logging in first if
+        # needed.  If the request gets bounced to /login, the session has
+        # expired: login again, and retry - if it is a GET.  A request with
+        # a body carries the old session's form key, so it can't be sent as
+        # it is: SessionExpiredError, for the caller to rebuild it.
+
+        if self.lazy:
+            self._ensure_login()
+
+        if opener is None:
+            opener = self._make_opener()
+
+        # (a new Request every time: one that was sent keeps its Cookie header)
+        def request():
+            return urllib2.Request(url, headers = headers) if headers else url
+
+        loginCount = self._loginCount
+        resp = opener.open(request(), data = data)
+
+        if self._login_redirected(resp, url):
+            resp.fp.read()
+
+            with self._loginLock:
+                # unless another request has logged in again meanwhile
+                if self._loginCount == loginCount:
+                    debug("  !! Session expired - logging in again")
+                    self.logged_in = False
+                    self._login(checkcookies = False)
+
+            if data is not None:
+                raise SessionExpiredError('Session expired: %s was not sent' % url)
+
+            resp = opener.open(request(), data = data)
+
+        return resp
+
+    def _login(self, checkcookies = True):
+
+        # the session lock keeps other processes (and other TumblrLogins on
+        # this session) from logging in at the same time
+        with self._loginLock:
+            with self.sessionLock:
+                if self.__adopt_session():
+                    return True
+                return self.__login(checkcookies)
+
+    def __adopt_session(self):
+        # Another process may have logged in while we waited for the lock:
+        # if so, and the session it saved is fresh, use that one.
+
+        if self.sessionStore is None or not self.cookieJar.reload():
+            return False
+
+        if not len(self.cookieJar) or time.time() - self._last_validated() >= self.loginTTL:
+            return False
+
+        debug("  <3 Using the session that was just saved by another login.")
+        self._loginCount += 1
+        self.logged_in = True
+        return True
+
+    def __login(self, checkcookies):
 
         debug("Logging in [%s / %s]" % (self.login, self.blogname))
 
         opener = self._make_opener()
 
         # If we have cookies, let's see if we are logged in:
-        if len(self.cookieJar):
+        if checkcookies and len(self.cookieJar):
             debug("  >> Testing cookies...")
 
-            resp0 = opener.open('https://www.tumblr.com')
+            resp0 = opener.open(self.secureURL)
             if resp0.code != 200:
                 debug("  !! Failed to fetch '/': Error [%s]" % resp0.code)
                 raise LoginError('Could not fetch www.tumblr.com')
@@ -124,11 +470,14 @@ class TumblrLogin(object):
             debug("  >> Fetching /login Page...")
 
             # OK, we need to login, Fetch the login page first
-            resp1 = opener.open('https://www.tumblr.com/login')
+            resp1 = opener.open('%s/login' % self.secureURL)
             if resp1.code != 200:
                 debug("  !! Failed to fetch '/login': Error [%s]" % resp1.code)
                 raise LoginError('Could not fetch www.tumblr.com/login')
 
+            # drain the body, so the connection goes back to the pool
+            resp1.fp.read()
+
             debug("  >> Sending Login info...")
 
             # login is POSTed with Mime-Type 'application/x-www-form-urlencoded'
@@ -141,7 +490,7 @@ class TumblrLogin(object):
             opener2 = self._make_opener()
             opener2.addheaders.append(('Content-Type', 'application/x-www-form-urlencoded'))
 
-            resp2 = opener2.open('https://www.tumblr.com/login', data = loginInfo)
+            resp2 = opener2.open('%s/login' % self.secureURL, data = loginInfo)
             html2 = resp2.fp.read()
 
             #opener.addheaders = origHeaders
@@ -161,6 +510,8 @@ class TumblrLogin(object):
         #//end if
 
         self.save_cookies()
+        self._mark_validated()
+        self._loginCount += 1
         self.logged_in = True
         return True
 
@@ -168,8 +519,12 @@ class TumblrLogin(object):
 
         debug("Fetching www.tumblr.com/%s" % uriFrag)
 
-        opener = self._make_opener()
-        resp = opener.open('http://www.tumblr.com/%s' % uriFrag)
+        url = '%s/%s' % (self.baseURL, uriFrag)
+        if self.responseCache is not None:
+            return self.responseCache.fetch(self._cache_session(), url,
+                                            lambda headers: self._open(url, headers = headers))
+
+        resp = self._open(url)
         if resp.code != 200:
             debug("  !! Failed to fetch: Error [%s]" % (resp.code))
             return None
@@ -179,45 +534,54 @@ class TumblrLogin(object):
         return html
 
     def __get_customize_page(self):
+        # jsonlib is only imported once theme work actually needs it
+        import jsonlib
 
         debug("Fetching Customize Page [%s]" % self.blogname)
 
-        opener = self._make_opener()
-        resp = opener.open('http://www.tumblr.com/customize/%s' % self.blogname)
+        resp = self._open('%s/customize/%s' % (self.baseURL, self.blogname))
         if resp.code != 200:
             debug("  !! Failed to fetch '/customize/%s': Error [%s]" % (self.blogname, resp.code))
             return None
 
-        html = resp.fp.read()
+        # scan the page as it arrives, for the "user_form_key" and the theme
+        # JSON - and hang up as soon as we have both
+        with instrument.timed('parse', 'customize_page'):
+            userFormKey, themeInfo = CustomizePageScanner().scan(resp.fp)
+            resp.close()
 
-        # find the "user_form_key"
-        m = re.search(r'Tumblr\.Customize\.user_form_key\s?=\s?[\'\"]([^\'\"]+)[\'\"];', html)
-        if not m:
+        if not userFormKey:
             debug("  !! Failed to parse Theme: Could not find [user_form_key]")
             return None
 
-        userFormKey = m.group(1)
-
-        m = re.search(r'Tumblr\.Customize\.blog\.set\((.+)(?=\);\n)', html)
-        if not m:
+        if not themeInfo:
             debug("  !! Failed to parse Theme: Could not find JSON object in Tumblr.Customize.blog.set()")
             return None
 
-        themeInfo = m.group(1)
-        themeInfo = jsonlib.loads(themeInfo)
+        with instrument.timed('parse', 'theme_json') as event:
+            if event is not None:
+                event['bytes'] = len(themeInfo)
+            themeInfo = jsonlib.loads(themeInfo)
 
         themeInfo['user_form_key'] = userFormKey
         themeInfo['id'] = themeInfo['name']
 
         debug('  <3 Theme parsed')
 
+        self.themeCache.put(self.blogname, themeInfo)
+        self.themeStore.add(themeInfo.get('custom_theme') or u'', FETCHED)
+
         return themeInfo
 
-    def __save_customize_page(self, themeInfo):
+    def __save_customize_page(self, themeInfo, newHTML):
 
-        # HTTP Post is done with Mime-type 'application/json'
+        # HTTP Post is done with Mime-type 'application/json' - streamed, with
+        # the Theme HTML escaped into it as it is sent
 
-        postData = jsonlib.dumps(themeInfo)
+        postData = ThemeBody(themeInfo, newHTML)
+        if self.keepAliveHandler.compressRequests:
+            # only whole bodies are compressed (they need a Content-Length)
+            postData = ''.join(postData)
 
         postHandler = HTTPPostHandler('application/json')
 
@@ -225,46 +589,106 @@ class TumblrLogin(object):
 
         opener = self._make_opener()
         opener.add_handler(postHandler)
-        opener.addheaders.append(('Referer', 'http://www.tumblr.com/customize/%s' % self.blogname))
+        opener.addheaders.append(('Referer', '%s/customize/%s' % (self.baseURL, self.blogname)))
         opener.addheaders.append(('Accept', 'application/json, text/javascript, */*; q=0.01'))
         opener.addheaders.append(('Accept-Charset', 'UTF-8,*;q=0.5'))
         opener.addheaders.append(('X-Requested-With', 'XMLHttpRequest'))
-        opener.addheaders.append(('Origin', 'http://www.tumblr.com'))
+        opener.addheaders.append(('Origin', self.baseURL))
         opener.addheaders.append(('Pragma', 'no-cache'))
         opener.addheaders.append(('Cache-Control', 'no-cache'))
 
         try:
-            resp = opener.open('http://www.tumblr.com/customize_api/blog/%s' % self.blogname, data = postData)
+            resp = self._open('%s/customize_api/blog/%s' % (self.baseURL, self.blogname),
+                              data = postData, opener = opener)
 
-        except Exception as e:
-            debug("  !! Failed to edit HTML")
+        except urllib2.URLError as e:
+            # HTTPError too: what is left after the scheduler's retries
+            debug("  !! Failed to edit HTML: %s" % e)
             return None
 
-        newThemeInfo = resp.fp.read()
-        newThemeInfo = jsonlib.loads(newThemeInfo)
+        # the response echoes the whole theme back: keep it as JSON text,
+        # only decoded if anyone asks for it
+        with instrument.timed('parse', 'customize_api_json'):
+            newThemeInfo = parse_theme_json(resp.fp, theme = LAZY)
 
         debug("  <3 Theme Saved.")
 
         return newThemeInfo
 
-    def save_theme_html(self, newHTML):
+    def save_theme_html(self, newHTML, force = False):
+        """
+        Save ``newHTML`` (utf-8 bytes, unicode, or an mmap) as the blog's
+        Theme HTML.  Returns the theme info customize_api answers with - its
+        `custom_theme` a themejson.LazyJSONString - or a false value.  A save
+        of the version deployed last (and still live) is skipped, unless
+        ``force``: the theme info is then the cached one.
+        """
+
+        # we need the object that describes all of the settings on the theme (and
+        # the form key) - from the cache if we have it, otherwise from the
+        # customize page.
+
+        themeInfo = self.themeCache.get(self.blogname)
+        cached = themeInfo is not None
+
+        # nothing to do if this is exactly the version we deployed (and is
+        # still live): answer with what the last save did
+        if not force and cached and self.themeStore.is_current(newHTML):
+            debug("Theme HTML unchanged [%s] - skipping save" % self.blogname)
+            themeInfo['custom_theme'] = LazyJSONString.escape(newHTML)
+            return themeInfo
+
+        if not cached:
+            themeInfo = self.__get_customize_page()
+            if not themeInfo:
+                return False
 
-        # first we have to retrieve the customize page, to get the object that describes
-        # all of the settings on the theme.
+        try:
+            ret = self.__save_customize_page(themeInfo, newHTML)
+            stale = ret is None and cached
+        except SessionExpiredError:
+            ret, stale = None, True
 
-        self.load_cookies()
+        if stale:
+            # the cached (or the old session's) form key is probably stale:
+            # refetch and try again
+            debug("  >> Save rejected with cached theme info - refetching customize page")
+            self.themeCache.invalidate(self.blogname)
 
-        themeInfo = self.__get_customize_page()
-        if not themeInfo:
-            return False
+            themeInfo = self.__get_customize_page()
+            if not themeInfo:
+                return False
 
-        themeInfo['custom_theme'] = newHTML.decode('utf-8')
+            ret = self.__save_customize_page(themeInfo, newHTML)
 
-        ret = self.__save_customize_page(themeInfo)
+        if isinstance(ret, dict):
+            self.themeCache.update(self.blogname, ret, themeInfo['user_form_key'])
+            self.themeStore.add(newHTML, DEPLOYED)
 
         return ret
 
-    def get_theme_html(self):
+    def save_theme_file(self, path, force = False):
+        """save_theme_html() with the Theme HTML in the file ``path``, mapped rather than read in."""
+        with open(path, 'rb') as F:
+            if not os.fstat(F.fileno()).st_size:
+                # an empty file can't be mapped
+                return self.save_theme_html('', force = force)
+            themeMap = mmap.mmap(F.fileno(), 0, access = mmap.ACCESS_READ)
+
+        try:
+            return self.save_theme_html(themeMap, force = force)
+        finally:
+            themeMap.close()
+
+    def get_theme_html(self, maxage = None):
+
+        # answer from the local snapshot store, if its version of the theme
+        # was confirmed live less than `maxage` seconds ago
+        if maxage is not None:
+            current = self.themeStore.current()
+            if current and time.time() - self.themeStore.last_checked() <= maxage:
+                debug("Theme HTML [%s] from snapshot %s" % (self.blogname, current.hash[:10]))
+                return self.themeStore.load(current.hash).decode('utf-8')
 
         themeInfo = self.__get_customize_page()
         if not themeInfo:
@@ -272,65 +696,109 @@ class TumblrLogin(object):
 
         return themeInfo['custom_theme']
 
-    def __mark_photo_private(self, postID, editPage):
+    def __write_theme_variables(self, changesList, retry = True):
+        # The changes of every coalesced call, written with one save - each
+        # call gets its result (see themevars.coalesce).  Always from a fresh
+        # customize page: the theme (and the other variables) may have been
+        # changed elsewhere since it was cached.
+        themeInfo = self.__get_customize_page()
+        if not themeInfo:
+            return [False] * len(changesList)
 
-        debug('  >> Parsing Edit Page')
-        soup = BeautifulSoup(editPage)
+        # calls with changes the theme can't take fail alone
+        changes, errors = merge_theme_variables(themeInfo, changesList)
+
+        changed = apply_theme_variables(themeInfo, changes)
+        if not changed:
+            debug("Theme variables unchanged [%s] - skipping save" % self.blogname)
+            return [error or True for error in errors]
 
-        form = {}
+        debug("Setting %d theme variable(s) [%s]" % (len(changed), self.blogname))
+        try:
+            ret = self.__save_customize_page(themeInfo, themeInfo.get('custom_theme') or u'')
+        except SessionExpiredError:
+            if not retry:
+                raise
+            # the form key went with the old session: start over from the page
+            return self.__write_theme_variables(changesList, retry = False)
+
+        if isinstance(ret, dict):
+            self.themeCache.update(self.blogname, ret, themeInfo['user_form_key'])
+
+        return [error or ret for error in errors]
+
+    def set_theme_variables(self, changes, coalesce = 0):
+        """
+        Set the Custom Theme Variables in ``changes`` (a dict, e.g.
+        {'color:Background' : '#000000'}) with a single save.  Calls for
+        the same blog made while an earlier one is being saved - or, for
+        bulk callers that ask for it, within ``coalesce`` seconds - are
+        merged into the same save (see themevars.py).
+        """
+        return coalesce_changes((self.baseURL, self.blogname), changes,
+                                self.__write_theme_variables, coalesce)
+
+    def get_theme_variables(self):
+        """The blog's Custom Theme Variables (a dict), fresh from the customize page."""
+        themeInfo = self.__get_customize_page()
+        if not themeInfo:
+            return None
+        return themeInfo.get('params') or {}
+
+    def get_theme_info(self):
+        """
+        The whole object that describes the theme - `custom_theme` and all of
+        its settings - fresh from the customize page (None on failure).
+        """
+        return self.__get_customize_page()
+
+    def warm_up(self):
+        """
+        Login, and have the theme info (and form key) at hand - so that the
+        next save_theme_html() is a single request.
+        """
+        self._ensure_login()
+        if self.themeCache.get(self.blogname) is None:
+            return self.__get_customize_page() is not None
+        return True
+
+    def rollback_theme(self, ref):
+        """Deploy the snapshot ``ref`` (a theme hash, or a prefix of one) again."""
+        return self.save_theme_html(self.themeStore.load(ref))
+
+    def __edit_photo_post(self, postID, fields, state):
 
         # Build caption
-        m = re.search(r'<textarea.*?id="post_two".*?>(.*?)</textarea>', editPage, re.I | re.M | re.DOTALL)
-        if not m:
+        caption = fields.get('post_two')
+        if caption is None:
             debug('  !! Couldn\'t find caption!')
             return
 
-        caption = m.group(1)
-        caption = re.sub('&lt;', '<', caption)
-        caption = re.sub('&gt;', '>', caption)
-        caption = re.sub('&amp;', '&', caption)
-        caption = re.sub('&#13;', '\r', caption)
-
-        # Build the form data for posting
-        form['UPLOAD_IDENTIFIER'] = soup.select('#upload_id')[0]['value']
-        form['post[state]'] = 'private'
-        form['post[publish_on]'] = ''
-        form['post[draft_status]'] = ''
-        form['post[date]'] = soup.select('#post_date')[0].get('value') or ''
-        form['post[source_url]'] = soup.select('#post_source_url')[0].get('value') or ''
-        form['post[tags]'] = soup.select('#post_tags')[0].get('value') or ''
-        form['post[slug]'] = ''
-        form['custom_tweet'] = 'Photo: [URL]'
-        form['custom_tweet_changed'] = '0'
-        form['is_rich_text[one]'] = '0'
-        form['is_rich_text[two]'] = '1'
-        form['is_rich_text[three]'] = '0'
-        form['form_key'] = soup.select('#form_key')[0]['value']
-        form['photo_raw'] = ''
-        form['images'] = ('', '')
-        form['photo_src'] = ''
-        form['MAX_FILE_SIZE'] = '10485760'
-        form['post[two]'] = caption
-        form['post[three]'] = soup.select('#post_three')[0].get('value') or ''
-        form['post[type]'] = 'photo'
-        form['post[id]'] = str(postID)
-        form['post[promotion_data][message]'] = '(No message)'
-        form['post[promotion_data][icon]'] = '/images/highlighted_posts/icons/bolt_white.png'
-        form['post[promotion_data][color]'] = '#bb3434'
-
-        postData = encode_multipart_formdata(form)
-
-        multipartHandler = HTTPPostHandler(postData[1])
-
-        debug("  >> Editing post to 'Private'")
+        if not fields.get('upload_id') or not fields.get('form_key'):
+            raise FetchError('Could not find upload_id / form_key on www.tumblr.com/edit/%s' % postID)
+
+        # Fill in the form data for posting
+        postData = _PHOTO_EDIT_FORM.fill({'UPLOAD_IDENTIFIER' : fields['upload_id'],
+                                          'post[state]' : POST_STATES[state],
+                                          'post[date]' : fields.get('post_date') or '',
+                                          'post[source_url]' : fields.get('post_source_url') or '',
+                                          'post[tags]' : fields.get('post_tags') or '',
+                                          'form_key' : fields['form_key'],
+                                          'post[two]' : caption,
+                                          'post[three]' : fields.get('post_three') or '',
+                                          'post[id]' : str(postID)})
+
+        multipartHandler = HTTPPostHandler(_PHOTO_EDIT_FORM.content_type)
+
+        debug("  >> Editing post to '%s'" % state.title())
 
         opener = self._make_opener()
         opener.add_handler(multipartHandler)
-        opener.addheaders.append(('Referer', 'http://www.tumblr.com/edit/%s' % postID))
+        opener.addheaders.append(('Referer', '%s/edit/%s' % (self.baseURL, postID)))
         opener.addheaders.append(('Accept', 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8'))
         opener.addheaders.append(('Accept-Charset', 'UTF-8,*;q=0.5'))
 
-        resp = opener.open('http://www.tumblr.com/edit/%s' % postID, data = postData[0])
+        resp = self._open('%s/edit/%s' % (self.baseURL, postID), data = postData, opener = opener)
         html = resp.fp.read()
 
         # hacky heuristic:
@@ -342,24 +810,96 @@ class TumblrLogin(object):
             debug('  !! Failed! Something went wrong!')
             return False
 
+    def _fetch_post_page(self, page):
+        # the (id, type, state) of the posts on one page of the post listing
+        uriFrag = 'blog/%s' % self.blogname if page == 1 else 'blog/%s/%d' % (self.blogname, page)
+
+        html = self.fetch(uriFrag)
+        if html is None:
+            raise FetchError('Failed to fetch www.tumblr.com/%s' % uriFrag)
+
+        with instrument.timed('parse', 'post_listing') as event:
+            if event is not None:
+                event['bytes'] = len(html)
+            posts = extract_posts(html)
+
+        if self.postIndex is not None:
+            self.postIndex.put_many(self.blogname, posts)
+        return posts
+
+    def iter_posts(self, cursor = None, prefetch = 4, maxpages = None):
+        """
+        Yield a PostRecord (id, type, state, cursor) for every post of the
+        blog, newest first, fetching ``prefetch`` pages ahead.  Pass the
+        ``cursor`` of a record to carry on after it.  See posts.py.
+        """
+        from posts import iter_posts
+        return iter_posts(self, cursor, prefetch, maxpages)
+
     def mark_post_private(self, postID, **kwargs):
+        return self.set_post_state(postID, 'private')
+
+    def set_post_state(self, postID, state):
+        """Make a post 'published', 'draft', 'queued' or 'private' (see POST_STATES)."""
+
+        if state not in POST_STATES:
+            raise ValueError('Unknown post state: %r' % (state,))
+
+        if self.postIndex is not None and self.postMaxAge:
+            post = self.postIndex.get(self.blogname, postID, self.postMaxAge)
+            if post is not None and post.state == state:
+                debug("  >> Post %s is %s already (post index) - skipping" % (postID, state))
+                return True
+
+        try:
+            return self.__set_post_state(postID, state)
+        except SessionExpiredError:
+            # the form key went with the old session: start over from the page
+            return self.__set_post_state(postID, state)
 
+    def __set_post_state(self, postID, state):
         uriFrag = 'edit/%s' % postID
 
         editPage = self.fetch(uriFrag)
         if not editPage:
             raise FetchError('Failed to fetch www.tumblr.com/%s' % uriFrag)
 
-        # Find out about this post, namely the Post Type
-        soup = BeautifulSoup(editPage)
+        # Find out about this post, namely the Post Type, and collect
+        # everything the edit form needs in the same pass
+        debug('  >> Parsing Edit Page')
+        with instrument.timed('parse', 'edit_page') as event:
+            if event is not None:
+                event['bytes'] = len(editPage)
+            fields = extract_edit_form(editPage)
 
-        Tpost_type = soup.select('#post_type')[0]
-        postType = Tpost_type['value']
+        postType = fields.get('post_type')
+        if not postType:
+            raise FetchError('Could not find the post type on www.tumblr.com/%s' % uriFrag)
 
-        if postType == 'photo':
-            return self.__mark_photo_private(postID, editPage)
-        else:
+        currentState = _EDIT_PAGE_STATES.get(fields.get('post_state'))
+        if self.postIndex is not None:
+            self.postIndex.put(self.blogname, postID, postType, currentState, fields.get('form_key'))
+
+        if currentState == state:
+            debug("  >> Post %s is %s already - skipping" % (postID, state))
+            return True
+
+        if postType != 'photo':
             raise NotImplementedError()
 
+        ok = False
+        try:
+            ok = self.__edit_photo_post(postID, fields, state)
+        finally:
+            if self.responseCache is not None:
+                self.responseCache.forget(self._cache_session(), '%s/%s' % (self.baseURL, uriFrag))
+            if self.postIndex is not None:
+                if ok:
+                    self.postIndex.put(self.blogname, postID, postType, state)
+                else:
+                    # whatever state it is in now, it's not sure
+                    self.postIndex.forget(self.blogname, [postID])
+        return ok
+
 
 #//end class TumblrLogin
@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+"""
+!    postindex.py
+!  --------------------------------------------------------------------------
+!
+!    What tumblrpype last saw of each post - its type, its state, a
+!    fingerprint of the form key of the edit page it was seen on, and when -
+!    in one indexed SQLite table, `<_CONFIG_DIR>/posts.db`.
+!
+!    It is filled as a side effect of the work TumblrLogin does anyway: every
+!    page of the post listing, every edit page and every successful edit.
+!    A post whose edit fails is forgotten.  Bulk edits then look posts up
+!    before going to the network:
+!
+!        done = post_index().in_state(blogname, postIDs, 'private', maxage = 3600)
+!
+!    Only entries seen within `maxage` seconds count; expire() deletes older
+!    ones for good.
+!
+!    Except where otherwise noted, the code in tumblrpype is
+!        Copyright (c) 2012  Felix Bonkoski <felix@post-theory.com>
+!        Licensed under the MIT license:
+!            <http://www.opensource.org/licenses/mit-license.php>
+!
+"""
+
+import collections
+import hashlib
+import os
+import threading
+import time
+
+from config import _CONFIG_DIR
+from sqlstore import SQLiteStore
+
+__all__ = ['PostIndex', 'PostInfo', 'form_key_fingerprint', 'post_index']
+
+#-------------------------------------------------------------------------------
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS posts (
+    blogname  TEXT NOT NULL,
+    id        INTEGER NOT NULL,
+    type      TEXT,
+    state     TEXT,
+    formkey   TEXT,
+    seen      REAL NOT NULL,
+    PRIMARY KEY (blogname, id)
+);
+CREATE INDEX IF NOT EXISTS posts_state ON posts (blogname, state, seen);
+CREATE INDEX IF NOT EXISTS posts_seen ON posts (seen);
+"""
+
+_FIELDS = 'id, type, state, formkey, seen'
+
+# SQLite's limit on the number of ?s in one statement is 999
+_BATCH = 500
+
+# `formkey` is a form_key_fingerprint(), or None if the post was only seen
+# in the listing
+PostInfo = collections.namedtuple('PostInfo', 'id type state formkey seen')
+
+
+def form_key_fingerprint(formKey):
+    """A short digest of a form key: enough to tell two apart, but not the (secret) key."""
+    return hashlib.sha1(formKey).hexdigest()[:16] if formKey else None
+
+
+class PostIndex(SQLiteStore):
+
+    SCHEMA = _SCHEMA
+
+    def __init__(self, path = None):
+        SQLiteStore.__init__(self, path or os.path.join(_CONFIG_DIR, 'posts.db'))
+
+    def __len__(self):
+        return self._query('SELECT COUNT(*) FROM posts')[0][0] if os.path.exists(self.path) else 0
+
+    def put(self, blogname, postID, postType, state, formKey = None):
+        self.put_many(blogname, [(postID, postType, state)], formKey)
+
+    def put_many(self, blogname, posts, formKey = None):
+        """
+        Record ``posts`` - ``(id, type, state)`` tuples - as seen now, in one
+        transaction.  A type or form key not given keeps the one recorded.
+        """
+        now = time.time()
+        fingerprint = form_key_fingerprint(formKey)
+        rows = [(blogname, int(postID), postType, state, fingerprint, now, blogname, int(postID))
+                for postID, postType, state in posts]
+        if not rows:
+            return
+
+        sql = ('INSERT OR REPLACE INTO posts (blogname, %s) '
+               'SELECT ?, ?, COALESCE(?, old.type), ?, COALESCE(?, old.formkey), ? '
+               'FROM (SELECT 1) LEFT JOIN '
+               '(SELECT type, formkey FROM posts WHERE blogname = ? AND id = ?) AS old'
+               % _FIELDS)
+
+        with self._transaction() as conn:
+            conn.executemany(sql, rows)
+
+    def get(self, blogname, postID, maxage = None):
+        """The PostInfo of a post, or None - also if it was seen more than ``maxage`` seconds ago."""
+        return self.get_many(blogname, [postID], maxage).get(int(postID))
+
+    def get_many(self, blogname, postIDs, maxage = None):
+        """postID -> PostInfo, for the posts of ``postIDs`` seen within ``maxage`` seconds."""
+        postIDs = [int(postID) for postID in postIDs]
+        oldest = time.time() - maxage if maxage is not None else 0
+
+        found = {}
+        for i in xrange(0, len(postIDs), _BATCH):
+            batch = postIDs[i:i + _BATCH]
+            for row in self._query('SELECT %s FROM posts WHERE blogname = ? AND seen >= ? AND id IN (%s)'
+                                   % (_FIELDS, ', '.join('?' * len(batch))),
+                                   [blogname, oldest] + batch):
+                found[row[0]] = PostInfo(*row)
+        return found
+
+    def in_state(self, blogname, postIDs, state, maxage = None):
+        """The set of ``postIDs`` seen in ``state`` within ``maxage`` seconds."""
+        return set(postID for postID, post in self.get_many(blogname, postIDs, maxage).iteritems()
+                   if post.state == state)
+
+    def forget(self, blogname, postIDs):
+        postIDs = [int(postID) for postID in postIDs]
+        if not os.path.exists(self.path):
+            return
+
+        with self._transaction() as conn:
+            for i in xrange(0, len(postIDs), _BATCH):
+                batch = postIDs[i:i + _BATCH]
+                conn.execute('DELETE FROM posts WHERE blogname = ? AND id IN (%s)'
+                             % ', '.join('?' * len(batch)), [blogname] + batch)
+
+    def expire(self, maxage, blogname = None):
+        """Delete the entries (of ``blogname``, or of every blog) older than ``maxage`` seconds."""
+        if not os.path.exists(self.path):
+            return 0
+
+        sql = 'DELETE FROM posts WHERE seen < ?'
+        args = [time.time() - maxage]
+        if blogname is not None:
+            sql += ' AND blogname = ?'
+            args.append(blogname)
+
+        with self._transaction() as conn:
+            before = conn.total_changes
+            conn.execute(sql, args)
+            return conn.total_changes - before
+
+#//end class PostIndex
+
+
+_INDEXES = {}
+_INDEXES_LOCK = threading.Lock()
+
+def post_index(path = None):
+    """The PostIndex for ``path`` (shared by everything in the process)."""
+    path = os.path.abspath(path or os.path.join(_CONFIG_DIR, 'posts.db'))
+    with _INDEXES_LOCK:
+        index = _INDEXES.get(path)
+        if index is None:
+            index = _INDEXES[path] = PostIndex(path)
+        return index
@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+"""
+!    posts.py
+!  --------------------------------------------------------------------------
+!
+!    Lists the posts of a blog, from its post listing on the dashboard
+!    (www.tumblr.com/blog/<blog>, /blog/<blog>/2, ...):
+!
+!        for post in session.iter_posts():
+!            if post.state != 'private':
+!                session.mark_post_private(post.id)
+!
+!    While the caller works through one page, the next `prefetch` pages are
+!    already being fetched (and parsed) on worker threads.  Only those pages'
+!    post records are held at any time, however big the blog is.
+!
+!    Every record carries a `cursor` - its page, its position on the page
+!    and its ID: iter_posts(cursor = post.cursor) later carries on right
+!    after that post.  The listing is ordered by post date, not by ID (posts
+!    can be backdated), so IDs are only compared for equality: a post that
+!    moves down a page meanwhile (pushed by a new post) is recognized by the
+!    IDs of the page before it, and isn't listed twice.  Resuming looks for
+!    the post on the page before its own too, in case deleted posts moved
+!    the listing up; if it is gone, the listing carries on after its
+!    position.
+!
+!    Except where otherwise noted, the code in tumblrpype is
+!        Copyright (c) 2012  Felix Bonkoski <felix@post-theory.com>
+!        Licensed under the MIT license:
+!            <http://www.opensource.org/licenses/mit-license.php>
+!
+"""
+
+import collections
+
+from config import debug
+from workers import WorkerPool
+
+__all__ = ['PostRecord', 'iter_posts', 'make_cursor', 'parse_cursor']
+
+#-------------------------------------------------------------------------------
+
+PostRecord = collections.namedtuple('PostRecord', 'id type state cursor')
+
+
+def make_cursor(page, position, postID):
+    return '%d:%d:%d' % (page, position, postID)
+
+def parse_cursor(cursor):
+    """``(page, position, postID)`` from a cursor made by make_cursor()."""
+    try:
+        page, position, postID = cursor.split(':')
+        return int(page), int(position), int(postID)
+    except (AttributeError, ValueError):
+        raise ValueError('Not a post cursor: %r' % (cursor,))
+
+
+def iter_posts(session, cursor = None, prefetch = 4, maxpages = None):
+    """
+    Yield a PostRecord for every post of ``session``'s blog, newest first -
+    or, with a ``cursor``, of the posts after that one.  ``maxpages`` stops
+    after that many pages of the listing.
+    """
+    page = 1
+    cursorPage = cursorPosition = cursorID = None
+    if cursor:
+        cursorPage, cursorPosition, cursorID = parse_cursor(cursor)
+        # start a page early, in case posts were deleted since and the
+        # listing moved up
+        page = max(1, cursorPage - 1)
+
+    lastPage = page + maxpages - 1 if maxpages else None
+    prefetch = max(1, prefetch)
+
+    pool = WorkerPool(prefetch, name = 'tumblrpype-posts-%s' % session.blogname)
+    pending = collections.deque()
+
+    def submit(nextPage):
+        if lastPage is None or nextPage <= lastPage:
+            pending.append((nextPage, pool.submit(session._fetch_post_page, nextPage)))
+
+    # the IDs on the previous page: a post found there moved down a page
+    previousIDs = set()
+
+    try:
+        for i in xrange(prefetch):
+            submit(page + i)
+
+        while pending:
+            page, future = pending.popleft()
+            posts = future.result()
+            if not posts:
+                debug("  .. no posts on page %d - done" % page)
+                return
+
+            submit(page + prefetch)
+
+            # where on this page to start: right after the cursor's post
+            start = 0
+            if cursorID is not None:
+                pageIDs = [post[0] for post in posts]
+                if cursorID in pageIDs:
+                    start = pageIDs.index(cursorID) + 1
+                    cursorID = None
+                elif page < cursorPage:
+                    # it didn't move up to this page: all of it comes before
+                    start = len(posts)
+                else:
+                    # it is gone - carry on after its position
+                    start = cursorPosition + 1
+                    cursorID = None
+
+            pageIDs = set()
+            for position, (postID, postType, state) in enumerate(posts):
+                pageIDs.add(postID)
+                if position < start or postID in previousIDs:
+                    continue
+                yield PostRecord(postID, postType, state, make_cursor(page, position, postID))
+
+            previousIDs = pageIDs
+
+    finally:
+        # let the pages still being fetched (at most one per worker) finish,
+        # so their connections go back to the pool
+        pool.shutdown()
@@ -0,0 +1,212 @@
+# -*- coding: utf-8 -*-
+"""
+!    registry.py
+!  --------------------------------------------------------------------------
+!
+!    The account registry: every TumblrUser (blog, login, password, cookies
+!    file) in one indexed SQLite table, `<_CONFIG_DIR>/accounts.db`, rather
+!    than a directory with a `credentials` file per blog.  Blogs are looked
+!    up by name or by login, listed / filtered in bulk, and grouped by the
+!    login they belong to, without touching the filesystem per blog.
+!
+!    migrate() imports the blogs of the old one-directory-per-blog layout;
+!    TumblrUser.load() also picks up a not yet migrated blog on its own.
+!
+!    Except where otherwise noted, the code in tumblrpype is
+!        Copyright (c) 2012  Felix Bonkoski <felix@post-theory.com>
+!        Licensed under the MIT license:
+!            <http://www.opensource.org/licenses/mit-license.php>
+!
+"""
+
+import collections
+import os
+import threading
+import time
+
+from config import _CONFIG_DIR, debug
+from sqlstore import SQLiteStore
+from user import TumblrUser
+
+__all__ = ['AccountRegistry', 'account_registry']
+
+#-------------------------------------------------------------------------------
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS accounts (
+    blogname     TEXT PRIMARY KEY,
+    login        TEXT NOT NULL,
+    password     TEXT,
+    cookiesfile  TEXT,
+    created      REAL NOT NULL,
+    updated      REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS accounts_login ON accounts (login, blogname);
+"""
+
+_FIELDS = 'blogname, login, password, cookiesfile'
+
+# SQLite's limit on the number of ?s in one statement is 999
+_BATCH = 500
+
+
+def _user(row):
+    user = TumblrUser()
+    user.blogname, user.login, user.password, user.cookiesfile = row
+    return user
+
+
+class AccountRegistry(SQLiteStore):
+
+    SCHEMA = _SCHEMA
+
+    def __init__(self, path = None, configdir = None):
+        self.configdir = configdir or _CONFIG_DIR
+        SQLiteStore.__init__(self, path or os.path.join(self.configdir, 'accounts.db'))
+
+    def __len__(self):
+        return self._query('SELECT COUNT(*) FROM accounts')[0][0] if os.path.exists(self.path) else 0
+
+    def __contains__(self, blogname):
+        return bool(self._query('SELECT 1 FROM accounts WHERE blogname = ?', (blogname,)))
+
+    def put(self, user):
+        self.put_many([user])
+
+    def put_many(self, users, replace = True):
+        """Add / update ``users`` - all in one transaction.  Returns how many were written."""
+        now = time.time()
+        rows = [(user.blogname, user.login, user.password, user.cookiesfile, now, now)
+                for user in users]
+
+        if replace:
+            sql = ('INSERT OR REPLACE INTO accounts (%s, created, updated) VALUES '
+                   '(?, ?, ?, ?, COALESCE((SELECT created FROM accounts WHERE blogname = ?), ?), ?)'
+                   % _FIELDS)
+            rows = [row[:4] + (row[0],) + row[4:] for row in rows]
+        else:
+            sql = 'INSERT OR IGNORE INTO accounts (%s, created, updated) VALUES (?, ?, ?, ?, ?, ?)' % _FIELDS
+
+        with self._transaction() as conn:
+            before = conn.total_changes
+            conn.executemany(sql, rows)
+            return conn.total_changes - before
+
+    def remove(self, blogname):
+        with self._transaction() as conn:
+            conn.execute('DELETE FROM accounts WHERE blogname = ?', (blogname,))
+
+    def get(self, blogname):
+        """The TumblrUser of ``blogname``, or None."""
+        rows = self._query('SELECT %s FROM accounts WHERE blogname = ?' % _FIELDS, (blogname,))
+        return _user(rows[0]) if rows else None
+
+    def get_many(self, blognames):
+        """The TumblrUsers of ``blognames`` (in that order) - raises KeyError for an unknown blog."""
+        blognames = list(blognames)
+        found = {}
+        for i in xrange(0, len(blognames), _BATCH):
+            batch = blognames[i:i + _BATCH]
+            for row in self._query('SELECT %s FROM accounts WHERE blogname IN (%s)'
+                                   % (_FIELDS, ', '.join('?' * len(batch))), batch):
+                found[row[0]] = _user(row)
+
+        missing = [blogname for blogname in blognames if blogname not in found]
+        if missing:
+            raise KeyError('Unknown blog(s): %s' % ', '.join(missing))
+
+        return [found[blogname] for blogname in blognames]
+
+    def find(self, login = None, pattern = None, limit = None):
+        """
+        The TumblrUsers (sorted by blog name) of ``login``, and/or whose blog
+        name matches the shell-style ``pattern`` (e.g. 'shop-*').
+        """
+        where = []
+        args = []
+        if login is not None:
+            where.append('login = ?')
+            args.append(login)
+        if pattern is not None:
+            where.append('blogname GLOB ?')
+            args.append(pattern)
+
+        sql = 'SELECT %s FROM accounts' % _FIELDS
+        if where:
+            sql += ' WHERE ' + ' AND '.join(where)
+        sql += ' ORDER BY blogname'
+        if limit is not None:
+            sql += ' LIMIT %d' % limit
+
+        return [_user(row) for row in self._query(sql, args)]
+
+    def blognames(self, login = None, pattern = None):
+        return [user.blogname for user in self.find(login, pattern)]
+
+    def logins(self):
+        return [row[0] for row in self._query('SELECT DISTINCT login FROM accounts ORDER BY login')]
+
+    def group_by_login(self, pattern = None):
+        """An ordered dict of login -> [TumblrUser]."""
+        sql = 'SELECT %s FROM accounts' % _FIELDS
+        args = []
+        if pattern is not None:
+            sql += ' WHERE blogname GLOB ?'
+            args.append(pattern)
+        sql += ' ORDER BY login, blogname'
+
+        groups = collections.OrderedDict()
+        for row in self._query(sql, args):
+            groups.setdefault(row[1], []).append(_user(row))
+        return groups
+
+    def migrate(self, blognames = None):
+        """
+        Import the blogs kept in the old layout (a `<blogname>/credentials`
+        file in the config directory) - all of them, or only ``blognames``.
+        Blogs already in the registry are left alone.  Returns how many
+        were imported.
+        """
+        if blognames is None:
+            try:
+                blognames = sorted(os.listdir(self.configdir))
+            except OSError:
+                return 0
+
+        users = []
+        for blogname in blognames:
+            userDir = os.path.join(self.configdir, blogname)
+            credFile = os.path.join(userDir, 'credentials')
+            if not os.path.isfile(credFile):
+                continue
+
+            with open(credFile, 'rb') as F:
+                user = TumblrUser()
+                user.login = F.readline().strip()
+                user.password = F.readline().strip()
+                user.blogname = F.readline().strip() or blogname
+            # keep the cookies file path: it is what the blog's session is stored under
+            user.cookiesfile = os.path.join(userDir, 'cookies')
+            users.append(user)
+
+        if not users:
+            return 0
+
+        imported = self.put_many(users, replace = False)
+        debug("Imported %d blog(s) into the account registry" % imported)
+        return imported
+
+#//end class AccountRegistry
+
+
+_REGISTRIES = {}
+_REGISTRIES_LOCK = threading.Lock()
+
+def account_registry(path = None):
+    """The AccountRegistry for ``path`` (shared by everything in the process)."""
+    path = os.path.abspath(path or os.path.join(_CONFIG_DIR, 'accounts.db'))
+    with _REGISTRIES_LOCK:
+        registry = _REGISTRIES.get(path)
+        if registry is None:
+            registry = _REGISTRIES[path] = AccountRegistry(path)
+        return registry
@@ -0,0 +1,311 @@
+# -*- coding: utf-8 -*-
+"""
+!    scheduler.py
+!  --------------------------------------------------------------------------
+!
+!    Paces the requests made to Tumblr, and retries the ones it throttled.
+!
+!    Every request TumblrLogin makes (see session.KeepAliveHandler) first
+!    takes a token from its host's token bucket.  The bucket is shared by
+!    every thread, and - through a small state file under `_CONFIG_DIR`,
+!    guarded by a file lock - by every process using the same config dir.
+!
+!    The rate adapts: a 429 / 503 answer cuts it by 30% (and a Retry-After
+!    stops everyone until then); each success raises it by 2%, back up to
+!    the configured `rate`.  Without a configured rate requests aren't paced
+!    at all until the first 429 / 503 - the pacing then starts from the rate
+!    requests were going out at.
+!
+!    Requests that were throttled, or failed on the network, are retried
+!    with jittered exponential backoff - GET / HEAD always, other methods
+!    only after a 429 (the request was refused, so it is safe to send again).
+!
+!    Except where otherwise noted, the code in tumblrpype is
+!        Copyright (c) 2012  Felix Bonkoski <felix@post-theory.com>
+!        Licensed under the MIT license:
+!            <http://www.opensource.org/licenses/mit-license.php>
+!
+"""
+
+import calendar
+import email.utils
+import json
+import os
+import random
+import threading
+import time
+
+from config import _CONFIG_DIR, RATE_LIMIT, RATE_BURST, ensure_config_dir
+from filelock import file_lock
+
+__all__ = ['RequestScheduler', 'TokenBucket', 'default_scheduler', 'retry_after']
+
+#-------------------------------------------------------------------------------
+
+THROTTLE_STATUSES = (429, 503)
+IDEMPOTENT_METHODS = ('GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE')
+
+# never adapt below this many requests per second
+MIN_RATE = 0.2
+
+# above this, an adapted rate that was never configured is dropped again
+_UNPACED_RATE = 1000.0
+
+# how much each success raises an adapted rate, and each 429 / 503 lowers it
+_RATE_INCREASE = 1.02
+_RATE_DECREASE = 0.7
+
+
+def retry_after(value):
+    """Seconds to wait, from a Retry-After header (seconds, or an HTTP date)."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+
+    parsed = email.utils.parsedate(value)
+    if parsed is None:
+        return None
+    return max(0.0, calendar.timegm(parsed) - time.time())
+
+
+class TokenBucket(object):
+    """
+    A token bucket for one host.  With ``path``, its state lives in that file
+    and is shared with other processes; otherwise only by this process.
+
+    The state is: the current ``rate`` (tokens/second, 0 for unpaced), the
+    ``tokens`` left (negative = requests already waiting), when it was last
+    refilled, and when it is blocked until (Retry-After).
+    """
+
+    def __init__(self, rate = None, burst = None, path = None):
+        self.maxRate = rate
+        self.burst = burst or (max(1.0, rate) if rate else 1.0)
+        self.path = path
+
+        if path is None:
+            self._lock = threading.Lock()
+        else:
+            self._lock = file_lock('%s.lock' % path)
+        self._state = None
+
+        # while unpaced, and the state file is unchanged since we last saw
+        # it, take() doesn't need the lock (or the file) at all
+        self._seen = None
+
+        # a rough estimate of the rate this process sends requests at, to
+        # start pacing from
+        self._observed = 0.0
+        self._lastTake = None
+        self._observeLock = threading.Lock()
+
+    def _initial_state(self):
+        return {'rate' : self.maxRate or 0.0,
+                'tokens' : self.burst,
+                'updated' : time.time(),
+                'blocked' : 0.0}
+
+    def _mtime(self):
+        try:
+            return os.stat(self.path).st_mtime
+        except OSError:
+            return None
+
+    def _load(self):
+        if self.path is None:
+            if self._state is None:
+                self._state = self._initial_state()
+            return self._state
+
+        try:
+            with open(self.path, 'rb') as F:
+                return json.load(F)
+        except (IOError, ValueError):
+            return self._initial_state()
+
+    def _save(self, state):
+        if self.path is None:
+            self._state = state
+            return
+
+        tmpFile = '%s.%d.tmp' % (self.path, os.getpid())
+        with open(tmpFile, 'wb') as F:
+            json.dump(state, F)
+        os.rename(tmpFile, self.path)
+
+    def _observe(self, now):
+        with self._observeLock:
+            if self._lastTake is not None and now > self._lastTake:
+                self._observed = 0.8 * self._observed + 0.2 * min(_UNPACED_RATE, 1.0 / (now - self._lastTake))
+            self._lastTake = now
+
+    def take(self):
+        """Reserve a token.  Returns how long to wait before using it."""
+        now = time.time()
+        self._observe(now)
+
+        if self.path is not None and not self.maxRate:
+            seen = self._seen
+            if seen is not None and seen[0] == self._mtime() and not seen[1] and seen[2] <= now:
+                return 0.0
+
+        with self._lock:
+            state = self._load()
+            now = time.time()
+
+            rate = state['rate']
+            if rate:
+                elapsed = max(0.0, now - state['updated'])
+                tokens = min(self.burst, state['tokens'] + elapsed * rate) - 1
+                wait = -tokens / rate if tokens < 0 else 0.0
+
+                state['tokens'] = tokens
+                state['updated'] = now
+                self._save(state)
+            else:
+                wait = 0.0
+
+            wait = max(wait, state['blocked'] - now)
+            if self.path is not None:
+                self._seen = (self._mtime(), rate, state['blocked'])
+
+        return wait
+
+    def throttled(self, retryAfter = None):
+        """The server pushed back: lower the rate, and honour its Retry-After."""
+        with self._lock:
+            state = self._load()
+            rate = state['rate'] or self._observed or 1.0
+            state['rate'] = max(MIN_RATE, rate * _RATE_DECREASE)
+            state['tokens'] = min(state['tokens'], 0.0)
+            state['updated'] = time.time()
+            if retryAfter:
+                state['blocked'] = max(state['blocked'], time.time() + retryAfter)
+            self._save(state)
+            return state['rate']
+
+    def succeeded(self):
+        """Creep the rate back up towards its configured maximum."""
+        seen = self._seen
+        if seen is not None and not seen[1] and not self.maxRate:
+            return
+
+        with self._lock:
+            state = self._load()
+            rate = state['rate']
+            if not rate or (self.maxRate and rate >= self.maxRate):
+                return
+
+            rate *= _RATE_INCREASE
+            if self.maxRate:
+                rate = min(rate, self.maxRate)
+            elif rate >= _UNPACED_RATE:
+                rate = 0.0
+
+            state['rate'] = rate
+            self._save(state)
+
+    def rate(self):
+        with self._lock:
+            return self._load()['rate']
+
+#//end class TokenBucket
+
+
+class RequestScheduler(object):
+    """
+    :param rate: requests per second, per host (None: only once throttled).
+    :param burst: how many requests may go out at once (default: ``rate``).
+    :param retries: how often a throttled / failed request is retried.
+    :param backoff: the first retry waits up to this many seconds; each
+        further one up to twice as long, but never more than ``maxbackoff``.
+    :param shared: share the buckets with other processes (the files are
+        kept in ``statedir``, by default `<_CONFIG_DIR>/ratelimit/`).
+    """
+
+    def __init__(self, rate = None, burst = None, retries = 3, backoff = 0.5, maxbackoff = 30.0,
+                 shared = True, statedir = None):
+        self.rate = rate
+        self.burst = burst
+        self.retries = retries
+        self.backoff = backoff
+        self.maxBackoff = maxbackoff
+        self.shared = shared
+        self.stateDir = statedir or os.path.join(_CONFIG_DIR, 'ratelimit')
+
+        self._lock = threading.Lock()
+        self._buckets = {}
+
+        self.stats = {'requests' : 0,
+                      'delayed' : 0,
+                      'queue_wait' : 0.0,
+                      'throttled' : 0,
+                      'retries' : 0}
+
+    def bucket(self, host):
+        with self._lock:
+            bucket = self._buckets.get(host)
+            if bucket is None:
+                path = None
+                if self.shared:
+                    ensure_config_dir()
+                    if not os.path.isdir(self.stateDir):
+                        os.makedirs(self.stateDir)
+                    path = os.path.join(self.stateDir, host.replace(':', '_'))
+                bucket = self._buckets[host] = TokenBucket(self.rate, self.burst, path)
+            return bucket
+
+    def wait_turn(self, host):
+        """Block until a request to ``host`` may go out.  Returns the seconds waited."""
+        wait = self.bucket(host).take()
+        if wait > 0:
+            time.sleep(wait)
+
+        with self._lock:
+            self.stats['requests'] += 1
+            if wait > 0:
+                self.stats['delayed'] += 1
+                self.stats['queue_wait'] += wait
+        return max(0.0, wait)
+
+    def throttled(self, host, retryAfter = None):
+        with self._lock:
+            self.stats['throttled'] += 1
+        return self.bucket(host).throttled(retryAfter)
+
+    def succeeded(self, host):
+        self.bucket(host).succeeded()
+
+    def should_retry(self, method, attempt, status = None):
+        """
+        Whether to retry a request that got ``status`` (or, with no status,
+        failed on the network), after ``attempt`` retries already.
+        """
+        if attempt >= self.retries:
+            return False
+        if method in IDEMPOTENT_METHODS:
+            return True
+        return status == 429
+
+    def retry_delay(self, attempt, retryAfter = None):
+        """The backoff before retry number ``attempt`` (0-based): 'full jitter'."""
+        with self._lock:
+            self.stats['retries'] += 1
+        delay = random.uniform(0, min(self.maxBackoff, self.backoff * (2 ** attempt)))
+        return max(delay, min(retryAfter or 0.0, self.maxBackoff))
+
+#//end class RequestScheduler
+
+
+_DEFAULT = []
+_DEFAULT_LOCK = threading.Lock()
+
+def default_scheduler():
+    """The scheduler every TumblrLogin uses, unless given another one."""
+    with _DEFAULT_LOCK:
+        if not _DEFAULT:
+            _DEFAULT.append(RequestScheduler(rate = RATE_LIMIT, burst = RATE_BURST))
+        return _DEFAULT[0]
@@ -0,0 +1,526 @@
+# -*- coding: utf-8 -*-
+"""
+!    session.py
+!  --------------------------------------------------------------------------
+!
+!    This module implements a pool of persistent (keep-alive) HTTP / HTTPS
+!    connections, and a urllib2 handler that sends every request through it,
+!    so that consecutive requests to www.tumblr.com reuse one TCP+TLS
+!    connection instead of paying a new handshake each time.
+!
+!    Every request also asks for a gzip / deflate compressed response, which
+!    is decoded as it is read - so neither the whole compressed nor the whole
+!    decompressed body has to sit in memory first.  Request bodies can be
+!    sent gzip compressed too (`compressrequests`), to servers that take it.
+!
+!    With a scheduler (see scheduler.py), each request first waits for its
+!    turn, and throttled or failed requests are retried with backoff.
+!
+!    Except where otherwise noted, the code in tumblrpype is
+!        Copyright (c) 2012  Felix Bonkoski <felix@post-theory.com>
+!        Licensed under the MIT license:
+!            <http://www.opensource.org/licenses/mit-license.php>
+!
+"""
+
+import httplib
+import select
+import socket
+import threading
+import time
+import urllib2
+import urlparse
+import zlib
+
+import instrument
+from config import debug
+from scheduler import IDEMPOTENT_METHODS, THROTTLE_STATUSES, retry_after
+
+__all__ = ['ConnectionPool', 'KeepAliveHandler', 'gzip_compress']
+
+#-------------------------------------------------------------------------------
+
+_CONNECTION_CLASSES = {'http' : httplib.HTTPConnection,
+                       'https' : httplib.HTTPSConnection}
+
+ACCEPT_ENCODING = 'gzip, deflate'
+
+# compressed bodies are read (and decompressed) this much at a time
+DECODE_CHUNK_SIZE = 16 * 1024
+
+# request bodies smaller than this are not worth compressing
+COMPRESS_MIN_SIZE = 1024
+
+
+def _closed_by_peer(conn):
+    # an idle keep-alive socket that is readable has been hung up on (or has
+    # junk waiting): either way, no use for a new request
+    try:
+        return bool(select.select([conn.sock], [], [], 0)[0])
+    except (select.error, socket.error, TypeError, ValueError):
+        return True
+
+
+class _Decoder(object):
+    """Incremental gzip / deflate decoding of a response body."""
+
+    def __init__(self, encoding):
+        self.encoding = encoding
+        if encoding in ('gzip', 'x-gzip'):
+            self._decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        else:
+            self._decompressor = zlib.decompressobj()
+        self._started = False
+
+    def decompress(self, data):
+        try:
+            decoded = self._decompressor.decompress(data)
+        except zlib.error:
+            # "deflate" is meant to be zlib-wrapped, but some servers send
+            # a raw deflate stream
+            if self._started or self.encoding != 'deflate':
+                raise
+            self._decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+            decoded = self._decompressor.decompress(data)
+
+        self._started = True
+        return decoded
+
+    def flush(self):
+        return self._decompressor.flush()
+
+#//end class _Decoder
+
+
+def gzip_compress(data, level = 6):
+    """``data`` as a gzip stream (what `Content-Encoding: gzip` means)."""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    return compressor.compress(data) + compressor.flush()
+
+
+class ConnectionPool(object):
+    """
+    Keeps idle keep-alive connections, keyed by (scheme, host).
+
+    :param maxsize:
+        Maximum number of idle connections kept per host.  Connections
+        released while the host already has ``maxsize`` idle ones are closed.
+
+    :param idletimeout:
+        Seconds an idle connection may sit in the pool before it is evicted.
+    """
+
+    def __init__(self, maxsize = 4, idletimeout = 60.0):
+        self.maxsize = maxsize
+        self.idletimeout = idletimeout
+
+        self._lock = threading.Lock()
+        self._idle = {}
+
+        self.stats = {'opened' : 0,
+                      'reused' : 0,
+                      'released' : 0,
+                      'discarded' : 0,
+                      'evicted' : 0}
+
+    def _evict_expired(self, now):
+        # caller must hold self._lock
+        expired = []
+        for key, idle in self._idle.iteritems():
+            keep = []
+            for conn, lastUsed in idle:
+                if now - lastUsed > self.idletimeout or conn.sock is None:
+                    expired.append(conn)
+                else:
+                    keep.append((conn, lastUsed))
+            idle[:] = keep
+
+        self.stats['evicted'] += len(expired)
+        return expired
+
+    def evict_idle(self):
+        """Close every idle connection that has outlived ``idletimeout``."""
+        with self._lock:
+            expired = self._evict_expired(time.time())
+
+        for conn in expired:
+            conn.close()
+
+        return len(expired)
+
+    def acquire(self, scheme, host, timeout = socket._GLOBAL_DEFAULT_TIMEOUT, fresh = False):
+        """
+        Return a tuple ``(conn, reused)`` for ``scheme://host``.  An idle
+        connection is handed out if there is one (unless ``fresh`` is set),
+        otherwise a new one is created.
+        """
+        key = (scheme, host)
+        conn = None
+
+        with self._lock:
+            expired = self._evict_expired(time.time())
+            idle = self._idle.get(key)
+            if idle and not fresh:
+                conn = idle.pop()[0]
+                self.stats['reused'] += 1
+            else:
+                self.stats['opened'] += 1
+
+        for c in expired:
+            c.close()
+
+        if conn is not None:
+            conn.timeout = timeout
+            if conn.sock is not None:
+                conn.sock.settimeout(None if timeout is socket._GLOBAL_DEFAULT_TIMEOUT else timeout)
+            return conn, True
+
+        connClass = _CONNECTION_CLASSES.get(scheme)
+        if connClass is None:
+            raise urllib2.URLError('unknown url type: %s' % scheme)
+
+        return connClass(host, timeout = timeout), False
+
+    def release(self, scheme, host, conn):
+        """Return ``conn`` to the pool once its response has been fully read."""
+        key = (scheme, host)
+
+        with self._lock:
+            idle = self._idle.setdefault(key, [])
+            if conn.sock is not None and len(idle) < self.maxsize:
+                idle.append((conn, time.time()))
+                self.stats['released'] += 1
+                return
+
+            self.stats['discarded'] += 1
+
+        conn.close()
+
+    def discard(self, scheme, host, conn):
+        """Close ``conn`` without returning it to the pool."""
+        with self._lock:
+            self.stats['discarded'] += 1
+        conn.close()
+
+    def idle_count(self, scheme = None, host = None):
+        with self._lock:
+            if scheme is None:
+                return sum(len(idle) for idle in self._idle.itervalues())
+            return len(self._idle.get((scheme, host), []))
+
+    def close(self):
+        """Close every idle connection in the pool."""
+        with self._lock:
+            conns = [conn for idle in self._idle.itervalues() for conn, lastUsed in idle]
+            self._idle = {}
+
+        for conn in conns:
+            conn.close()
+
+#//end class ConnectionPool
+
+
+class _PooledResponse(object):
+    """
+    Wraps an ``httplib.HTTPResponse``, and hands its connection back to the
+    pool as soon as the body has been read to the end.  With a ``decoder``,
+    reads return the decoded body.
+    """
+
+    def __init__(self, response, pool, scheme, host, conn, event = None, decoder = None):
+        self._response = response
+        self._pool = pool
+        self._scheme = scheme
+        self._host = host
+        self._conn = conn
+
+        # the instrumentation event for this exchange (None when disabled)
+        self._event = event
+
+        self._decoder = decoder
+        self._decoded = ''
+        self._eof = False
+
+    def _done(self, reusable):
+        conn, self._conn = self._conn, None
+        if conn is None:
+            return
+
+        if reusable and not self._response.will_close:
+            self._pool.release(self._scheme, self._host, conn)
+        else:
+            self._pool.discard(self._scheme, self._host, conn)
+
+        event = self._event
+        if event is not None:
+            now = time.time()
+            event['download'] = now - event.pop('_headersAt')
+            event['total'] = now - event.pop('_startedAt')
+            event['complete'] = reusable
+            instrument.emit(event)
+
+    def read(self, amt = None):
+        if self._decoder is not None:
+            return self._read_decoded(amt)
+
+        data = self._response.read(amt)
+        if self._event is not None:
+            self._event['bytes_received'] += len(data)
+        if not data or amt is None or self._response.isclosed():
+            self._done(True)
+        return data
+
+    def _read_decoded(self, amt):
+        # Feed the decoder one compressed chunk at a time, until there is
+        # `amt` decoded bytes to return (or the body ends).
+        chunks = [self._decoded]
+        have = len(self._decoded)
+
+        while not self._eof and (amt is None or have < amt):
+            data = self._response.read(DECODE_CHUNK_SIZE)
+            if data:
+                decoded = self._decoder.decompress(data)
+            else:
+                decoded = ''
+            if not data or self._response.isclosed():
+                decoded += self._decoder.flush()
+                self._eof = True
+
+            if self._event is not None:
+                self._event['bytes_received'] += len(data)
+                self._event['bytes_decoded'] += len(decoded)
+
+            chunks.append(decoded)
+            have += len(decoded)
+
+        data = ''.join(chunks)
+        if amt is not None:
+            data, self._decoded = data[:amt], data[amt:]
+        else:
+            self._decoded = ''
+
+        if self._eof:
+            self._done(True)
+        return data
+
+    recv = read
+
+    def close(self):
+        # Closing before the body was drained leaves unread bytes on the
+        # socket, so the connection can't be reused.
+        self._done(self._response.isclosed())
+        self._response.close()
+
+#//end class _PooledResponse
+
+
+class KeepAliveHandler(urllib2.HTTPHandler, urllib2.HTTPSHandler):
+    """
+    Replaces urllib2's default HTTP / HTTPS handlers with ones that keep
+    their connections open in a ``ConnectionPool``.
+    """
+
+    def __init__(self, pool, debuglevel = 0, compressrequests = False, scheduler = None):
+        urllib2.AbstractHTTPHandler.__init__(self, debuglevel)
+        self.pool = pool
+        self.scheduler = scheduler
+
+        # gzip request bodies - until a host answers 415 Unsupported Media Type
+        self.compressRequests = compressrequests
+        self._noCompressHosts = set()
+
+    def http_open(self, req):
+        return self._pooled_open(req)
+
+    https_open = http_open
+
+    def _send_streaming(self, conn, req, headers):
+        # httplib can't send a body that is an iterable of chunks (like a
+        # formdata.MultipartEncoder), so send the request piece by piece.
+        # The Content-Length was already set from len(req.data).
+
+        names = set(name.lower() for name in headers)
+        conn.putrequest(req.get_method(), req.get_selector(),
+                        skip_host = 'host' in names,
+                        skip_accept_encoding = 'accept-encoding' in names)
+
+        for name, value in headers.iteritems():
+            conn.putheader(name, value)
+
+        # the first chunk goes out in the same packet as the headers
+        chunks = iter(req.data)
+        conn.endheaders(next(chunks, None))
+
+        for chunk in chunks:
+            conn.send(chunk)
+
+    def _pooled_open(self, req):
+        host = req.get_host()
+        if not host:
+            raise urllib2.URLError('no host given')
+
+        scheme = req.get_type()
+
+        headers = dict(req.unredirected_hdrs)
+        headers.update(dict((k, v) for k, v in req.headers.items()
+                            if k not in headers))
+        headers['Connection'] = 'keep-alive'
+        headers = dict((name.title(), val) for name, val in headers.items())
+        headers.setdefault('Accept-Encoding', ACCEPT_ENCODING)
+
+        data = req.data
+        compressed = (self.compressRequests and isinstance(data, basestring)
+                      and len(data) >= COMPRESS_MIN_SIZE and host not in self._noCompressHosts
+                      and 'Content-Encoding' not in headers)
+        if compressed:
+            rawLength = len(data)
+            data = gzip_compress(data)
+            headers['Content-Encoding'] = 'gzip'
+            headers['Content-Length'] = str(len(data))
+
+        event = None
+        if instrument.ENABLED:
+            url = req.get_full_url()
+            event = {'type' : 'http',
+                     'method' : req.get_method(),
+                     'url' : url,
+                     'route' : urlparse.urlparse(url).path.strip('/').split('/')[0] or '/',
+                     'connect' : 0.0,
+                     'bytes_sent' : len(data) if data is not None else 0,
+                     'bytes_received' : 0,
+                     '_startedAt' : time.time()}
+            if compressed:
+                event['bytes_sent_raw'] = rawLength
+
+        method = req.get_method()
+        scheduler = self.scheduler
+        fresh = False
+        attempt = 0
+        scheduled = False
+        while True:
+            if scheduler is not None and not scheduled:
+                queued = scheduler.wait_turn(host)
+                if event is not None:
+                    event['queue'] = event.get('queue', 0.0) + queued
+            scheduled = False
+
+            conn, reused = self.pool.acquire(scheme, host, req.timeout, fresh = fresh)
+            if reused and method not in IDEMPOTENT_METHODS and _closed_by_peer(conn):
+                # a write can't be retried once sent - so not on a connection
+                # the server has hung up on already
+                self.pool.discard(scheme, host, conn)
+                conn, reused = self.pool.acquire(scheme, host, req.timeout, fresh = True)
+            conn.set_debuglevel(self._debuglevel)
+
+            sent = False
+            try:
+                if conn.sock is None:
+                    connectStarted = time.time()
+                    conn.connect()
+                    if event is not None:
+                        event['connect'] += time.time() - connectStarted
+
+                    # requests are written in one go - don't let Nagle hold
+                    # back their tails waiting on (delayed) ACKs
+                    conn.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+                if data is None or isinstance(data, basestring):
+                    conn.request(req.get_method(), req.get_selector(), data, headers)
+                else:
+                    self._send_streaming(conn, req, headers)
+                sent = True
+
+                sentAt = time.time()
+                r = conn.getresponse(buffering = True)
+
+            except (socket.error, httplib.HTTPException) as e:
+                self.pool.discard(scheme, host, conn)
+
+                # The server may have dropped a connection while it sat idle
+                # in the pool - try once more on a brand new one.  Unless the
+                # request was a write that went out whole: the server may
+                # have acted on it.
+                if reused and (method in IDEMPOTENT_METHODS or not sent):
+                    debug("  .. stale keep-alive connection to %s, reconnecting" % host)
+                    fresh = True
+                    scheduled = True
+                    continue
+
+                if scheduler is not None and scheduler.should_retry(method, attempt):
+                    delay = scheduler.retry_delay(attempt)
+                    debug("  .. request to %s failed (%s) - retrying in %.2fs" % (host, e, delay))
+                    attempt += 1
+                    time.sleep(delay)
+                    continue
+
+                if event is not None:
+                    event['error'] = repr(e)
+                    event['total'] = time.time() - event.pop('_startedAt')
+                    instrument.emit(event)
+
+                raise urllib2.URLError(e)
+
+            if compressed and r.status == httplib.UNSUPPORTED_MEDIA_TYPE:
+                # the server doesn't take compressed bodies: send it as is
+                debug("  .. %s does not accept compressed request bodies" % host)
+                r.read()
+                self.pool.release(scheme, host, conn)
+                self._noCompressHosts.add(host)
+                compressed = False
+                data = req.data
+                del headers['Content-Encoding']
+                headers['Content-Length'] = str(len(data))
+                if event is not None:
+                    event['bytes_sent'] = len(data)
+                    del event['bytes_sent_raw']
+                fresh = False
+                continue
+
+            if scheduler is not None:
+                if r.status in THROTTLE_STATUSES:
+                    wait = retry_after(r.getheader('retry-after'))
+                    rate = scheduler.throttled(host, wait)
+
+                    if scheduler.should_retry(method, attempt, r.status):
+                        delay = scheduler.retry_delay(attempt, wait)
+                        debug("  .. %s answered [%s] - down to %.1f requests/s, retrying in %.2fs"
+                              % (host, r.status, rate, delay))
+                        r.read()
+                        self.pool.release(scheme, host, conn)
+                        attempt += 1
+                        fresh = False
+                        time.sleep(delay)
+                        continue
+                else:
+                    scheduler.succeeded(host)
+
+            break
+
+        decoder = None
+        encoding = (r.getheader('content-encoding') or '').strip().lower()
+        if encoding in ('gzip', 'x-gzip', 'deflate'):
+            decoder = _Decoder(encoding)
+            # what the caller reads is the decoded body
+            del r.msg['content-encoding']
+            del r.msg['content-length']
+
+        if event is not None:
+            event['_headersAt'] = time.time()
+            event['wait'] = event['_headersAt'] - sentAt
+            event['status'] = r.status
+            event['reused'] = reused
+            if attempt:
+                event['retries'] = attempt
+            if decoder is not None:
+                event['encoding'] = encoding
+                event['bytes_decoded'] = 0
+
+        fp = socket._fileobject(_PooledResponse(r, self.pool, scheme, host, conn, event, decoder),
+                                close = True)
+
+        resp = urllib2.addinfourl(fp, r.msg, req.get_full_url())
+        resp.code = r.status
+        resp.msg = r.reason
+        return resp
+
+#//end class KeepAliveHandler
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+"""
+!    sqlstore.py
+!  --------------------------------------------------------------------------
+!
+!    The base of tumblrpype's SQLite-backed stores (sessions, accounts ...):
+!    one connection per thread, WAL journaling so readers don't wait for the
+!    writer, and short IMMEDIATE write transactions.  The database file (and
+!    the config directory) only get created by the first write.
+!
+!    Except where otherwise noted, the code in tumblrpype is
+!        Copyright (c) 2012  Felix Bonkoski <felix@post-theory.com>
+!        Licensed under the MIT license:
+!            <http://www.opensource.org/licenses/mit-license.php>
+!
+"""
+
+import contextlib
+import os
+import sqlite3
+import threading
+
+from config import ensure_config_dir
+
+__all__ = ['SQLiteStore']
+
+#-------------------------------------------------------------------------------
+
+# times the schema is run again when another connection changed it meanwhile
+_SCHEMA_RETRIES = 5
+
+class SQLiteStore(object):
+
+    # CREATE TABLE IF NOT EXISTS ... statements, run on every new connection
+    SCHEMA = ''
+
+    def __init__(self, path):
+        self.path = path
+        # sqlite3 connections can't be shared between threads
+        self._local = threading.local()
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None and self._local.pid != os.getpid():
+            # inherited through fork(): sqlite3 connections mustn't be used
+            # in the child, so leave it alone and open another
+            conn = None
+
+        if conn is None:
+            ensure_config_dir()
+            storeDir = os.path.dirname(self.path)
+            if storeDir and not os.path.isdir(storeDir):
+                os.makedirs(storeDir)
+
+            conn = sqlite3.connect(self.path, timeout = 30, isolation_level = None)
+            conn.text_factory = str
+            conn.execute('PRAGMA journal_mode = WAL')
+            conn.execute('PRAGMA synchronous = NORMAL')
+            self.__create_schema(conn)
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def __create_schema(self, conn):
+        # connections racing to create a new database find the schema changed
+        # under them (SQLITE_SCHEMA): the statements only need to run again
+        for attempt in xrange(_SCHEMA_RETRIES):
+            try:
+                conn.executescript(self.SCHEMA)
+                return
+            except sqlite3.OperationalError as e:
+                if 'schema has changed' not in str(e) or attempt == _SCHEMA_RETRIES - 1:
+                    raise
+
+    def _query(self, sql, args = ()):
+        """The rows of ``sql`` - none at all while the database doesn't exist."""
+        if not os.path.exists(self.path):
+            return []
+        return self._connection().execute(sql, args).fetchall()
+
+    @contextlib.contextmanager
+    def _transaction(self, write = True):
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE' if write else 'BEGIN')
+        try:
+            yield conn
+        except:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+
+    def close(self):
+        """Close this thread's connection."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            self._local.conn = None
+            if self._local.pid == os.getpid():
+                conn.close()
+
+#//end class SQLiteStore
@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+"""
+!    themecache.py
+!  --------------------------------------------------------------------------
+!
+!    Caches the theme settings object (`themeInfo`) and `user_form_key` that
+!    are scraped from a blog's /customize page, so that saving a theme doesn't
+!    have to download the whole customize page every time.
+!
+!    Entries live in memory (shared by every TumblrLogin in the process) and
+!    on disk, as `<account_dir>/<blogname>/customize.json` - per account (see
+!    config.account_dir), as the form key belongs to the login.  The Theme
+!    HTML itself (`custom_theme`) isn't cached: a save replaces it anyway,
+!    and themestore keeps every version of it.
+!
+!    Except where otherwise noted, the code in tumblrpype is
+!        Copyright (c) 2012  Felix Bonkoski <felix@post-theory.com>
+!        Licensed under the MIT license:
+!            <http://www.opensource.org/licenses/mit-license.php>
+!
+"""
+
+import copy
+import os
+import threading
+
+from config import _CONFIG_DIR, account_dir, debug
+
+__all__ = ['ThemeInfoCache']
+
+#-------------------------------------------------------------------------------
+
+_MEMORY = {}
+_LOCK = threading.Lock()
+
+
+class ThemeInfoCache(object):
+
+    def __init__(self, login, configdir = None):
+        self.login = login
+        self.configdir = configdir or _CONFIG_DIR
+
+    def __key(self, blogname):
+        return (self.configdir, self.login, blogname)
+
+    def __cache_file(self, blogname):
+        return os.path.join(account_dir(self.login, blogname, self.configdir), 'customize.json')
+
+    def get(self, blogname):
+        """Return a copy of the cached ``themeInfo`` for ``blogname``, or None."""
+        # jsonlib is only imported once theme work actually needs it
+        import jsonlib
+
+        with _LOCK:
+            themeInfo = _MEMORY.get(self.__key(blogname))
+
+            if themeInfo is None:
+                cacheFile = self.__cache_file(blogname)
+                if not os.path.exists(cacheFile):
+                    return None
+
+                try:
+                    with open(cacheFile, 'rb') as F:
+                        themeInfo = jsonlib.loads(F.read())
+                except (IOError, ValueError) as e:
+                    debug("  !! Ignoring unreadable theme cache [%s]: %s" % (cacheFile, e))
+                    return None
+
+                _MEMORY[self.__key(blogname)] = themeInfo
+
+            return copy.deepcopy(themeInfo)
+
+    def put(self, blogname, themeInfo):
+        import jsonlib
+
+        if not themeInfo.get('user_form_key'):
+            return
+
+        themeInfo = copy.deepcopy(dict((key, value) for key, value in themeInfo.iteritems()
+                                       if key != 'custom_theme'))
+
+        with _LOCK:
+            _MEMORY[self.__key(blogname)] = themeInfo
+
+            cacheFile = self.__cache_file(blogname)
+            cacheDir = os.path.dirname(cacheFile)
+            if not os.path.isdir(cacheDir):
+                os.makedirs(cacheDir)
+
+            tmpFile = '%s.tmp' % cacheFile
+            with open(tmpFile, 'wb') as F:
+                F.write(jsonlib.dumps(themeInfo))
+            os.rename(tmpFile, cacheFile)
+
+    def update(self, blogname, newThemeInfo, userFormKey):
+        """
+        Refresh the entry from the JSON returned by a save on customize_api.
+        That response doesn't carry the form key, so the one we posted with
+        is kept.
+        """
+        themeInfo = dict(newThemeInfo)
+        themeInfo.setdefault('user_form_key', userFormKey)
+        if 'name' in themeInfo:
+            themeInfo.setdefault('id', themeInfo['name'])
+
+        self.put(blogname, themeInfo)
+
+    def invalidate(self, blogname):
+
+        with _LOCK:
+            _MEMORY.pop(self.__key(blogname), None)
+
+            cacheFile = self.__cache_file(blogname)
+            if os.path.exists(cacheFile):
+                os.remove(cacheFile)
+
+#//end class ThemeInfoCache
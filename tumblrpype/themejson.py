@@ -0,0 +1,265 @@
+# -*- coding: utf-8 -*-
+"""
+!    themejson.py
+!  --------------------------------------------------------------------------
+!
+!    The JSON that carries a theme to and from customize_api, without turning
+!    the whole Theme HTML into Python strings along the way:
+!
+!        body = ThemeBody(themeInfo, html)
+!            the request body: the theme settings, with `custom_theme`
+!            spliced in from ``html`` - utf-8 bytes, or an mmap of a file -
+!            JSON-escaped a chunk at a time, as the body is sent.  Like
+!            formdata.MultipartEncoder, it is iterable, and has a len().
+!
+!        themeInfo = parse_theme_json(resp.fp, theme = LAZY)
+!            reads a response a chunk at a time, and parses everything but
+!            the `custom_theme` it echoes back: that is left out (SKIP), or
+!            kept as its JSON text, to decode if anyone asks (LAZY).
+!
+!    Except where otherwise noted, the code in tumblrpype is
+!        Copyright (c) 2012  Felix Bonkoski <felix@post-theory.com>
+!        Licensed under the MIT license:
+!            <http://www.opensource.org/licenses/mit-license.php>
+!
+"""
+
+import codecs
+import re
+
+__all__ = ['LAZY', 'LOAD', 'LazyJSONString', 'SKIP', 'ThemeBody', 'parse_theme_json']
+
+#-------------------------------------------------------------------------------
+
+CHUNK_SIZE = 64 * 1024
+
+THEME_FIELD = 'custom_theme'
+
+# what parse_theme_json() does with the theme it finds
+SKIP = 'skip'
+LAZY = 'lazy'
+LOAD = 'load'
+
+# Non-ASCII bytes go out as they are (the body is utf-8); only quotes,
+# backslashes and control characters need escaping.  The common ones are
+# replaced with str.replace() - the backslash first - and the rest (rare in
+# HTML) with a regular expression.
+_ESCAPES = (('\\', '\\\\'), ('"', '\\"'), ('\n', '\\n'), ('\r', '\\r'), ('\t', '\\t'))
+_CONTROL_RE = re.compile(r'[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+def _escape_control(match):
+    return '\\u%04x' % ord(match.group())
+
+def _escape(chunk):
+    for c, escaped in _ESCAPES:
+        chunk = chunk.replace(c, escaped)
+    if _CONTROL_RE.search(chunk):
+        chunk = _CONTROL_RE.sub(_escape_control, chunk)
+    return chunk
+
+def _escaped_length(chunk):
+    # each of _ESCAPES adds one byte, each control character five
+    return (len(chunk) + sum(chunk.count(c) for c, escaped in _ESCAPES)
+            + 5 * len(_CONTROL_RE.findall(chunk)))
+
+
+class ThemeBody(object):
+    """
+    The JSON of ``themeInfo`` with ``html`` as its `custom_theme`, in chunks.
+    ``html`` is only read (a ``chunksize`` slice at a time) - once up front
+    to check it is utf-8 and to count the body's length, then every time
+    the body is sent.
+    """
+
+    def __init__(self, themeInfo, html, chunksize = CHUNK_SIZE):
+        import jsonlib
+
+        if isinstance(html, unicode):
+            html = html.encode('utf-8')
+
+        settings = dict((key, value) for key, value in themeInfo.iteritems() if key != THEME_FIELD)
+        head = jsonlib.dumps(settings)
+        if isinstance(head, unicode):
+            head = head.encode('utf-8')
+
+        # '{...}' -> '{..., "custom_theme":"' + the theme + '"}'
+        self.head = '%s%s"%s":"' % (head[:-1], ',' if settings else '', THEME_FIELD)
+        self.tail = '"}'
+        self.html = html
+        self.chunksize = chunksize
+
+        self.length = len(self.head) + self.__escaped_length() + len(self.tail)
+
+    def __chunks(self):
+        for offset in xrange(0, len(self.html), self.chunksize):
+            yield self.html[offset:offset + self.chunksize]
+
+    def __escaped_length(self):
+        # raises UnicodeDecodeError, as html.decode('utf-8') would
+        decoder = codecs.getincrementaldecoder('utf-8')()
+        length = 0
+        for chunk in self.__chunks():
+            decoder.decode(chunk)
+            length += _escaped_length(chunk)
+        decoder.decode('', True)
+        return length
+
+    def __len__(self):
+        return self.length
+
+    def __iter__(self):
+        yield self.head
+        for chunk in self.__chunks():
+            yield _escape(chunk)
+        yield self.tail
+
+#//end class ThemeBody
+
+
+class LazyJSONString(object):
+    """
+    A JSON string value, kept as its (escaped, utf-8) JSON text - in the
+    chunks it was read in - until value() is called.
+    """
+
+    def __init__(self, parts):
+        self.parts = parts
+
+    @classmethod
+    def escape(cls, html, chunksize = CHUNK_SIZE):
+        """The LazyJSONString of ``html`` (utf-8 bytes, unicode, or an mmap)."""
+        if isinstance(html, unicode):
+            html = html.encode('utf-8')
+        return cls([_escape(html[offset:offset + chunksize])
+                    for offset in xrange(0, len(html), chunksize)])
+
+    def raw(self):
+        return ''.join(self.parts)
+
+    def value(self):
+        import jsonlib
+        return jsonlib.loads('["%s"]' % self.raw())[0]
+
+    def __unicode__(self):
+        return self.value()
+
+    def __len__(self):
+        return sum(len(part) for part in self.parts)
+
+    def __repr__(self):
+        return '<LazyJSONString: %d bytes>' % len(self)
+
+#//end class LazyJSONString
+
+
+# outside of strings, only these matter
+_STRUCTURE_RE = re.compile(r'[{}\[\]",:]')
+# the inside of a string, up to its closing quote (or the end of the chunk)
+_STRING_BODY_RE = re.compile(r'[^"\\]*(?:\\.[^"\\]*)*', re.S)
+
+
+def parse_theme_json(fp, theme = LAZY, field = THEME_FIELD, chunksize = CHUNK_SIZE):
+    """
+    Parse the JSON object read from ``fp``.  With ``theme`` SKIP the string
+    value of its top-level key ``field`` is left out of the result, with
+    LAZY it is a LazyJSONString; with LOAD this is just jsonlib.loads().
+    """
+    import jsonlib
+
+    if theme == LOAD:
+        return jsonlib.loads(fp.read())
+
+    out = []            # the JSON, with the field's string value as null
+    captured = []       # ... and that value's text
+    depth = 0
+    inString = None     # None, or what the current string is: 'key', 'field' or 'plain'
+    escaped = False     # the last chunk ended on a backslash, inside a string
+    expectKey = False
+    keyParts = None
+    lastKey = None
+    fieldValueNext = False
+    found = False
+
+    while True:
+        chunk = fp.read(chunksize)
+        if not chunk:
+            break
+
+        i, n = 0, len(chunk)
+        while i < n:
+            if inString:
+                dest = captured if inString == 'field' else (keyParts if inString == 'key' else out)
+
+                if escaped:
+                    dest.append(chunk[i])
+                    i += 1
+                    escaped = False
+                    continue
+
+                j = _STRING_BODY_RE.match(chunk, i).end()
+                dest.append(chunk[i:j])
+                if j == n:
+                    break
+                if chunk[j] == '\\':
+                    # a lone backslash: the escaped character is in the next chunk
+                    dest.append('\\')
+                    escaped = True
+                    break
+
+                # the closing quote
+                i = j + 1
+                if inString == 'key':
+                    lastKey = ''.join(keyParts)
+                    out.append(lastKey)
+                if inString != 'field':
+                    out.append('"')
+                inString = None
+                continue
+
+            m = _STRUCTURE_RE.search(chunk, i)
+            if m is None:
+                out.append(chunk[i:])
+                break
+
+            j = m.start()
+            out.append(chunk[i:j])
+            c = chunk[j]
+            i = j + 1
+
+            if c == '"':
+                if depth == 1 and expectKey:
+                    inString = 'key'
+                    keyParts = []
+                    expectKey = False
+                    out.append('"')
+                elif depth == 1 and fieldValueNext and not found:
+                    inString = 'field'
+                    found = True
+                    out.append('null')
+                else:
+                    inString = 'plain'
+                    out.append('"')
+                fieldValueNext = False
+                continue
+
+            out.append(c)
+            fieldValueNext = False
+            if c in '{[':
+                depth += 1
+                expectKey = (c == '{' and depth == 1)
+            elif c in '}]':
+                depth -= 1
+            elif c == ',':
+                expectKey = (depth == 1)
+            elif c == ':':
+                fieldValueNext = (depth == 1 and lastKey == field)
+
+    result = jsonlib.loads(''.join(out))
+
+    if found:
+        if theme == SKIP:
+            result.pop(field, None)
+        else:
+            result[field] = LazyJSONString(captured)
+
+    return result
@@ -0,0 +1,245 @@
+# -*- coding: utf-8 -*-
+"""
+!    themestore.py
+!  --------------------------------------------------------------------------
+!
+!    A local, content-addressed history of a blog's Theme HTML.
+!
+!    Every version of the theme that was deployed (or seen live on Tumblr)
+!    is kept as a zlib-compressed blob named after its SHA-1, and an append-
+!    only index records when each one was deployed / seen.  Stores are kept
+!    per account (see config.account_dir):
+!
+!        <account_dir>/<blogname>/themes/objects/ab/cdef0123...
+!        <account_dir>/<blogname>/themes/index
+!
+!    `themes/checked` holds the time the current version was last confirmed
+!    to be live.  A store still in the old place, `<_CONFIG_DIR>/<blogname>/
+!    themes`, is moved over the first time its blog is used.
+!
+!    Except where otherwise noted, the code in tumblrpype is
+!        Copyright (c) 2012  Felix Bonkoski <felix@post-theory.com>
+!        Licensed under the MIT license:
+!            <http://www.opensource.org/licenses/mit-license.php>
+!
+"""
+
+import difflib
+import hashlib
+import os
+import threading
+import time
+import zlib
+
+from config import _CONFIG_DIR, account_dir, debug
+
+__all__ = ['ThemeStore', 'ThemeSnapshot', 'theme_hash', 'DEPLOYED', 'FETCHED']
+
+#-------------------------------------------------------------------------------
+
+# kinds of index entries
+DEPLOYED = 'deploy'
+FETCHED = 'fetch'
+
+
+def _to_bytes(html):
+    if isinstance(html, unicode):
+        return html.encode('utf-8')
+    return html
+
+def theme_hash(html):
+    """The SHA-1 (hex) that identifies ``html`` in the store."""
+    return hashlib.sha1(_to_bytes(html)).hexdigest()
+
+
+class ThemeSnapshot(object):
+
+    __slots__ = ('time', 'hash', 'kind', 'size')
+
+    def __init__(self, time, hash, kind, size):
+        self.time = time
+        self.hash = hash
+        self.kind = kind
+        self.size = size
+
+    def __repr__(self):
+        return '<ThemeSnapshot %s %s %s (%d bytes)>' % (
+            self.hash[:10], self.kind, time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(self.time)), self.size)
+
+#//end class ThemeSnapshot
+
+
+class ThemeStore(object):
+
+    def __init__(self, login, blogname, configdir = None):
+        self.login = login
+        self.blogname = blogname
+        self.storeDir = os.path.join(account_dir(login, blogname, configdir), 'themes')
+        self.objectsDir = os.path.join(self.storeDir, 'objects')
+        self.indexFile = os.path.join(self.storeDir, 'index')
+        self.checkedFile = os.path.join(self.storeDir, 'checked')
+
+        self._lock = threading.Lock()
+        self._entries = None
+        self._indexStat = None
+
+        self.__move_legacy(os.path.join(configdir or _CONFIG_DIR, blogname, 'themes'))
+
+    def __move_legacy(self, legacyDir):
+        if os.path.isdir(self.storeDir) or not os.path.isdir(legacyDir):
+            return
+
+        debug("  >> Moving the theme history of [%s] to [%s]" % (self.blogname, self.storeDir))
+        try:
+            if not os.path.isdir(os.path.dirname(self.storeDir)):
+                os.makedirs(os.path.dirname(self.storeDir))
+            os.rename(legacyDir, self.storeDir)
+        except OSError as e:
+            # moved by another process meanwhile, or left where it was
+            debug("  !! Could not move [%s]: %s" % (legacyDir, e))
+
+    def __object_file(self, themeHash):
+        return os.path.join(self.objectsDir, themeHash[:2], themeHash[2:])
+
+    def _load_index(self):
+        # caller must hold self._lock.  The index is re-read only when the
+        # file changed (e.g. another process deployed meanwhile).
+        try:
+            st = os.stat(self.indexFile)
+            indexStat = (st.st_size, st.st_mtime)
+        except OSError:
+            indexStat = None
+
+        if self._entries is not None and indexStat == self._indexStat:
+            return self._entries
+
+        entries = []
+        if indexStat is not None:
+            with open(self.indexFile, 'rb') as F:
+                for line in F:
+                    parts = line.split()
+                    if len(parts) != 4:
+                        continue
+                    entries.append(ThemeSnapshot(float(parts[0]), parts[1], parts[2], int(parts[3])))
+
+        self._entries = entries
+        self._indexStat = indexStat
+        return entries
+
+    def resolve(self, ref):
+        """Turn a (possibly abbreviated) hash into a full one."""
+        with self._lock:
+            matches = set(e.hash for e in self._load_index() if e.hash.startswith(ref))
+
+        if not matches:
+            raise KeyError('No theme snapshot matches %r' % ref)
+        if len(matches) > 1:
+            raise KeyError('Ambiguous theme snapshot %r' % ref)
+
+        return matches.pop()
+
+    def add(self, html, kind = DEPLOYED, when = None):
+        """
+        Store ``html`` (if it isn't stored already), and record it in the index
+        as deployed / fetched at ``when``.  Returns its hash.
+
+        A fetched version is only recorded when it differs from the current
+        one; either way, it marks the current version as checked at ``when``.
+        """
+        data = _to_bytes(html)
+        themeHash = theme_hash(data)
+        when = time.time() if when is None else when
+
+        with self._lock:
+            entries = self._load_index()
+
+            self.__write_checked(when)
+
+            if kind == FETCHED and entries and entries[-1].hash == themeHash:
+                return themeHash
+
+            objectFile = self.__object_file(themeHash)
+            if not os.path.exists(objectFile):
+                objectDir = os.path.dirname(objectFile)
+                if not os.path.isdir(objectDir):
+                    os.makedirs(objectDir)
+
+                tmpFile = '%s.tmp' % objectFile
+                with open(tmpFile, 'wb') as F:
+                    F.write(zlib.compress(data))
+                os.rename(tmpFile, objectFile)
+
+            entry = ThemeSnapshot(when, themeHash, kind, len(data))
+            with open(self.indexFile, 'ab') as F:
+                F.write('%f %s %s %d\n' % (entry.time, entry.hash, entry.kind, entry.size))
+
+            self._entries = None
+
+        return themeHash
+
+    def __write_checked(self, when):
+        if not os.path.isdir(self.storeDir):
+            os.makedirs(self.storeDir)
+
+        with open(self.checkedFile, 'wb') as F:
+            F.write('%f\n' % when)
+
+    def last_checked(self):
+        """When the current version was last deployed or seen live (0 if never)."""
+        try:
+            with open(self.checkedFile, 'rb') as F:
+                return float(F.read().strip() or 0)
+        except (IOError, ValueError):
+            return 0
+
+    def load(self, ref):
+        """Return the Theme HTML (as utf-8 bytes) stored under ``ref``."""
+        themeHash = self.resolve(ref)
+        with open(self.__object_file(themeHash), 'rb') as F:
+            return zlib.decompress(F.read())
+
+    def current(self):
+        """The latest snapshot (deployed or fetched) - the last version known to be live."""
+        with self._lock:
+            entries = self._load_index()
+            return entries[-1] if entries else None
+
+    def last_deployed(self):
+        with self._lock:
+            for entry in reversed(self._load_index()):
+                if entry.kind == DEPLOYED:
+                    return entry
+        return None
+
+    def is_current(self, html):
+        """
+        Whether ``html`` is the version last deployed - and still live: not
+        seen replaced by another version since.  Only fetching it isn't enough.
+        """
+        themeHash = theme_hash(html)
+        with self._lock:
+            for entry in reversed(self._load_index()):
+                if entry.hash != themeHash:
+                    return False
+                if entry.kind == DEPLOYED:
+                    return True
+        return False
+
+    def history(self, kind = None):
+        """Every index entry, oldest first (optionally only those of one ``kind``)."""
+        with self._lock:
+            entries = list(self._load_index())
+
+        if kind is not None:
+            entries = [e for e in entries if e.kind == kind]
+        return entries
+
+    def diff(self, old, new, context = 3):
+        """A unified diff (list of lines) between the snapshots ``old`` and ``new``."""
+        oldHash, newHash = self.resolve(old), self.resolve(new)
+        oldLines = self.load(oldHash).decode('utf-8').splitlines(True)
+        newLines = self.load(newHash).decode('utf-8').splitlines(True)
+
+        return list(difflib.unified_diff(oldLines, newLines, oldHash[:10], newHash[:10], n = context))
+
+#//end class ThemeStore
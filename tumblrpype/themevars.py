@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+"""
+!    themevars.py
+!  --------------------------------------------------------------------------
+!
+!    Custom Theme Variables: the `params` of a blog's theme settings, named
+!    after the theme's <meta> tags ('color:Background', 'if:Show avatar',
+!    'text:Subtitle', ...).
+!
+!        session.set_theme_variables({'color:Background' : '#000000',
+!                                     'if:Show avatar' : 0})
+!
+!    changes any number of them with one read of the customize page and one
+!    save.  Calls made for the same blog while one is waiting its turn are
+!    merged into it (the later value of a variable wins) and share its
+!    result - so a script setting variables one at a time, from many
+!    threads, still only writes once or twice.  Each call's changes are
+!    checked on their own: a call naming a variable the theme doesn't have
+!    fails alone, and none of its changes are made.
+!
+!    Except where otherwise noted, the code in tumblrpype is
+!        Copyright (c) 2012  Felix Bonkoski <felix@post-theory.com>
+!        Licensed under the MIT license:
+!            <http://www.opensource.org/licenses/mit-license.php>
+!
+"""
+
+import threading
+import time
+
+__all__ = ['apply_theme_variables', 'coalesce', 'merge_theme_variables', 'parse_assignments']
+
+#-------------------------------------------------------------------------------
+
+_TRUE = ('1', 'true', 'yes', 'on')
+_FALSE = ('0', 'false', 'no', 'off', '')
+
+
+def _value(name, value):
+    # 'if:' variables are stored as 1 / 0
+    if name.startswith('if:') and isinstance(value, basestring):
+        if value.lower() in _TRUE:
+            return 1
+        if value.lower() in _FALSE:
+            return 0
+        raise ValueError('Not a yes / no value for %s: %r' % (name, value))
+    return value
+
+
+def parse_assignments(assignments):
+    """A dict of changes from 'name=value' strings (as given on the command line)."""
+    changes = {}
+    for assignment in assignments:
+        name, sep, value = assignment.partition('=')
+        if not sep or not name:
+            raise ValueError('Expected name=value, got %r' % assignment)
+        changes[name.decode('utf-8')] = _value(name, value.decode('utf-8'))
+    return changes
+
+
+def apply_theme_variables(themeInfo, changes):
+    """
+    Set ``changes`` in ``themeInfo``'s params.  Returns the names of the
+    variables whose value actually changed; raises KeyError for variables
+    the theme doesn't have.
+    """
+    params = themeInfo.get('params') or {}
+
+    unknown = sorted(name for name in changes if name not in params)
+    if unknown:
+        raise KeyError('Unknown theme variable(s): %s' % ', '.join(unknown))
+
+    changed = []
+    for name, value in changes.iteritems():
+        value = _value(name, value)
+        if params[name] != value:
+            params[name] = value
+            changed.append(name)
+
+    themeInfo['params'] = params
+    return changed
+
+
+def merge_theme_variables(themeInfo, changesList):
+    """
+    Merge the dicts of ``changesList`` (later ones winning) into one, for
+    apply_theme_variables().  Returns the merged changes, and a list with,
+    for each dict, None - or the KeyError / ValueError that kept it out:
+    unknown variable names, or yes / no variables set to something else.
+    """
+    params = themeInfo.get('params') or {}
+
+    merged = {}
+    errors = []
+    for changes in changesList:
+        unknown = sorted(name for name in changes if name not in params)
+        if unknown:
+            errors.append(KeyError('Unknown theme variable(s): %s' % ', '.join(unknown)))
+            continue
+        try:
+            values = dict((name, _value(name, value)) for name, value in changes.iteritems())
+        except ValueError as e:
+            errors.append(e)
+            continue
+        merged.update(values)
+        errors.append(None)
+
+    return merged, errors
+
+
+class _Batch(object):
+
+    def __init__(self):
+        self.changes = []           # each caller's
+        self.done = threading.Event()
+        self.results = None
+        self.error = None
+
+#//end class _Batch
+
+
+# key -> the batch still taking changes; key -> the lock its write waits on
+_PENDING = {}
+_WRITE_LOCKS = {}
+_LOCK = threading.Lock()
+
+
+def coalesce(key, changes, write, delay = 0):
+    """
+    Have ``changes`` written together with those of every other call for
+    the same ``key`` that comes in while this one waits for the previous
+    write for ``key`` to finish, and for ``delay`` seconds more: by one
+    ``write(changesList)`` call, given each call's changes, in order, that
+    returns a list of results, one for each.  Returns this call's result -
+    or raises it, if it is an exception - or raises what the write raised.
+
+    With no ``delay``, a lone call writes right away.
+    """
+    with _LOCK:
+        batch = _PENDING.get(key)
+        leader = batch is None
+        if leader:
+            batch = _PENDING[key] = _Batch()
+        index = len(batch.changes)
+        batch.changes.append(changes)
+        writeLock = _WRITE_LOCKS.setdefault(key, threading.Lock())
+
+    if not leader:
+        batch.done.wait()
+    else:
+        try:
+            with writeLock:
+                try:
+                    if delay:
+                        time.sleep(delay)
+                finally:
+                    # from here on, calls start the next batch
+                    with _LOCK:
+                        del _PENDING[key]
+
+                batch.results = write(batch.changes)
+        except Exception as e:
+            batch.error = e
+        finally:
+            batch.done.set()
+
+    if batch.error is not None:
+        raise batch.error
+
+    result = batch.results[index]
+    if isinstance(result, Exception):
+        raise result
+    return result
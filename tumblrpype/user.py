@@ -5,7 +5,7 @@
 !    
 !    Implements a TumblrUser object that encapsulates the login information,
 !    as well as the cookies for that user.  Saves / reads the users from the
-!    tumblrpype config directory.
+!    account registry in the tumblrpype config directory (see registry.py).
 !
 !    Except where otherwise noted, the code in tumblrpype is
 !        Copyright (c) 2012  Felix Bonkoski <felix@post-theory.com>
@@ -30,12 +30,10 @@ class TumblrUser(object):
         self.blogname = None
         self.cookiesfile = None
 
-    def __user_dir(self):
-        return os.path.join(_CONFIG_DIR, self.blogname)
-    def __user_cred_file(self):
-        return os.path.join(self.__user_dir(), 'credentials')
     def __user_cookie_file(self):
-        return os.path.join(self.__user_dir(), 'cookies')
+        # the blog's session is stored under this path (see cookiestore) -
+        # nothing needs to exist there
+        return os.path.join(_CONFIG_DIR, self.blogname, 'cookies')
 
     def create(self, login, password, blogname):
         self.login = login
@@ -46,39 +44,25 @@ class TumblrUser(object):
         self.save()
 
     def save(self):
+        # the account registry (sqlite) is only imported when it is needed
+        from registry import account_registry
 
-        config_user_dir = self.__user_dir()
-
-        if not os.path.exists(config_user_dir):
-            os.mkdir(config_user_dir)
-        else:
-            if not os.path.isdir(config_user_dir):
-                raise IOError("Cannot create User Config directory at: %s" % config_user_dir)
-
-        # create credentials file:
-        config_user_cred = self.__user_cred_file()
-        with open(config_user_cred, 'wb') as F:
-            F.write('%s\n' % self.login)
-            F.write('%s\n' % self.password)
-            F.write('%s\n' % self.blogname)
-
-        # create empty cookies file
-        if not os.path.exists(self.cookiesfile):
-            with open(self.cookiesfile, 'wb') as F:
-                F.write("#LWP-Cookies-2.0\n")
+        account_registry().put(self)
 
     def load(self, blogname):
-        # attempt to load from config dir
+        from registry import account_registry
 
-        self.blogname = blogname
-        config_user_cred = self.__user_cred_file()
+        registry = account_registry()
+        user = registry.get(blogname)
 
-        if not os.path.exists(config_user_cred):
-            raise IOError('User does not exist: %s' % config_user_cred)
+        # a blog still kept in the old layout (<blogname>/credentials)
+        if user is None and registry.migrate([blogname]):
+            user = registry.get(blogname)
 
-        with open(config_user_cred, 'rb') as F:
-            self.login = F.readline().strip()
-            self.password = F.readline().strip()
-            self.blogname = F.readline().strip()
+        if user is None:
+            raise IOError('User does not exist: %s' % blogname)
 
-        self.cookiesfile = self.__user_cookie_file()
+        self.login = user.login
+        self.password = user.password
+        self.blogname = user.blogname
+        self.cookiesfile = user.cookiesfile
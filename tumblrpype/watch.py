@@ -0,0 +1,230 @@
+# -*- coding: utf-8 -*-
+"""
+!    watch.py
+!  --------------------------------------------------------------------------
+!
+!    Watches a local theme file, and pushes it to Tumblr whenever it changes:
+!
+!        session = TumblrLogin(user, lazy = True)
+!        watch_theme(session, 'theme.html')
+!
+!    The session stays logged in, with the theme's form key cached, for as
+!    long as the watch runs - so each push is a single request.  Changes
+!    are picked up with inotify (on Linux, through ctypes) or else by
+!    polling the file, and a burst of them (an editor writing a temp file
+!    and renaming it, say) is pushed once, after `debounce` seconds of quiet.
+!
+!    Except where otherwise noted, the code in tumblrpype is
+!        Copyright (c) 2012  Felix Bonkoski <felix@post-theory.com>
+!        Licensed under the MIT license:
+!            <http://www.opensource.org/licenses/mit-license.php>
+!
+"""
+
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import struct
+import sys
+import time
+
+from config import debug
+from themestore import theme_hash
+
+__all__ = ['FileWatcher', 'watch_theme']
+
+#-------------------------------------------------------------------------------
+
+# from <sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_CLOEXEC = 0x00080000
+
+_WATCH_MASK = IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+_EVENT_HEADER = struct.Struct('iIII')
+
+
+class _Inotify(object):
+    """Events for one file, by watching the directory it is in (editors often replace files)."""
+
+    def __init__(self, path):
+        if not sys.platform.startswith('linux'):
+            raise OSError(errno.ENOSYS, 'inotify is only available on Linux')
+
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno = True)
+        if not hasattr(libc, 'inotify_init1'):
+            raise OSError(errno.ENOSYS, 'no inotify in libc')
+
+        self.name = os.path.basename(path)
+        self.fd = libc.inotify_init1(IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+
+        directory = os.path.dirname(os.path.abspath(path))
+        if libc.inotify_add_watch(self.fd, directory, _WATCH_MASK | IN_DELETE_SELF | IN_MOVE_SELF) < 0:
+            err = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(err, 'inotify_add_watch failed: %s' % directory)
+
+    def wait(self, timeout):
+        """True if the file changed within ``timeout`` seconds (None: wait forever)."""
+        deadline = None if timeout is None else time.time() + timeout
+        while True:
+            remaining = None if deadline is None else max(0.0, deadline - time.time())
+            try:
+                ready = select.select([self.fd], [], [], remaining)[0]
+            except select.error as e:
+                if e.args[0] == errno.EINTR:
+                    continue
+                raise
+            if not ready:
+                return False
+
+            if self.__changed(os.read(self.fd, 64 * 1024)):
+                return True
+
+    def __changed(self, data):
+        offset = 0
+        changed = False
+        while offset + _EVENT_HEADER.size <= len(data):
+            wd, mask, cookie, length = _EVENT_HEADER.unpack_from(data, offset)
+            offset += _EVENT_HEADER.size
+            name = data[offset:offset + length].rstrip('\0')
+            offset += length
+            if name == self.name or mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+                changed = True
+        return changed
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+#//end class _Inotify
+
+
+class _Poller(object):
+    """Polls the file's size / mtime / inode every ``interval`` seconds."""
+
+    def __init__(self, path, interval = 0.25):
+        self.path = path
+        self.interval = interval
+        self.last = self.__signature()
+
+    def __signature(self):
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        return (st.st_mtime, st.st_size, st.st_ino)
+
+    def wait(self, timeout):
+        deadline = None if timeout is None else time.time() + timeout
+        while True:
+            signature = self.__signature()
+            if signature != self.last:
+                self.last = signature
+                return True
+
+            if deadline is not None and time.time() >= deadline:
+                return False
+            time.sleep(self.interval if deadline is None
+                       else max(0.0, min(self.interval, deadline - time.time())))
+
+    def close(self):
+        pass
+
+#//end class _Poller
+
+
+class FileWatcher(object):
+    """
+    Yields (from ``changes()``) each time ``path`` was changed and then left
+    alone for ``debounce`` seconds.  ``poll`` forces polling instead of inotify.
+    """
+
+    def __init__(self, path, debounce = 0.1, poll = False, interval = 0.25):
+        self.path = path
+        self.debounce = debounce
+
+        self.backend = None
+        if not poll:
+            try:
+                self.backend = _Inotify(path)
+            except OSError as e:
+                debug("  .. inotify unavailable (%s) - polling instead" % e)
+        if self.backend is None:
+            self.backend = _Poller(path, interval)
+
+    def changes(self):
+        while True:
+            self.backend.wait(None)
+            # let a burst of writes settle
+            while self.backend.wait(self.debounce):
+                pass
+            yield self.path
+
+    def close(self):
+        self.backend.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+#//end class FileWatcher
+
+
+def _read(path):
+    try:
+        with open(path, 'rb') as F:
+            return F.read()
+    except IOError as e:
+        if e.errno == errno.ENOENT:
+            # in between an editor's delete and rename
+            return None
+        raise
+
+
+def watch_theme(session, path, debounce = 0.1, poll = False, report = None):
+    """
+    Push ``path`` to the blog of ``session`` (a TumblrLogin) on every change,
+    until interrupted.  ``report(result, seconds, error)`` is called after
+    each push; unchanged content is not pushed at all.
+    """
+    session.warm_up()
+
+    # the version that is live already doesn't need pushing
+    current = session.themeStore.current()
+    lastHash = current.hash if current else None
+
+    with FileWatcher(path, debounce, poll) as watcher:
+        for changed in watcher.changes():
+            html = _read(path)
+            if html is None:
+                continue
+
+            newHash = theme_hash(html)
+            if newHash == lastHash:
+                debug("Theme file unchanged - not pushing")
+                continue
+
+            started = time.time()
+            try:
+                result = session.save_theme_html(html)
+                error = None if result else 'Theme save failed'
+            except Exception as e:
+                result, error = None, e
+
+            if not error:
+                lastHash = newHash
+            if report is not None:
+                report(result, time.time() - started, error)
@@ -0,0 +1,180 @@
+# -*- coding: utf-8 -*-
+"""
+!    workers.py
+!  --------------------------------------------------------------------------
+!
+!    A small fixed-size pool of worker threads, handing back Future objects,
+!    so that many blocking requests can be in flight at the same time while
+!    the number of them stays bounded.
+!
+!    Except where otherwise noted, the code in tumblrpype is
+!        Copyright (c) 2012  Felix Bonkoski <felix@post-theory.com>
+!        Licensed under the MIT license:
+!            <http://www.opensource.org/licenses/mit-license.php>
+!
+"""
+
+import Queue
+import sys
+import threading
+
+__all__ = ['Future', 'WorkerPool', 'gather']
+
+#-------------------------------------------------------------------------------
+
+class Future(object):
+    """The eventual result of a call submitted to a ``WorkerPool``."""
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._result = None
+        self._excInfo = None
+        self._callbacks = []
+        self._lock = threading.Lock()
+
+    def done(self):
+        return self._event.is_set()
+
+    def _finish(self, result = None, excInfo = None):
+        with self._lock:
+            self._result = result
+            self._excInfo = excInfo
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+
+        for fn in callbacks:
+            fn(self)
+
+    def set_result(self, result):
+        self._finish(result = result)
+
+    def set_exception(self, excInfo):
+        self._finish(excInfo = excInfo)
+
+    def add_done_callback(self, fn):
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(fn)
+                return
+        fn(self)
+
+    def exception(self, timeout = None):
+        if not self._event.wait(timeout):
+            raise RuntimeError('Future not done after %s seconds' % timeout)
+        return self._excInfo[1] if self._excInfo else None
+
+    def result(self, timeout = None):
+        """Wait for the call to finish, and return its result (or re-raise its exception)."""
+        if not self._event.wait(timeout):
+            raise RuntimeError('Future not done after %s seconds' % timeout)
+
+        if self._excInfo:
+            raise self._excInfo[0], self._excInfo[1], self._excInfo[2]
+
+        return self._result
+
+#//end class Future
+
+
+class WorkerPool(object):
+    """
+    Runs submitted calls on at most ``maxworkers`` threads at a time.
+    Threads are started as work comes in.
+    """
+
+    def __init__(self, maxworkers = 8, name = 'tumblrpype'):
+        if maxworkers < 1:
+            raise ValueError('maxworkers must be at least 1')
+
+        self.maxworkers = maxworkers
+        self.name = name
+
+        self._queue = Queue.Queue()
+        self._threads = []
+        self._idle = 0
+        self._lock = threading.Lock()
+        self._shutdown = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
+
+    def _work(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+
+            future, fn, args, kwargs = item
+            with self._lock:
+                self._idle -= 1
+
+            try:
+                future.set_result(fn(*args, **kwargs))
+            except BaseException:
+                future.set_exception(sys.exc_info())
+
+            with self._lock:
+                self._idle += 1
+
+    def submit(self, fn, *args, **kwargs):
+        """Schedule ``fn(*args, **kwargs)``, and return its ``Future``."""
+
+        future = Future()
+
+        with self._lock:
+            if self._shutdown:
+                raise RuntimeError('Cannot submit to a WorkerPool that was shut down')
+
+            # start another thread, unless idle ones can take the new call
+            waiting = self._queue.qsize()
+            if waiting >= self._idle and len(self._threads) < self.maxworkers:
+                t = threading.Thread(target = self._work,
+                                     name = '%s-worker-%d' % (self.name, len(self._threads)))
+                t.daemon = True
+                self._threads.append(t)
+                self._idle += 1
+                t.start()
+
+            self._queue.put((future, fn, args, kwargs))
+
+        return future
+
+    def map(self, fn, iterable):
+        """Submit ``fn(item)`` for every item, and return the list of futures."""
+        return [self.submit(fn, item) for item in iterable]
+
+    def shutdown(self, wait = True):
+        with self._lock:
+            if self._shutdown:
+                return
+            self._shutdown = True
+            threads = list(self._threads)
+
+        for t in threads:
+            self._queue.put(None)
+
+        if wait:
+            for t in threads:
+                t.join()
+
+#//end class WorkerPool
+
+
+def gather(futures, return_exceptions = False):
+    """
+    Wait for every future, and return their results in order.  The first
+    exception is re-raised, unless ``return_exceptions`` is set - in which
+    case exceptions are returned in place of the results.
+    """
+    results = []
+    for future in futures:
+        if return_exceptions:
+            exc = future.exception()
+            results.append(exc if exc is not None else future.result())
+        else:
+            results.append(future.result())
+
+    return results